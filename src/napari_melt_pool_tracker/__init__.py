@@ -2,12 +2,31 @@ try:
     from ._version import version as __version__
 except ImportError:
     __version__ = "unknown"
-from ._reader import napari_get_reader
-from ._sample_data import make_sample_data
-from ._widget import MeltPoolTrackerQWidget
+
+# The public objects are imported on first access, so that importing
+# the package, e.g. for `_utils` in a headless worker, does not load
+# napari and Qt.
+_LAZY_IMPORTS = {
+    "napari_get_reader": "._reader",
+    "make_sample_data": "._sample_data",
+    "MeltPoolTrackerQWidget": "._widget",
+}
 
 __all__ = (
     "napari_get_reader",
     "make_sample_data",
     "MeltPoolTrackerQWidget",
 )
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        import importlib
+
+        module = importlib.import_module(_LAZY_IMPORTS[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
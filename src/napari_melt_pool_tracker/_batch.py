@@ -0,0 +1,455 @@
+"""
+Batch processing of h5 files with the steps of the melt pool tracker.
+
+The progress of a batch is recorded in the output directory. The
+manifest (manifest.json) lists the input files and the parameters.
+Every input file has its own directory with the outputs of the steps
+and a state file recording which steps are complete, together with
+hashes of their inputs, parameters and outputs.
+
+An interrupted batch can be restarted with the same command and only
+the missing steps are computed. A batch can be split into shards that
+run on different machines sharing the output directory. Every shard
+processes its own slice of the manifest, so no further coordination
+is needed.
+
+Usage::
+
+    python -m napari_melt_pool_tracker._batch create OUT a.h5 b.h5
+    python -m napari_melt_pool_tracker._batch run OUT --shard 0 --shards 2
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+
+import numpy as np
+
+from napari_melt_pool_tracker import __version__, _reader, _utils
+
+MANIFEST_NAME = "manifest.json"
+STATE_NAME = "state.json"
+
+DEFAULT_PARAMETERS = {
+    # Correct the frames with the flat and dark fields of the file
+    "flat_field": False,
+    # Laser speed and position. If coef and intercept are None,
+    # they are determined with `determine_laser_speed_and_position`.
+    "mode": "Default",
+    "coef": None,
+    "intercept": None,
+    # Reslicing
+    "window_offset": 30,
+    "window_size": 130,
+    # Drop the frames where the window lies outside the image
+    "compact": False,
+    # Sub pixel shift of the windows, None, "linear" or "cubic"
+    "interpolation": None,
+    # Filtering
+    "kernel_size": [7, 3, 3],
+    # Radial gradient. If xpos is None, the laser position in the
+    # resliced stack (window_offset) is used.
+    "xpos": None,
+    "dtype": "float32",
+    # Does not change the results and is not part of the hashes
+    "backend": "auto",
+}
+
+# Parameters that determine the result of each step
+STEP_PARAMETERS = {
+    "laser": ("flat_field", "mode", "coef", "intercept"),
+    "reslice": ("window_offset", "window_size", "compact", "interpolation"),
+    "filter": ("kernel_size",),
+    "radial_gradient": ("xpos", "dtype"),
+}
+
+
+def _laser_step(outputs, parameters):
+    coef = parameters["coef"]
+    intercept = parameters["intercept"]
+    if coef is None or intercept is None:
+        _, coef, intercept = _utils.determine_laser_speed_and_position(
+            outputs["stack"], parameters["mode"]
+        )
+    return {"laser.json": {"coef": coef, "intercept": intercept}}
+
+
+def _reslice_step(outputs, parameters):
+    stack = outputs["stack"]
+    laser = outputs["laser.json"]
+    window_offset = parameters["window_offset"]
+    window_size = min(
+        parameters["window_size"], stack.shape[2] - window_offset
+    )
+    resliced, positions = _utils.reslice_with_moving_window(
+        stack,
+        laser["coef"],
+        laser["intercept"],
+        window_offset=window_offset,
+        window_size=window_size,
+        backend=parameters["backend"],
+        compact=parameters["compact"],
+        interpolation=parameters["interpolation"],
+    )
+    return {"resliced.npy": resliced, "positions.csv": positions}
+
+
+def _filter_step(outputs, parameters):
+    filtered = _utils.median_filter(
+        outputs["resliced.npy"],
+        tuple(parameters["kernel_size"]),
+        backend=parameters["backend"],
+    )
+    return {"filtered.npy": filtered}
+
+
+def _radial_gradient_step(outputs, parameters):
+    filtered = outputs["filtered.npy"]
+    xpos = parameters["xpos"]
+    if xpos is None:
+        xpos = min(parameters["window_offset"], filtered.shape[2] - 1)
+    radial_gradient = _utils.calculate_radial_gradient(
+        filtered,
+        xpos=xpos,
+        backend=parameters["backend"],
+        dtype=np.dtype(parameters["dtype"]),
+    )
+    return {"radial_gradient.npy": radial_gradient}
+
+
+STEPS = {
+    "laser": _laser_step,
+    "reslice": _reslice_step,
+    "filter": _filter_step,
+    "radial_gradient": _radial_gradient_step,
+}
+
+
+def hash_file(path, block_size=2**20):
+    """
+    Calculates the sha256 hash of a file without loading it
+    into memory at once.
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _file_record(path):
+    stat = os.stat(path)
+    return {
+        "hash": hash_file(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def _matches_record(path, record):
+    """
+    Checks that the file still has the recorded content. The hash
+    is only recalculated if the size or modification time changed.
+    """
+    if record is None or not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    if (stat.st_size, stat.st_mtime_ns) == (
+        record["size"],
+        record["mtime_ns"],
+    ):
+        return True
+    return stat.st_size == record["size"] and hash_file(path) == record["hash"]
+
+
+def hash_parameters(*items):
+    """
+    Calculates the sha256 hash of json serializable items.
+    """
+    encoded = json.dumps(items, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _write_atomic(path, write):
+    """
+    Writes a file using `write(tmp_path)` and moves it into place,
+    so that an interruption never leaves a partial file behind.
+    """
+    path = pathlib.Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_json(path, content):
+    _write_atomic(
+        path,
+        lambda tmp: pathlib.Path(tmp).write_text(
+            json.dumps(content, indent=2, sort_keys=True)
+        ),
+    )
+
+
+def _save_output(path, value):
+    if path.suffix == ".npy":
+
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                np.save(f, np.asarray(value))
+
+    elif path.suffix == ".csv":
+
+        def write(tmp):
+            value.to_csv(tmp, index=False)
+
+    else:
+
+        def write(tmp):
+            pathlib.Path(tmp).write_text(json.dumps(value))
+
+    _write_atomic(path, write)
+
+
+def _load_output(path):
+    if path.suffix == ".npy":
+        return np.load(path, mmap_mode="r")
+    if path.suffix == ".csv":
+        import pandas as pd
+
+        return pd.read_csv(path)
+    return json.loads(path.read_text())
+
+
+def _entry_id(path):
+    path = pathlib.Path(path).resolve()
+    return f"{path.stem}_{hashlib.sha256(str(path).encode()).hexdigest()[:8]}"
+
+
+def create_manifest(output_dir, paths, parameters=None):
+    """
+    Creates the manifest of a batch in `output_dir`.
+
+    If a manifest already exists, it is kept when it lists the same
+    files with the same parameters. Otherwise a ValueError is raised to
+    avoid mixing results of different batches.
+
+    Parameters
+    ----------
+    output_dir : str or pathlib.Path
+        Directory for the manifest and the results.
+    paths : list of str
+        The h5 files to process.
+    parameters : dict
+        Parameters overwriting `DEFAULT_PARAMETERS`.
+
+    Returns
+    -------
+    manifest : dict
+        The content of the manifest.
+    """
+    parameters = {**DEFAULT_PARAMETERS, **(parameters or {})}
+    unknown = set(parameters) - set(DEFAULT_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown parameters {sorted(unknown)}.")
+    manifest = {
+        "parameters": parameters,
+        "entries": [
+            {"id": _entry_id(path), "path": str(pathlib.Path(path).resolve())}
+            for path in paths
+        ],
+    }
+    output_dir = pathlib.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+    if manifest_path.exists():
+        existing = load_manifest(output_dir)
+        if existing != manifest:
+            raise ValueError(
+                f"{manifest_path} already exists with different files or parameters."
+            )
+        return existing
+    _write_json(manifest_path, manifest)
+    return manifest
+
+
+def load_manifest(output_dir):
+    """
+    Reads the manifest of the batch in `output_dir`.
+    """
+    manifest_path = pathlib.Path(output_dir) / MANIFEST_NAME
+    return json.loads(manifest_path.read_text())
+
+
+def _is_complete(entry_dir, step_state, key):
+    if step_state is None or step_state["key"] != key:
+        return False
+    return all(
+        _matches_record(entry_dir / name, record)
+        for name, record in step_state["outputs"].items()
+    )
+
+
+def process_entry(output_dir, entry, parameters, executor=None):
+    """
+    Runs the missing steps for one entry of the manifest. The stack is
+    read with `executor`, e.g. a `_worker.WorkerClient`, if given.
+
+    Returns
+    -------
+    computed : list of str
+        The names of the steps that were computed.
+    """
+    entry_dir = pathlib.Path(output_dir) / entry["id"]
+    entry_dir.mkdir(exist_ok=True)
+    state_path = entry_dir / STATE_NAME
+    state = {"input": None, "steps": {}}
+    if state_path.exists():
+        state = json.loads(state_path.read_text())
+    if not _matches_record(entry["path"], state["input"]):
+        state["input"] = _file_record(entry["path"])
+
+    key = hash_parameters(state["input"]["hash"], __version__)
+    outputs = _LazyOutputs(
+        entry_dir, entry["path"], parameters["flat_field"], executor
+    )
+    computed = []
+    for step, func in STEPS.items():
+        step_parameters = {
+            name: parameters[name] for name in STEP_PARAMETERS[step]
+        }
+        key = hash_parameters(key, step, step_parameters)
+        if _is_complete(entry_dir, state["steps"].get(step), key):
+            continue
+        results = func(outputs, parameters)
+        for name, value in results.items():
+            _save_output(entry_dir / name, value)
+            outputs.values[name] = value
+        state["steps"][step] = {
+            "key": key,
+            "parameters": step_parameters,
+            "outputs": {
+                name: _file_record(entry_dir / name) for name in results
+            },
+        }
+        _write_json(state_path, state)
+        computed.append(step)
+    return computed
+
+
+class _LazyOutputs:
+    """
+    Gives access to the input stack and the outputs of previous
+    steps. They are only read from disk when a step needs them.
+    """
+
+    def __init__(self, entry_dir, path, flat_field=False, executor=None):
+        self.entry_dir = entry_dir
+        self.path = path
+        self.flat_field = flat_field
+        self.executor = executor
+        self.values = {}
+
+    def __getitem__(self, name):
+        if name not in self.values:
+            if name == "stack" and self.executor is not None:
+                # Same read options as the layers of the napari readers
+                read_kwargs = {"flat_field": True} if self.flat_field else {}
+                self.values[name] = self.executor.read_stack(
+                    self.path, **read_kwargs
+                )
+            elif name == "stack" and self.flat_field:
+                # Corrected chunk by chunk without a copy of the raw data
+                self.values[name] = _reader.read_stack(
+                    self.path, flat_field=True
+                )
+            elif name == "stack":
+                self.values[name] = _reader.reader_function(self.path)[0][0]
+            else:
+                self.values[name] = _load_output(self.entry_dir / name)
+        return self.values[name]
+
+
+def run_batch(output_dir, shard_index=0, shard_count=1, executor=None):
+    """
+    Processes the entries of the manifest in `output_dir` that belong
+    to the shard. Steps that are already complete are skipped.
+
+    Parameters
+    ----------
+    output_dir : str or pathlib.Path
+        Directory containing the manifest.
+    shard_index : int
+        Index of the shard processed by this call.
+    shard_count : int
+        Total number of shards. Shard `i` processes the entries
+        `i`, `i + shard_count`, `i + 2 * shard_count`, ...
+    executor : _worker.WorkerClient or _worker.LocalExecutor
+        Reads the stacks, see `process_entry`.
+
+    Returns
+    -------
+    computed : dict
+        The steps computed for each entry id of the shard.
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(
+            f"The shard index has to be in [0, {shard_count}). You specified {shard_index}."
+        )
+    manifest = load_manifest(output_dir)
+    entries = manifest["entries"][shard_index::shard_count]
+    # Manifests of older versions lack newer parameters
+    parameters = {**DEFAULT_PARAMETERS, **manifest["parameters"]}
+    return {
+        entry["id"]: process_entry(output_dir, entry, parameters, executor)
+        for entry in entries
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Resumable batch processing of h5 files."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    create_parser = subparsers.add_parser(
+        "create", help="Create the manifest of a batch."
+    )
+    create_parser.add_argument("output_dir")
+    create_parser.add_argument("paths", nargs="+")
+    create_parser.add_argument(
+        "--parameters", help="json file with parameters."
+    )
+    run_parser = subparsers.add_parser("run", help="Run (a shard of) a batch.")
+    run_parser.add_argument("output_dir")
+    run_parser.add_argument("--shard", type=int, default=0)
+    run_parser.add_argument("--shards", type=int, default=1)
+    run_parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="Read the stacks with the running local worker, if any.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "create":
+        parameters = None
+        if args.parameters is not None:
+            parameters = json.loads(pathlib.Path(args.parameters).read_text())
+        manifest = create_manifest(args.output_dir, args.paths, parameters)
+        print(f"Manifest with {len(manifest['entries'])} files.")
+    else:
+        executor = None
+        if args.worker:
+            # Imported here as the worker runs the steps of this module
+            from napari_melt_pool_tracker import _worker
+
+            executor = _worker.get_executor()
+        computed = run_batch(
+            args.output_dir, args.shard, args.shards, executor
+        )
+        for entry_id, steps in computed.items():
+            print(f"{entry_id}: {', '.join(steps) if steps else 'up to date'}")
+
+
+if __name__ == "__main__":
+    main()
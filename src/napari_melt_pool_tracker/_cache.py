@@ -0,0 +1,205 @@
+"""
+Persistent cache of the results of the steps.
+
+Results are stored in chunked h5 files, one file per step result, in a
+cache directory that survives napari sessions. The file name is a hash
+of the source file identity, the parameters of the step and of all
+steps before it, and the version of the package. Keys are chained: the
+key of a step is derived from the key of its input, which the widget
+stores in the metadata of the layers.
+
+The cache has a size limit. When it is exceeded, the least recently
+used results are deleted. Every read updates the modification time of
+the file, which is used as time of last use.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+
+import h5py
+import numpy as np
+
+from napari_melt_pool_tracker import __version__, _utils
+
+CACHE_ENV = "NAPARI_MELT_POOL_TRACKER_CACHE"
+DEFAULT_MAX_BYTES = 10 * 2**30
+
+
+def default_directory():
+    """
+    Cache directory set by the NAPARI_MELT_POOL_TRACKER_CACHE
+    environment variable, or in the user's cache directory.
+    """
+    if CACHE_ENV in os.environ:
+        return pathlib.Path(os.environ[CACHE_ENV])
+    cache_home = os.environ.get(
+        "XDG_CACHE_HOME", pathlib.Path.home() / ".cache"
+    )
+    return pathlib.Path(cache_home) / "napari-melt-pool-tracker"
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def make_key(*items):
+    """
+    Hash of json serializable items and the version of the package.
+    NumPy scalars are converted to Python numbers and other objects,
+    e.g. dtypes, to strings.
+    """
+    encoded = json.dumps(
+        [__version__, *items], sort_keys=True, default=_json_default
+    ).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def source_key(path, **options):
+    """
+    Key identifying the data read from a file. The file is identified
+    by its absolute path, size and modification time, so a modified
+    file gets a new key without hashing its content.
+
+    Parameters
+    ----------
+    path : str
+        Path to the file.
+    **options
+        Options used to read the file, e.g. the subset.
+    """
+    path = pathlib.Path(path).resolve()
+    stat = path.stat()
+    return make_key(str(path), stat.st_size, stat.st_mtime_ns, options)
+
+
+class StepCache:
+    """
+    Content addressed on-disk cache of step results.
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+        Directory of the cache. Defaults to `default_directory()`.
+    max_bytes : int
+        Size limit of the cache. The least recently used results are
+        deleted when the limit is exceeded.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        if directory is None:
+            directory = default_directory()
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return self.directory / f"{key}.h5"
+
+    def get(self, key):
+        """
+        Returns the results stored under `key` or None if they are
+        not in the cache.
+        """
+        path = self._path(key)
+        try:
+            with h5py.File(path, "r") as f:
+                results = {name: _read_item(f[name]) for name in f}
+                results.update(f.attrs)
+            # Mark as recently used
+            os.utime(path)
+        except (OSError, KeyError):
+            return None
+        return results
+
+    def put(self, key, results):
+        """
+        Stores the results of a step under `key` and evicts the least
+        recently used results if the cache is too large.
+
+        Parameters
+        ----------
+        key : str
+            Key from `make_key`.
+        results : dict
+            Arrays (NumPy or dask), data frames and scalars by name.
+        """
+        import pandas as pd
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with h5py.File(tmp_path, "w") as f:
+            for name, value in results.items():
+                if isinstance(value, pd.DataFrame):
+                    _write_data_frame(f, name, value)
+                elif np.ndim(value) == 0:
+                    f.attrs[name] = value
+                else:
+                    _write_array(f, name, value)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """
+        Deletes the least recently used results until the cache is
+        smaller than `max_bytes`. The file `keep` is never deleted.
+        """
+        entries = []
+        for path in self.directory.glob("*.h5"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        """
+        Deletes all results.
+        """
+        for path in self.directory.glob("*.h5"):
+            path.unlink(missing_ok=True)
+
+
+def _write_array(f, name, value):
+    # One chunk per frame, the unit in which napari displays a stack
+    chunks = True
+    if value.ndim == 3 and value.size > 0:
+        chunks = (1,) + value.shape[1:]
+    elif value.size == 0:
+        chunks = None
+    dataset = f.create_dataset(
+        name, shape=value.shape, dtype=value.dtype, chunks=chunks
+    )
+    if _utils.is_dask_array(value):
+        value.store(dataset, lock=True)
+    else:
+        dataset[...] = value
+
+
+def _write_data_frame(f, name, data_frame):
+    group = f.create_group(name)
+    group.attrs["columns"] = list(data_frame.columns)
+    for i, column in enumerate(data_frame.columns):
+        group.create_dataset(str(i), data=data_frame[column].to_numpy())
+
+
+def _read_item(item):
+    if isinstance(item, h5py.Group):
+        import pandas as pd
+
+        columns = item.attrs["columns"]
+        return pd.DataFrame(
+            {column: item[str(i)][()] for i, column in enumerate(columns)}
+        )
+    return item[()]
@@ -0,0 +1,210 @@
+"""
+Running steps of the pipeline on several stacks concurrently.
+
+A job runs some of the steps of `_batch.STEPS` on one stack in memory,
+with the same parameters as a batch. The jobs share a `JobPool` of
+worker threads that limits how many of them run at the same time and
+counts the completed steps of all jobs, so the progress of the jobs can
+be reported together. NumPy and SciPy release the GIL, so the jobs run
+in parallel without copying the stacks to other processes. Jobs on
+stacks read from h5 files can instead run in a persistent `_worker`
+process, which keeps their results for later sessions.
+"""
+
+import concurrent.futures
+import os
+import threading
+
+from napari_melt_pool_tracker import _batch, _stats, _utils
+
+# Default number of jobs running at the same time
+DEFAULT_MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def run_steps(outputs, parameters=None, steps=None, progress=None, stats=()):
+    """
+    Runs steps of `_batch.STEPS` in memory.
+
+    Parameters
+    ----------
+    outputs : dict
+        Inputs of the first step by name, e.g. {"stack": stack} for the
+        whole pipeline or {"resliced.npy": resliced} for the filter.
+    parameters : dict
+        Parameters overwriting `_batch.DEFAULT_PARAMETERS`.
+    steps : list of str
+        Names of the steps in the order they are run. Defaults to all
+        steps.
+    progress : callable
+        Called without arguments after every step.
+    stats : list of str
+        Names of outputs whose `_stats.RunningStats.summary` is added
+        to the outputs as "{name}_stats" right after the step producing
+        them, e.g. for the contrast limits of layers.
+
+    Returns
+    -------
+    outputs : dict
+        The inputs and the outputs of all steps by name.
+    """
+    parameters = {**_batch.DEFAULT_PARAMETERS, **(parameters or {})}
+    if steps is None:
+        steps = list(_batch.STEPS)
+    outputs = dict(outputs)
+    for step in steps:
+        new_outputs = _batch.STEPS[step](outputs, parameters)
+        outputs.update(new_outputs)
+        for name in set(stats) & set(new_outputs):
+            outputs[f"{name}_stats"] = _stats.image_stats(
+                new_outputs[name]
+            ).summary()
+        if progress is not None:
+            progress()
+    return outputs
+
+
+class JobPool:
+    """
+    Pool of worker threads shared by the jobs started together.
+
+    The kernels of the numba backend are parallel themselves and
+    numba's threading layers are not all safe to use from several
+    threads at the same time, so with the numba backend the jobs run
+    one after the other in a single dedicated thread. They still do
+    not block the calling thread, e.g. the GUI.
+
+    Parameters
+    ----------
+    max_workers : int
+        Maximum number of jobs running at the same time. Changes take
+        effect when the pool is idle.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_workers = None
+        self._numba_executor = None
+        self._lock = threading.Lock()
+        self._futures = []
+        self._done = 0
+        self._total = 0
+
+    @property
+    def busy(self):
+        """
+        Whether any job is still running or waiting.
+        """
+        return not all(future.done() for future in self._futures)
+
+    @property
+    def progress(self):
+        """
+        Number of completed and total steps of the jobs submitted
+        since `submit_all` was last called on the idle pool.
+        """
+        with self._lock:
+            return self._done, self._total
+
+    def submit(
+        self, outputs, parameters=None, steps=None, stats=(), source=None
+    ):
+        """
+        Runs `run_steps` in a worker thread.
+
+        Parameters
+        ----------
+        outputs, parameters, steps, stats
+            See `run_steps`.
+        source : tuple
+            A `_worker.WorkerClient`, the path of the h5 file and the
+            keyword arguments of `_reader.read_stack` the stack in
+            `outputs` was read with. If given, the steps run in the
+            process of the worker, which keeps the stack and the
+            outputs for later jobs, and the worker thread only waits
+            for them, also with the numba backend.
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Future of the outputs of `run_steps`.
+        """
+        parameters = {**_batch.DEFAULT_PARAMETERS, **(parameters or {})}
+        if steps is None:
+            steps = list(_batch.STEPS)
+        with self._lock:
+            self._total += len(steps)
+        if source is not None:
+            future = self._get_executor().submit(
+                self._run_in_worker, source, parameters, steps, stats
+            )
+        elif _utils.resolve_backend(parameters["backend"]) == "numba":
+            if self._numba_executor is None:
+                self._numba_executor = concurrent.futures.ThreadPoolExecutor(
+                    1, thread_name_prefix="melt-pool-numba-job"
+                )
+            future = self._numba_executor.submit(
+                run_steps, outputs, parameters, steps, self._advance, stats
+            )
+        else:
+            future = self._get_executor().submit(
+                run_steps, outputs, parameters, steps, self._advance, stats
+            )
+        self._futures.append(future)
+        return future
+
+    def submit_all(self, jobs):
+        """
+        Submits several jobs. If the pool is idle, the progress starts
+        again from zero.
+
+        Parameters
+        ----------
+        jobs : list of tuple
+            The `outputs`, `parameters`, `steps` and optionally `stats`
+            and `source` of every job, see `submit`.
+
+        Returns
+        -------
+        futures : list of concurrent.futures.Future
+            The futures of the jobs in the given order.
+        """
+        if not self.busy:
+            self._futures = []
+            with self._lock:
+                self._done = self._total = 0
+        return [self.submit(*job) for job in jobs]
+
+    def _run_in_worker(self, source, parameters, steps, stats):
+        client, path, read_kwargs = source
+        outputs = client.run_steps(path, read_kwargs, parameters, steps, stats)
+        with self._lock:
+            self._done += len(steps)
+        return outputs
+
+    def _advance(self):
+        with self._lock:
+            self._done += 1
+
+    def _get_executor(self):
+        if self._executor is None or (
+            self._executor_workers != self.max_workers and not self.busy
+        ):
+            if self._executor is not None:
+                self._executor.shutdown()
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                self.max_workers, thread_name_prefix="melt-pool-job"
+            )
+            self._executor_workers = self.max_workers
+        return self._executor
+
+    def shutdown(self, wait=True):
+        """
+        Stops the worker threads after the running jobs.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        if self._numba_executor is not None:
+            self._numba_executor.shutdown(wait=wait)
+            self._numba_executor = None
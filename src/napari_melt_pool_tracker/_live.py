@@ -0,0 +1,193 @@
+"""
+Live processing of an acquisition while the h5 file is being written.
+
+`H5Follower` reads the frames appended to the dataset of a growing h5
+file. It supports writers using the HDF5 single writer multiple reader
+(SWMR) mode as well as writers that open and close the file for every
+append. `LiveProcessor` reslices, filters and calculates the radial
+gradient of the new frames only, so the work per frame does not grow
+with the length of the acquisition. `GrowingStack` collects the results
+for display in napari.
+"""
+
+import h5py
+import numpy as np
+
+from napari_melt_pool_tracker import _reader, _utils
+
+
+class H5Follower:
+    """
+    Reads the frames that were appended to an h5 file since the
+    last read.
+
+    Parameters
+    ----------
+    path : str
+        Path to the h5 file that is being written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.n_read = 0
+
+    def read_new_frames(self, max_frames=None):
+        """
+        Returns the frames appended since the last call, at most
+        `max_frames` of them. The result can have zero frames.
+        """
+        with h5py.File(self.path, "r", swmr=True) as f:
+            dataset = _reader.get_dataset(f)
+            stop = dataset.shape[0]
+            if max_frames is not None:
+                stop = min(stop, self.n_read + max_frames)
+            frames = dataset[self.n_read : stop]
+        self.n_read = stop
+        return frames
+
+
+class LiveProcessor:
+    """
+    Processes an acquisition chunk by chunk with the same steps as
+    the widget. The median filter delays the filtered frames by the
+    temporal halo of its kernel. The remaining frames are returned
+    by `finish` at the end of the acquisition.
+
+    Parameters
+    ----------
+    coef, intercept, window_offset, window_size
+        See `_utils.reslice_with_moving_window`.
+    kernel_size : (int, int, int)
+        Size of the median filter along t, y and x.
+    xpos : int
+        Horizontal position in the resliced stack used as origin of
+        the radial gradient. Defaults to `window_offset`.
+    threshold : float
+        Threshold for `_utils.estimate_material_surface`. If None,
+        Otsu's threshold of the first filtered frames is used for
+        the rest of the acquisition.
+    backend : str
+        "numpy", "numba" or "auto", see `_utils.resolve_backend`.
+    dtype : np.dtype
+        Floating point type of the radial gradient.
+    """
+
+    def __init__(
+        self,
+        coef,
+        intercept,
+        window_offset,
+        window_size,
+        kernel_size,
+        xpos=None,
+        threshold=None,
+        backend="numpy",
+        dtype=_utils.DEFAULT_DTYPE,
+    ):
+        self.coef = coef
+        self.intercept = intercept
+        self.window_offset = window_offset
+        self.window_size = window_size
+        self.xpos = window_offset if xpos is None else xpos
+        self.threshold = threshold
+        self.backend = backend
+        self.dtype = dtype
+        self.median_filter = _utils.StreamingMedianFilter(kernel_size, backend)
+        self.n_frames = 0
+
+    def process(self, frames):
+        """
+        Processes newly acquired frames.
+
+        Returns
+        -------
+        results : dict
+            The new frames of the "resliced", "filtered" and
+            "radial_gradient" stacks and the "positions" of the
+            resliced frames.
+        """
+        resliced, positions = _utils.reslice_with_moving_window(
+            frames,
+            self.coef,
+            self.intercept,
+            window_offset=self.window_offset,
+            window_size=self.window_size,
+            backend=self.backend,
+            first_frame=self.n_frames,
+        )
+        self.n_frames += len(frames)
+        filtered = self.median_filter.push(resliced)
+        return {
+            "resliced": resliced,
+            "positions": positions,
+            "filtered": filtered,
+            "radial_gradient": self._radial_gradient(filtered),
+        }
+
+    def finish(self):
+        """
+        Returns the last "filtered" and "radial_gradient" frames
+        at the end of the acquisition.
+        """
+        filtered = self.median_filter.flush()
+        if filtered is None:
+            return {}
+        return {
+            "filtered": filtered,
+            "radial_gradient": self._radial_gradient(filtered),
+        }
+
+    def _radial_gradient(self, filtered):
+        if len(filtered) == 0:
+            return np.zeros(filtered.shape, dtype=self.dtype)
+        if self.threshold is None:
+            import skimage.filters
+
+            self.threshold = skimage.filters.threshold_otsu(filtered)
+        return _utils.calculate_radial_gradient(
+            filtered,
+            xpos=self.xpos,
+            material_surface=_utils.estimate_material_surface(
+                filtered, self.threshold
+            ),
+            backend=self.backend,
+            dtype=self.dtype,
+        )
+
+
+class GrowingStack:
+    """
+    Stack of frames that grows along the first axis. The capacity is
+    doubled whenever it is exhausted, so appending a frame costs
+    constant time on average instead of copying all previous frames.
+    """
+
+    def __init__(self):
+        self._buffer = None
+        self.n_frames = 0
+
+    def append(self, frames):
+        if len(frames) == 0:
+            return
+        if self._buffer is None:
+            self._buffer = np.empty(
+                (2 * len(frames),) + frames.shape[1:], dtype=frames.dtype
+            )
+        elif self.n_frames + len(frames) > len(self._buffer):
+            capacity = max(2 * len(self._buffer), self.n_frames + len(frames))
+            buffer = np.empty(
+                (capacity,) + self._buffer.shape[1:], dtype=self._buffer.dtype
+            )
+            buffer[: self.n_frames] = self._buffer[: self.n_frames]
+            self._buffer = buffer
+        self._buffer[self.n_frames : self.n_frames + len(frames)] = frames
+        self.n_frames += len(frames)
+
+    @property
+    def data(self):
+        """
+        View of the frames appended so far.
+        """
+        if self._buffer is None:
+            return None
+        return self._buffer[: self.n_frames]
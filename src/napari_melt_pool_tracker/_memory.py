@@ -0,0 +1,282 @@
+"""
+Peak memory estimates of the steps and the choice of how to run them.
+
+The estimates are calculated from the shape and dtype of the input and
+the parameters of a step without running it. They count the arrays a
+step allocates in addition to its input, e.g. the copy made by the
+median filter or the floating point volumes of the radial gradient.
+The numbers per voxel were measured with tracemalloc.
+
+`MemoryEstimate.plan` compares the estimate with a memory budget and
+chooses one of three strategies:
+
+"in memory"
+    The step runs on the full stack at once.
+"chunked"
+    The result is allocated for the full stack, but the step runs on
+    chunks of frames, so its temporary arrays only exist for one chunk.
+"out of core"
+    Not even the result fits into the budget. The step returns a lazy
+    dask array that is computed chunk by chunk when it is displayed.
+    This needs dask. Without dask the step runs in chunks.
+"""
+
+import importlib.util
+import os
+
+import numpy as np
+
+from napari_melt_pool_tracker import _utils
+
+IN_MEMORY = "in memory"
+CHUNKED = "chunked"
+OUT_OF_CORE = "out of core"
+
+# Part of the physical memory used by the steps if no budget is given
+DEFAULT_BUDGET_FRACTION = 0.5
+# Budget used if the size of the physical memory is unknown
+FALLBACK_BUDGET = 4 * 2**30
+
+# Bytes per voxel of the Otsu threshold of the whole stack in
+# `_utils.estimate_material_surface` in addition to a copy of the input
+SURFACE_BYTES_PER_VOXEL = 8
+
+
+def physical_memory():
+    """
+    Size of the physical memory in bytes or None if it is unknown.
+    """
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_budget():
+    """
+    Memory budget of a step in bytes, `DEFAULT_BUDGET_FRACTION` of the
+    physical memory.
+    """
+    memory = physical_memory()
+    if memory is None:
+        return FALLBACK_BUDGET
+    return int(DEFAULT_BUDGET_FRACTION * memory)
+
+
+class MemoryEstimate:
+    """
+    Peak memory of a step in addition to its input.
+
+    The memory is described per time frame. Running on the full stack
+    needs the result and the temporary arrays of all frames. Running in
+    chunks needs the result of all frames, and a copy of the input, the
+    result and the temporary arrays of the frames of one chunk and its
+    temporal halo.
+
+    Parameters
+    ----------
+    n_frames : int
+        Number of time frames of the input.
+    result_bytes : int
+        Bytes of the result per frame.
+    temporary_bytes : int
+        Bytes of the temporary arrays per frame at the peak.
+    input_bytes : int
+        Bytes of an input frame.
+    halo : int
+        Number of frames processed in addition to the frames of a chunk.
+    """
+
+    def __init__(
+        self, n_frames, result_bytes, temporary_bytes=0, input_bytes=0, halo=0
+    ):
+        self.n_frames = n_frames
+        self.result_bytes = result_bytes
+        self.temporary_bytes = temporary_bytes
+        self.input_bytes = input_bytes
+        self.halo = halo
+
+    @property
+    def in_memory(self):
+        """
+        Peak memory of running the step on the full stack.
+        """
+        return self.n_frames * (self.result_bytes + self.temporary_bytes)
+
+    @property
+    def _chunk_frame_bytes(self):
+        return self.input_bytes + self.result_bytes + self.temporary_bytes
+
+    def _chunk(self, frames_per_chunk):
+        frames = min(frames_per_chunk + self.halo, self.n_frames)
+        return frames * self._chunk_frame_bytes
+
+    def chunked(self, frames_per_chunk):
+        """
+        Peak memory of running the step in chunks with a result for
+        the full stack.
+        """
+        return self.n_frames * self.result_bytes + self._chunk(
+            frames_per_chunk
+        )
+
+    def out_of_core(self, frames_per_chunk, workers=None):
+        """
+        Peak memory of computing a lazy result with `workers` chunks
+        at a time. Defaults to the number of CPUs, which is the number
+        of threads of dask's default scheduler.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        return workers * self._chunk(frames_per_chunk)
+
+    def plan(self, budget):
+        """
+        Chooses the strategy to run the step within `budget` bytes.
+
+        Returns
+        -------
+        strategy : str
+            `IN_MEMORY`, `CHUNKED` or `OUT_OF_CORE`.
+        frames_per_chunk : int
+            Number of frames per chunk or None for `IN_MEMORY`.
+        estimate : int
+            Estimated peak memory in bytes with this strategy. It can
+            exceed the budget if even one frame at a time does not fit.
+        """
+        if self.in_memory <= budget:
+            return IN_MEMORY, None, self.in_memory
+        chunk_frame = self._chunk_frame_bytes
+        frames = (
+            budget - self.n_frames * self.result_bytes
+        ) // chunk_frame - self.halo
+        if frames < 1 and dask_available():
+            workers = os.cpu_count() or 1
+            frames = max(budget // (workers * chunk_frame) - self.halo, 1)
+            return OUT_OF_CORE, int(frames), self.out_of_core(frames)
+        frames = int(min(max(frames, 1), self.n_frames))
+        return CHUNKED, frames, self.chunked(frames)
+
+
+def dask_available():
+    """
+    Checks if dask is installed without importing it.
+    """
+    return importlib.util.find_spec("dask") is not None
+
+
+def _frame_bytes(shape, dtype):
+    return int(np.prod(shape[1:], dtype=np.int64)) * np.dtype(dtype).itemsize
+
+
+def median_filter_memory(shape, dtype, kernel_size):
+    """
+    Memory estimate of `_utils.median_filter`. The result is a copy of
+    the input, and chunks need the frames of the temporal kernel of
+    their first and last frame.
+
+    Parameters
+    ----------
+    shape : (int, int, int)
+        Shape of the input stack.
+    dtype : np.dtype
+        Type of the input stack and result.
+    kernel_size : (int, int, int)
+        Size of the filter along t, y and x.
+    """
+    frame = _frame_bytes(shape, dtype)
+    return MemoryEstimate(
+        shape[0],
+        result_bytes=frame,
+        input_bytes=frame,
+        halo=kernel_size[0] - 1,
+    )
+
+
+def radial_gradient_memory(
+    shape,
+    dtype,
+    result_dtype=_utils.DEFAULT_DTYPE,
+    backend="numpy",
+    roi_shape=None,
+    with_surface=True,
+):
+    """
+    Memory estimate of `_utils.calculate_radial_gradient`.
+
+    The numpy backend holds five volumes of `result_dtype` at its peak:
+    the x and y gradients, the length and direction of the radial
+    vectors and the result. The numba backend only allocates the result
+    and the angles. Estimating the material surface needs a copy of the
+    input and `SURFACE_BYTES_PER_VOXEL` before the gradient is
+    calculated.
+
+    Parameters
+    ----------
+    shape : (int, int, int)
+        Shape of the input stack.
+    dtype : np.dtype
+        Type of the input stack.
+    result_dtype : np.dtype
+        Floating point type of the radial gradient.
+    backend : str
+        "numpy", "numba" or "auto", see `_utils.resolve_backend`.
+    roi_shape : (int, int)
+        Height and width of the region of interest, if any.
+    with_surface : bool
+        Whether the material surface is estimated by the step.
+    """
+    pixels = int(np.prod(shape[1:], dtype=np.int64))
+    itemsize = np.dtype(result_dtype).itemsize
+    volumes = 2 if _utils.resolve_backend(backend) == "numba" else 5
+    if roi_shape is None:
+        gradient = volumes * pixels * itemsize
+    else:
+        # The full size results are allocated in addition to the crop
+        roi_pixels = min(int(np.prod(roi_shape)), pixels)
+        gradient = (volumes * roi_pixels + 2 * pixels) * itemsize
+    input_bytes = _frame_bytes(shape, dtype)
+    peak = gradient
+    if with_surface:
+        peak = max(peak, SURFACE_BYTES_PER_VOXEL * pixels + input_bytes)
+    result = pixels * itemsize
+    return MemoryEstimate(
+        shape[0],
+        result_bytes=result,
+        temporary_bytes=peak - result,
+        input_bytes=input_bytes,
+    )
+
+
+def as_dask(stack, frames_per_chunk):
+    """
+    Wraps the stack in a dask array with chunks of whole frames,
+    which makes the steps return lazy results.
+    """
+    import dask.array as da
+
+    chunks = (frames_per_chunk, -1, -1)
+    if _utils.is_dask_array(stack):
+        return stack.rechunk(chunks)
+    return da.from_array(stack, chunks=chunks)
+
+
+def format_bytes(n_bytes):
+    """
+    Number of bytes in MB or GB.
+    """
+    if n_bytes < 2**30:
+        return f"{n_bytes / 2**20:.1f} MB"
+    return f"{n_bytes / 2**30:.2f} GB"
+
+
+def describe(strategy, frames_per_chunk, estimate, budget):
+    """
+    Short description of a plan for the widget.
+    """
+    text = f"Peak memory ~{format_bytes(estimate)}: {strategy}"
+    if frames_per_chunk is not None:
+        text += f" ({frames_per_chunk} frames per chunk)"
+    if estimate > budget:
+        text += f", exceeds the budget of {format_bytes(budget)}"
+    return text
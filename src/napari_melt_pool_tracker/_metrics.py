@@ -0,0 +1,218 @@
+"""
+Melt pool metrics from annotated or traced boundaries.
+
+The boundary is given by points in the resliced stack, e.g. the data of
+a points layer with (time frame, y, x) coordinates. `to_original_coordinates`
+maps them back to the original stack with the positions table returned by
+`_utils.reslice_with_moving_window`. `frame_metrics` calculates the depth,
+length, area and velocity of the melt pool in every frame and
+`run_metrics` summarizes them for one or many runs. All calculations are
+vectorized over the points, so no Python loop runs over the frames.
+
+`export_metrics` writes the metrics of many runs in a single bulk write
+to Parquet, Feather (Arrow) or CSV. Parquet and Feather need pyarrow.
+"""
+
+import pathlib
+
+import numpy as np
+
+FRAME_METRICS = ("Depth", "Length", "Area", "Velocity")
+
+
+def to_original_coordinates(
+    boundary, positions, window_offset, frame_offset=0
+):
+    """
+    Maps points of the resliced stack to the original stack.
+
+    Parameters
+    ----------
+    boundary : np.ndarray
+        Points with shape (n, 3). The columns are the frame in the
+        resliced stack, y and x.
+    positions : pd.DataFrame
+        Positions table of `_utils.reslice_with_moving_window`.
+    window_offset : int
+        Window offset used for reslicing, i.e. the horizontal position
+        of the laser in the resliced stack.
+    frame_offset : int
+        Time frame of the first resliced frame, e.g. the first frame
+        of a pass. Not used if the positions table has a
+        "Resliced frame" column, i.e. for compact resliced stacks.
+
+    Returns
+    -------
+    points : pd.DataFrame
+        The "Time frame", "y" and "x" coordinates in the original stack.
+        Points in frames without a window are dropped.
+    """
+    import pandas as pd
+
+    boundary = np.asarray(boundary, dtype=float).reshape(-1, 3)
+    frames = np.round(boundary[:, 0]).astype(int)
+    time_frames = positions["Time frame"].to_numpy()
+    if "Resliced frame" in positions:
+        resliced_frames = positions["Resliced frame"].to_numpy()
+    else:
+        frames += frame_offset
+        resliced_frames = time_frames
+    index = np.searchsorted(resliced_frames, frames)
+    valid = index < len(resliced_frames)
+    valid[valid] = resliced_frames[index[valid]] == frames[valid]
+    laser_pos = positions["Laser position"].to_numpy()[index[valid]]
+    return pd.DataFrame(
+        {
+            "Time frame": time_frames[index[valid]],
+            "y": boundary[valid, 1],
+            "x": boundary[valid, 2] + laser_pos - window_offset,
+        }
+    )
+
+
+def frame_metrics(
+    boundary, positions, window_offset, surface=None, frame_offset=0
+):
+    """
+    Calculates the melt pool metrics of every frame.
+
+    The points of a frame are treated as a polygon in the given order,
+    e.g. a traced boundary. A single depth point per frame is enough
+    for the depth if the `surface` is given.
+
+    Parameters
+    ----------
+    boundary, positions, window_offset, frame_offset
+        See `to_original_coordinates`.
+    surface : float or np.ndarray
+        Height of the material surface, either constant or one value
+        per row of the positions table. Defaults to the smallest y of
+        the points in every frame.
+
+    Returns
+    -------
+    metrics : pd.DataFrame
+        One row per time frame with points. "Depth" is the distance of
+        the lowest point from the surface, "Length" the horizontal
+        extent and "Area" the area of the polygon (shoelace formula).
+        "Centroid x" and "Centroid y" are the mean of the points in
+        original coordinates and "Velocity" is the rate of change of
+        "Centroid x" in pixels per frame. "Laser position" is copied
+        from the positions table.
+    """
+    import pandas as pd
+
+    points = to_original_coordinates(
+        boundary, positions, window_offset, frame_offset
+    )
+    # Stable sort keeps the order of the polygon vertices in a frame
+    points = points.sort_values("Time frame", kind="stable")
+    frames = points["Time frame"].to_numpy()
+    y = points["y"].to_numpy()
+    x = points["x"].to_numpy()
+    time_frames, starts, counts = np.unique(
+        frames, return_index=True, return_counts=True
+    )
+    if len(time_frames) == 0:
+        return pd.DataFrame(
+            columns=[
+                "Time frame",
+                *FRAME_METRICS,
+                "Centroid x",
+                "Centroid y",
+                "Laser position",
+            ]
+        )
+
+    rows = np.searchsorted(positions["Time frame"].to_numpy(), time_frames)
+    y_min = np.minimum.reduceat(y, starts)
+    y_max = np.maximum.reduceat(y, starts)
+    length = np.maximum.reduceat(x, starts) - np.minimum.reduceat(x, starts)
+
+    if surface is None:
+        surface = y_min
+    elif np.ndim(surface) > 0:
+        surface = np.asarray(surface)[rows]
+    depth = y_max - surface
+
+    # Shoelace formula with the next vertex wrapping around per frame
+    next_vertex = np.arange(1, len(x) + 1)
+    next_vertex[starts + counts - 1] = starts
+    cross = x * y[next_vertex] - x[next_vertex] * y
+    area = 0.5 * np.abs(np.add.reduceat(cross, starts))
+
+    centroid_x = np.add.reduceat(x, starts) / counts
+    centroid_y = np.add.reduceat(y, starts) / counts
+    velocity = np.full(len(time_frames), np.nan)
+    if len(time_frames) > 1:
+        velocity = np.gradient(centroid_x, time_frames)
+
+    return pd.DataFrame(
+        {
+            "Time frame": time_frames,
+            "Depth": depth,
+            "Length": length,
+            "Area": area,
+            "Velocity": velocity,
+            "Centroid x": centroid_x,
+            "Centroid y": centroid_y,
+            "Laser position": positions["Laser position"].to_numpy()[rows],
+        }
+    )
+
+
+def run_metrics(metrics):
+    """
+    Summarizes the frame metrics of one or many runs.
+
+    Parameters
+    ----------
+    metrics : pd.DataFrame
+        Frame metrics of `frame_metrics`. If there is a "Run" column,
+        every run is summarized separately.
+
+    Returns
+    -------
+    summary : pd.DataFrame
+        The number of frames and the mean, standard deviation and
+        maximum of every metric, with one row per run.
+    """
+    has_runs = "Run" in metrics
+    if not has_runs:
+        metrics = metrics.assign(Run=0)
+    grouped = metrics.groupby("Run", sort=False)
+    summary = grouped[list(FRAME_METRICS)].agg(["mean", "std", "max"])
+    summary.columns = [f"{metric} {stat}" for metric, stat in summary.columns]
+    summary.insert(0, "Frames", grouped.size())
+    return summary.reset_index(drop=not has_runs)
+
+
+def export_metrics(metrics, path):
+    """
+    Writes the metrics of one or many runs to a single file.
+
+    Parameters
+    ----------
+    metrics : pd.DataFrame or dict of pd.DataFrame
+        Metrics of one run, or of several runs by name. The runs are
+        concatenated once with their name in a "Run" column.
+    path : str or pathlib.Path
+        Output file. The format is chosen by the suffix: ".parquet",
+        ".feather" or ".arrow" (need pyarrow), or ".csv".
+    """
+    import pandas as pd
+
+    if isinstance(metrics, dict):
+        metrics = pd.concat(metrics, names=["Run", None]).reset_index(level=0)
+    metrics = metrics.reset_index(drop=True)
+    path = pathlib.Path(path)
+    if path.suffix == ".parquet":
+        metrics.to_parquet(path, index=False)
+    elif path.suffix in (".feather", ".arrow"):
+        metrics.to_feather(path)
+    elif path.suffix == ".csv":
+        metrics.to_csv(path, index=False)
+    else:
+        raise ValueError(
+            f"Unknown format {path.suffix}. Use .parquet, .feather, .arrow or .csv."
+        )
@@ -0,0 +1,173 @@
+"""
+Numba implementations of the hot kernels in `_utils`.
+
+This module is only imported by `_utils` when numba is installed and
+the numba backend is selected. Every kernel loops over the frames in
+parallel and writes its result directly into the output array without
+intermediate full size arrays. The results match the NumPy backend.
+"""
+
+import numba
+import numpy as np
+
+
+@numba.njit(cache=True)
+def _reflect(i, n):
+    """
+    Maps index `i` into the range [0, n) using the same
+    "reflect" boundary mode as scipy.ndimage (d c b a | a b c d).
+    """
+    if n == 1:
+        return 0
+    period = 2 * n
+    i = i % period
+    if i >= n:
+        i = period - 1 - i
+    return i
+
+
+@numba.njit(cache=True)
+def _reflected_indices(n, kernel_size):
+    """
+    Table of the reflected indices covered by a kernel of size
+    `kernel_size` centered at each of the `n` positions.
+    """
+    indices = np.empty((n, kernel_size), dtype=np.int64)
+    for i in range(n):
+        for k in range(kernel_size):
+            indices[i, k] = _reflect(i + k - kernel_size // 2, n)
+    return indices
+
+
+@numba.njit(cache=True)
+def _select(values, k):
+    """
+    Returns the k-th smallest element of `values` using quickselect.
+    The elements of `values` are reordered in place.
+    """
+    lo = 0
+    hi = len(values) - 1
+    while lo < hi:
+        pivot = values[(lo + hi) // 2]
+        i = lo
+        j = hi
+        while i <= j:
+            while values[i] < pivot:
+                i += 1
+            while values[j] > pivot:
+                j -= 1
+            if i <= j:
+                values[i], values[j] = values[j], values[i]
+                i += 1
+                j -= 1
+        if k <= j:
+            hi = j
+        elif k >= i:
+            lo = i
+        else:
+            break
+    return values[k]
+
+
+@numba.njit(parallel=True, cache=True)
+def reslice(stack, start, valid, window_size):
+    """
+    Copies the window starting at `start[t]` of every valid frame `t`
+    into the output. Parts of the window outside the image are zero.
+    """
+    n_t, height, width = stack.shape
+    resliced = np.zeros((n_t, height, window_size), dtype=stack.dtype)
+    for t in numba.prange(n_t):
+        if not valid[t]:
+            continue
+        lo = max(0, -start[t])
+        hi = min(window_size, width - start[t])
+        for y in range(height):
+            for j in range(lo, hi):
+                resliced[t, y, j] = stack[t, y, start[t] + j]
+    return resliced
+
+
+@numba.njit(parallel=True, cache=True, error_model="numpy")
+def radial_gradient(
+    stack, center, x_weights, y_weights, scale, rad_grad, angles
+):
+    """
+    Correlates every frame with the x and y gradient kernels and
+    projects the gradient onto the direction from `center[t]`.
+    The results are written to `rad_grad` and `angles`.
+    """
+    n_t, height, width = stack.shape
+    k_h, k_w = x_weights.shape
+    y_indices = _reflected_indices(height, k_h)
+    x_indices = _reflected_indices(width, k_w)
+    for t in numba.prange(n_t):
+        c_y = center[t, 0]
+        c_x = center[t, 1]
+        for y in range(height):
+            for x in range(width):
+                x_grad = 0.0
+                y_grad = 0.0
+                for i in range(k_h):
+                    y_i = y_indices[y, i]
+                    for j in range(k_w):
+                        value = stack[t, y_i, x_indices[x, j]] * scale
+                        x_grad += x_weights[i, j] * value
+                        y_grad += y_weights[i, j] * value
+                d_x = x - c_x
+                d_y = y - c_y
+                v_length = np.sqrt(d_x**2 + d_y**2)
+                rad_grad[t, y, x] = x_grad * np.abs(
+                    d_x / v_length
+                ) + y_grad * np.abs(d_y / v_length)
+                angles[t, y, x] = np.arctan2(x_grad, y_grad)
+
+
+@numba.njit(parallel=True, cache=True)
+def median_filter(stack, kernel_t, kernel_y, kernel_x):
+    """
+    3D median filter with the same window placement, rank and
+    boundary handling as `scipy.ndimage.median_filter`.
+    """
+    n_t, height, width = stack.shape
+    size = kernel_t * kernel_y * kernel_x
+    rank = size // 2
+    t_indices = _reflected_indices(n_t, kernel_t)
+    y_indices = _reflected_indices(height, kernel_y)
+    x_indices = _reflected_indices(width, kernel_x)
+    filtered = np.empty_like(stack)
+    for t in numba.prange(n_t):
+        window = np.empty(size, dtype=stack.dtype)
+        for y in range(height):
+            for x in range(width):
+                n = 0
+                for i in range(kernel_t):
+                    t_i = t_indices[t, i]
+                    for j in range(kernel_y):
+                        y_j = y_indices[y, j]
+                        for k in range(kernel_x):
+                            window[n] = stack[t_i, y_j, x_indices[x, k]]
+                            n += 1
+                filtered[t, y, x] = _select(window, rank)
+    return filtered
+
+
+@numba.njit(parallel=True, cache=True)
+def sorted_window_update(window, count, old, new, remove):
+    """
+    Inserts `new[p]` into the sorted values `window[p, :count]` of every
+    pixel `p`, replacing `old[p]` if `remove`. The positions are found
+    by binary search and only the values between them are shifted.
+    """
+    for p in numba.prange(window.shape[0]):
+        values = window[p]
+        i = np.searchsorted(values[:count], old[p]) if remove else count
+        if remove and new[p] >= old[p]:
+            j = max(i, np.searchsorted(values[:count], new[p]) - 1)
+            for k in range(i, j):
+                values[k] = values[k + 1]
+        else:
+            j = np.searchsorted(values[:count], new[p])
+            for k in range(i, j, -1):
+                values[k] = values[k - 1]
+        values[j] = new[p]
@@ -0,0 +1,248 @@
+"""
+Acquisitions with several laser passes.
+
+`detect_passes` finds the individual passes, their direction and time
+span in the projection of step 1. Every pass is resliced, filtered and
+used for the radial gradient independently by `process_pass`.
+`process_passes` processes all passes of a stack in parallel threads.
+The heavy lifting is done by NumPy and SciPy, which release the GIL, so
+the passes are processed concurrently without copying the stack to
+other processes.
+"""
+
+import concurrent.futures
+
+import numpy as np
+
+from napari_melt_pool_tracker import _utils
+
+PASS_COLUMNS = (
+    "Pass",
+    "First frame",
+    "Last frame",
+    "Direction",
+    "Coef",
+    "Intercept",
+)
+
+
+def detect_passes(proj_resliced, threshold=None, min_frames=5, max_jump=None):
+    """
+    Detects the laser passes in the projection of
+    `_utils.determine_laser_speed_and_position`.
+
+    The laser is visible in a frame if the maximum of the projection
+    is above the threshold. Its position is the location of the
+    maximum. A pass is a run of frames with a visible laser in which
+    the position does not jump. A line is fitted to the positions of
+    every pass.
+
+    Parameters
+    ----------
+    proj_resliced : np.ndarray
+        Projection with the horizontal position as first axis and
+        time as second axis.
+    threshold : float
+        Minimum intensity of a visible laser. Defaults to Otsu's
+        threshold of the maximum intensity of the frames.
+    min_frames : int
+        Shorter runs of frames are ignored.
+    max_jump : int
+        Largest displacement of the laser between two frames of the
+        same pass. Defaults to a quarter of the width.
+
+    Returns
+    -------
+    passes : pd.DataFrame
+        One row per pass with the first and last frame, the direction
+        (1 for increasing and -1 for decreasing positions) and the
+        coef and intercept of the fitted line, which can be passed to
+        `_utils.reslice_with_moving_window`.
+    """
+    import pandas as pd
+    import skimage.filters
+
+    proj_resliced = np.asarray(proj_resliced)
+    if max_jump is None:
+        max_jump = proj_resliced.shape[0] // 4
+    intensity = np.max(proj_resliced, axis=0)
+    if threshold is None:
+        threshold = skimage.filters.threshold_otsu(intensity)
+    laser_pos = np.argmax(proj_resliced, axis=0)
+    visible = intensity > threshold
+
+    breaks = (
+        ~visible[1:] | ~visible[:-1] | (np.abs(np.diff(laser_pos)) > max_jump)
+    )
+    runs = np.split(np.arange(len(visible)), np.flatnonzero(breaks) + 1)
+    rows = []
+    for frames in runs:
+        frames = frames[visible[frames]]
+        if len(frames) < min_frames:
+            continue
+        coef, intercept = np.polyfit(frames, laser_pos[frames], 1)
+        if coef == 0:
+            continue
+        rows.append(
+            (
+                len(rows),
+                frames[0],
+                frames[-1],
+                int(np.sign(coef)),
+                coef,
+                intercept,
+            )
+        )
+    return pd.DataFrame(rows, columns=PASS_COLUMNS)
+
+
+def passes_from_lines(lines):
+    """
+    Creates the table of passes from lines drawn on the projection,
+    e.g. the lines of a shapes layer.
+
+    Parameters
+    ----------
+    lines : list of np.ndarray
+        Two points per line. The first coordinate of a point is the
+        horizontal position and the second one the time frame.
+
+    Returns
+    -------
+    passes : pd.DataFrame
+        See `detect_passes`.
+    """
+    import pandas as pd
+
+    rows = []
+    for i, points in enumerate(lines):
+        coef, intercept = (
+            _utils.determine_laser_speed_and_position_from_points(
+                points[0], points[1]
+            )
+        )
+        frames = np.round(np.sort([points[0][1], points[1][1]])).astype(int)
+        rows.append(
+            (
+                i,
+                max(frames[0], 0),
+                frames[1],
+                int(np.sign(coef)),
+                coef,
+                intercept,
+            )
+        )
+    return pd.DataFrame(rows, columns=PASS_COLUMNS)
+
+
+def process_pass(
+    stack,
+    laser_pass,
+    window_offset,
+    window_size,
+    kernel_size,
+    xpos=None,
+    backend="numpy",
+    dtype=_utils.DEFAULT_DTYPE,
+):
+    """
+    Reslices, filters and calculates the radial gradient of one pass.
+
+    For passes with decreasing laser positions the window is mirrored,
+    i.e. it starts `window_size - window_offset` before the laser, so
+    the same part of the melt pool is kept in view for both directions.
+
+    Parameters
+    ----------
+    stack : np.ndarray or dask.array.Array
+        Full size original data with all passes.
+    laser_pass : pd.Series
+        Row of the table returned by `detect_passes`.
+    window_offset, window_size
+        See `_utils.reslice_with_moving_window`.
+    kernel_size : (int, int, int)
+        Size of the median filter along t, y and x.
+    xpos : int
+        Origin of the radial gradient in the resliced stack.
+        Defaults to the laser position in the window.
+    backend : str
+        "numpy", "numba" or "auto", see `_utils.resolve_backend`.
+    dtype : np.dtype
+        Floating point type of the radial gradient.
+
+    Returns
+    -------
+    results : dict
+        The "resliced", "filtered" and "radial_gradient" stacks of the
+        frames of the pass and the "positions" table with the time
+        frames and positions in the original stack.
+    """
+    first_frame = int(laser_pass["First frame"])
+    last_frame = int(laser_pass["Last frame"])
+    if laser_pass["Coef"] < 0:
+        window_offset = window_size - window_offset
+    if xpos is None:
+        xpos = min(window_offset, window_size - 1)
+    resliced, positions = _utils.reslice_with_moving_window(
+        stack[first_frame : last_frame + 1],
+        laser_pass["Coef"],
+        laser_pass["Intercept"],
+        window_offset=window_offset,
+        window_size=window_size,
+        backend=backend,
+        first_frame=first_frame,
+    )
+    filtered = _utils.median_filter(resliced, kernel_size, backend=backend)
+    radial_gradient = _utils.calculate_radial_gradient(
+        filtered, xpos=xpos, backend=backend, dtype=dtype
+    )
+    return {
+        "resliced": resliced,
+        "positions": positions,
+        "filtered": filtered,
+        "radial_gradient": radial_gradient,
+    }
+
+
+def process_passes(
+    stack, passes, *args, backend="numpy", max_workers=None, **kwargs
+):
+    """
+    Processes all passes with `process_pass` in parallel threads.
+
+    The kernels of the numba backend are parallel themselves and
+    numba's threading layers are not all safe to use from several
+    threads, so with the numba backend the passes are processed one
+    after the other.
+
+    Parameters
+    ----------
+    stack : np.ndarray or dask.array.Array
+        Full size original data with all passes.
+    passes : pd.DataFrame
+        Table returned by `detect_passes` or `passes_from_lines`.
+    backend : str
+        "numpy", "numba" or "auto", see `_utils.resolve_backend`.
+    max_workers : int
+        Maximum number of threads. Defaults to the default of
+        `concurrent.futures.ThreadPoolExecutor`.
+    *args, **kwargs
+        Passed on to `process_pass`.
+
+    Returns
+    -------
+    results : list of dict
+        The results of `process_pass` in the order of the passes.
+    """
+    kwargs["backend"] = backend
+    if _utils.resolve_backend(backend) == "numba":
+        return [
+            process_pass(stack, laser_pass, *args, **kwargs)
+            for _, laser_pass in passes.iterrows()
+        ]
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = [
+            executor.submit(process_pass, stack, laser_pass, *args, **kwargs)
+            for _, laser_pass in passes.iterrows()
+        ]
+        return [future.result() for future in futures]
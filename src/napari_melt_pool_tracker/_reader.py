@@ -5,12 +5,27 @@ The TOMCAT beamline h5 containes the data in "exchange" --> "data". In the ID19
 h5 file the data is stored in "image_stack".
 
 If you need to extend the plugin to h5 files from other beamlines, please add
-an additional `if` condition with the appropriate key to access the data.
+an additional `if` condition with the appropriate key in `get_dataset`.
+
+`read_stack` reads only a subset of the data (time range, temporal stride,
+spatial region of interest and binning) using HDF5 hyperslab selections.
+
+TOMCAT files also contain flat (white) and dark fields in "exchange" -->
+"data_white" and "data_dark". With `flat_field=True` they are averaged
+once and the frames are corrected to (data - dark) / (white - dark) in
+float32 while they are read, chunk by chunk, so no full size copy of the
+raw data is made. `lazy_corrected_stack` returns a dask array that only reads and
+corrects the frames that are computed.
 """
 
+import functools
+import importlib.util
+
 import h5py
 import numpy as np
 
+from napari_melt_pool_tracker import _cache, _stats
+
 
 def napari_get_reader(path):
     """A basic implementation of a Reader contribution.
@@ -39,7 +54,20 @@ def napari_get_reader(path):
     return reader_function
 
 
-def reader_function(path):
+def napari_get_flat_field_reader(path):
+    """
+    Reader contribution for h5 files with flat and dark fields, which
+    returns the frames with flat-field correction.
+    """
+    if isinstance(path, list) or not path.endswith(".h5"):
+        return None
+    with h5py.File(path, "r") as f:
+        if not has_flat_field(f):
+            return None
+    return functools.partial(reader_function, flat_field=True)
+
+
+def reader_function(path, flat_field=False):
     """Take a path or list of paths and return a list of LayerData tuples.
 
     Readers are expected to return data as a list of tuples, where each tuple
@@ -50,6 +78,10 @@ def reader_function(path):
     ----------
     path : str or list of str
         Path to file, or list of paths.
+    flat_field : bool
+        Whether the frames of a single file are corrected with its flat
+        and dark fields. The corrected stack is a lazy dask array if
+        dask is installed.
 
     Returns
     -------
@@ -61,24 +93,257 @@ def reader_function(path):
         layer. Both "meta", and "layer_type" are optional. napari will
         default to layer_type=="image" if not provided
     """
+    if flat_field:
+        return _read_flat_field_corrected(path)
     # handle both a string and a list of strings
     paths = [path] if isinstance(path, str) else path
     # load all files into array
     arrays = []
+    # The contrast limits are collected while reading, so napari does
+    # not scan the data again
+    stats = _stats.RunningStats()
     for _path in paths:
         with h5py.File(_path, "r") as f:
-            if "image_stack" in f:
-                # ID19 data
-                array = np.array(f["image_stack"])
-            else:
-                # Tomcat data
-                array = np.array(f["exchange"]["data"])
+            dataset = get_dataset(f)
+            array = np.empty(dataset.shape, dtype=dataset.dtype)
+            for start in range(0, len(array), _stats.FRAMES_PER_CHUNK):
+                chunk = dataset[start : start + _stats.FRAMES_PER_CHUNK]
+                array[start : start + len(chunk)] = chunk
+                stats.update(chunk)
             arrays.append(array)
     # stack arrays into single array
     data = np.squeeze(np.stack(arrays))
 
     # optional kwargs for the corresponding viewer.add_* method
-    add_kwargs = {}
+    metadata = {}
+    if len(paths) == 1:
+        # Identifies the data for the cache of the step results
+        metadata = {
+            "path": paths[0],
+            "read_kwargs": {},
+            "cache_key": _cache.source_key(paths[0]),
+        }
+    add_kwargs = _stats.layer_kwargs(stats.summary(), metadata)
 
     layer_type = "image"  # optional, default is "image"
     return [(data, add_kwargs, layer_type)]
+
+
+def _read_flat_field_corrected(path):
+    if importlib.util.find_spec("dask") is not None:
+        data = lazy_corrected_stack(path)
+    else:
+        data = read_stack(path, flat_field=True)
+    metadata = {
+        "path": path,
+        "read_kwargs": {"flat_field": True},
+        "cache_key": _cache.source_key(path, flat_field=True),
+    }
+    add_kwargs = _stats.layer_kwargs(
+        _stats.image_stats(data).summary(), metadata
+    )
+    return [(data, add_kwargs, "image")]
+
+
+def get_dataset(f):
+    """
+    Returns the dataset containing the images of an open h5 file.
+    """
+    if "image_stack" in f:
+        # ID19 data
+        return f["image_stack"]
+    # Tomcat data
+    return f["exchange"]["data"]
+
+
+def has_flat_field(f):
+    """
+    Whether an open h5 file contains flat and dark fields.
+    """
+    return (
+        "exchange" in f
+        and "data_white" in f["exchange"]
+        and "data_dark" in f["exchange"]
+    )
+
+
+def _mean_frame(dataset, frames_per_read):
+    total = np.zeros(dataset.shape[1:], dtype=np.float64)
+    for start in range(0, len(dataset), frames_per_read):
+        total += dataset[start : start + frames_per_read].sum(axis=0)
+    return (total / len(dataset)).astype(np.float32)
+
+
+def read_flat_field(f, frames_per_read=64):
+    """
+    Averages the flat and dark fields of an open h5 file.
+
+    Returns
+    -------
+    dark : np.ndarray
+        Mean dark field in float32.
+    gain : np.ndarray
+        1 / (white - dark) in float32, with the mean white field. Pixels
+        where the white field is not brighter than the dark field get a
+        gain of 0.
+    """
+    if not has_flat_field(f):
+        raise ValueError(
+            f"{f.filename} contains no flat and dark fields (exchange/data_white and exchange/data_dark)."
+        )
+    white = _mean_frame(f["exchange"]["data_white"], frames_per_read)
+    dark = _mean_frame(f["exchange"]["data_dark"], frames_per_read)
+    difference = white - dark
+    gain = np.zeros_like(difference)
+    np.divide(1, difference, out=gain, where=difference > 0)
+    return dark, gain
+
+
+def flat_field_correct(frames, dark, gain):
+    """
+    Corrects frames to (frames - dark) / (white - dark) in float32.
+    `dark` and `gain` are the results of `read_flat_field` restricted
+    to the region of the frames.
+    """
+    corrected = np.subtract(frames, dark, dtype=np.float32)
+    corrected *= gain
+    return corrected
+
+
+def read_stack(
+    path,
+    time_range=None,
+    stride=1,
+    roi=None,
+    binning=1,
+    frames_per_read=64,
+    flat_field=False,
+):
+    """
+    Reads a subset of the image stack in an h5 file. Only the selected
+    frames and region are read from disk.
+
+    Parameters
+    ----------
+    path : str
+        Path to the h5 file.
+    time_range : (int, int)
+        First and last (exclusive) frame to read. None reads all frames.
+    stride : int
+        Only every `stride`th frame is read.
+    roi : (int, int, int, int)
+        Region of interest (y start, y stop, x start, x stop).
+        None reads the full frames.
+    binning : int
+        Size of the square of pixels averaged into one pixel. The region
+        of interest is cropped to a multiple of the binning.
+    frames_per_read : int
+        Number of frames read from disk at once when binning or
+        correcting.
+    flat_field : bool
+        Whether the frames are corrected with the flat and dark fields
+        of the file before binning, see `flat_field_correct`.
+
+    Returns
+    -------
+    stack : np.ndarray
+        The selected data. It keeps the dtype of the file unless
+        binning or flat-field correction is used, which return float32.
+    """
+    if stride < 1 or binning < 1:
+        raise ValueError("`stride` and `binning` have to be at least 1.")
+    with h5py.File(path, "r") as f:
+        dataset = get_dataset(f)
+        if dataset.ndim != 3:
+            raise ValueError(
+                f"Subsets can only be read from 3D datasets, not {dataset.ndim}D."
+            )
+        n_t, height, width = dataset.shape
+        t_start, t_stop = (0, n_t) if time_range is None else time_range
+        y_start, y_stop, x_start, x_stop = (
+            (0, height, 0, width) if roi is None else roi
+        )
+        y_stop = y_start + (min(y_stop, height) - y_start) // binning * binning
+        x_stop = x_start + (min(x_stop, width) - x_start) // binning * binning
+        frames = range(t_start, min(t_stop, n_t), stride)
+        if len(frames) == 0 or y_stop <= y_start or x_stop <= x_start:
+            raise ValueError("The selected subset is empty.")
+
+        if binning == 1 and not flat_field:
+            return dataset[
+                frames.start : frames.stop : stride,
+                y_start:y_stop,
+                x_start:x_stop,
+            ]
+        if flat_field:
+            dark, gain = read_flat_field(f, frames_per_read)
+            dark = dark[y_start:y_stop, x_start:x_stop]
+            gain = gain[y_start:y_stop, x_start:x_stop]
+
+        binned_shape = (
+            (y_stop - y_start) // binning,
+            binning,
+            (x_stop - x_start) // binning,
+            binning,
+        )
+        stack = np.empty(
+            (len(frames), binned_shape[0], binned_shape[2]), dtype=np.float32
+        )
+        for i in range(0, len(frames), frames_per_read):
+            chunk = frames[i : i + frames_per_read]
+            data = dataset[
+                chunk.start : chunk.stop : stride,
+                y_start:y_stop,
+                x_start:x_stop,
+            ]
+            if flat_field:
+                data = flat_field_correct(data, dark, gain)
+            if binning > 1:
+                data = data.reshape((len(chunk),) + binned_shape).mean(
+                    axis=(2, 4), dtype=np.float32
+                )
+            stack[i : i + len(chunk)] = data
+        return stack
+
+
+class _CorrectedFrames:
+    """
+    Array like view of the flat-field corrected frames of a file for
+    `dask.array.from_array`. Every access opens the file and corrects
+    the frames that are read.
+    """
+
+    def __init__(self, path, dark, gain):
+        self.path = path
+        self.dark = dark
+        self.gain = gain
+        with h5py.File(path, "r") as f:
+            self.shape = get_dataset(f).shape
+        self.dtype = np.dtype(np.float32)
+        self.ndim = len(self.shape)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        with h5py.File(self.path, "r") as f:
+            frames = get_dataset(f)[key]
+        region = key[1:]
+        return flat_field_correct(frames, self.dark[region], self.gain[region])
+
+
+def lazy_corrected_stack(path, frames_per_chunk=16):
+    """
+    Reads the flat-field corrected stack of an h5 file as a dask array
+    with chunks of `frames_per_chunk` frames. The flat and dark fields
+    are averaged once, and frames are only read from disk and corrected
+    when they are computed. Needs dask.
+    """
+    import dask.array as da
+
+    with h5py.File(path, "r") as f:
+        dark, gain = read_flat_field(f)
+    return da.from_array(
+        _CorrectedFrames(path, dark, gain),
+        chunks=(frames_per_chunk, -1, -1),
+        name=f"flat-field-{_cache.source_key(path, flat_field=True)}",
+        meta=np.empty((0, 0, 0), dtype=np.float32),
+    )
@@ -0,0 +1,157 @@
+"""
+Contrast limits and histograms of stacks for display in napari.
+
+napari calculates the contrast limits of a new image layer from its
+data, which reads lazy data and scans arrays that were just computed
+again. `RunningStats` collects the minimum, maximum and a coarse
+histogram of a stack chunk by chunk, e.g. while the frames are
+produced, so the contrast limits can be passed to `add_image`. The
+histogram is calculated from a subsample of the values of bounded size.
+"""
+
+import warnings
+
+import numpy as np
+
+from napari_melt_pool_tracker import _utils
+
+HISTOGRAM_BINS = 64
+# Maximum number of values kept for the histogram
+MAX_SAMPLES = 2**16
+# Number of frames sampled from lazy stacks
+SAMPLE_FRAMES = 8
+# Number of frames scanned at a time by `image_stats`
+FRAMES_PER_CHUNK = 16
+
+
+class RunningStats:
+    """
+    Running minimum, maximum and histogram of chunks of a stack.
+    NaNs are ignored.
+    """
+
+    def __init__(self):
+        self.min = np.inf
+        self.max = -np.inf
+        # Every `stride`th value of every chunk is kept for the histogram
+        self.stride = 1
+        self.samples = []
+
+    def update(self, frames):
+        """
+        Adds the values of a chunk of frames.
+        """
+        frames = np.asarray(frames)
+        if frames.size == 0:
+            return
+        with warnings.catch_warnings():
+            # All NaN chunks
+            warnings.simplefilter("ignore", RuntimeWarning)
+            self.min = np.nanmin([self.min, np.nanmin(frames)])
+            self.max = np.nanmax([self.max, np.nanmax(frames)])
+
+        # Decimate the samples by powers of two, so all chunks are
+        # sampled with the same stride
+        n_samples = sum(map(len, self.samples))
+        while n_samples + frames.size // self.stride > MAX_SAMPLES:
+            self.stride *= 2
+            self.samples = [sample[::2] for sample in self.samples]
+            n_samples = sum(map(len, self.samples))
+        values = frames.reshape(-1)[:: self.stride]
+        if values.dtype.kind == "f":
+            values = values[~np.isnan(values)]
+        self.samples.append(np.array(values))
+
+    @property
+    def contrast_limits(self):
+        """
+        Minimum and maximum as floats. Constant and empty stacks get
+        limits one apart, which napari requires.
+        """
+        if not np.isfinite(self.min) or not np.isfinite(self.max):
+            return 0.0, 1.0
+        low, high = float(self.min), float(self.max)
+        if high <= low:
+            high = low + 1
+        return low, high
+
+    def histogram(self, bins=HISTOGRAM_BINS):
+        """
+        Histogram between the contrast limits, estimated from the
+        sampled values.
+
+        Returns
+        -------
+        counts : np.ndarray
+            Estimated number of values in every bin.
+        edges : np.ndarray
+            Edges of the bins.
+        """
+        samples = np.concatenate(self.samples) if self.samples else []
+        counts, edges = np.histogram(
+            samples, bins=bins, range=self.contrast_limits
+        )
+        return counts * self.stride, edges
+
+    def summary(self):
+        """
+        Contrast limits and histogram as arrays, which can be stored in
+        the cache with the results of a step.
+        """
+        counts, edges = self.histogram()
+        return {
+            "contrast_limits": np.array(self.contrast_limits),
+            "histogram_counts": counts,
+            "histogram_edges": edges,
+        }
+
+
+def image_stats(stack, max_frames=None):
+    """
+    Collects the `RunningStats` of a stack.
+
+    Parameters
+    ----------
+    stack : array like
+        Stack with time as first axis, e.g. a NumPy array, an h5py
+        dataset or a dask array.
+    max_frames : int
+        Number of evenly spaced frames used. Defaults to all frames of
+        NumPy arrays and `SAMPLE_FRAMES` for other arrays, which would
+        otherwise be read or computed completely.
+
+    Returns
+    -------
+    stats : RunningStats
+    """
+    if max_frames is None and not isinstance(stack, np.ndarray):
+        max_frames = SAMPLE_FRAMES
+    stats = RunningStats()
+    n_frames = stack.shape[0]
+    if max_frames is not None and n_frames > max_frames:
+        frames = np.unique(np.linspace(0, n_frames - 1, max_frames).round())
+        sample = stack[frames.astype(int).tolist()]
+        if _utils.is_dask_array(sample):
+            sample = sample.compute()
+        stats.update(sample)
+        return stats
+    for start in range(0, n_frames, FRAMES_PER_CHUNK):
+        stats.update(stack[start : start + FRAMES_PER_CHUNK])
+    return stats
+
+
+def layer_kwargs(summary, metadata=None):
+    """
+    Keyword arguments of `add_image` with the contrast limits of a
+    `RunningStats.summary` and its histogram in the metadata.
+    """
+    metadata = dict(metadata or {})
+    metadata["histogram"] = (
+        summary["histogram_counts"],
+        summary["histogram_edges"],
+    )
+    low, high = summary["contrast_limits"]
+    return {
+        "contrast_limits": (float(low), float(high)),
+        "metadata": metadata,
+    }
@@ -0,0 +1,106 @@
+import h5py
+import numpy as np
+import pytest
+
+from napari_melt_pool_tracker import _batch
+
+
+@pytest.fixture
+def h5_files(tmp_path):
+    rng = np.random.default_rng(seed=0)
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"run_{i}.h5"
+        data = rng.integers(low=0, high=2**14, size=(12, 20, 60))
+        with h5py.File(path, "w") as f:
+            f.create_dataset("image_stack", data=data.astype(np.uint16))
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def parameters():
+    return {
+        "window_offset": 5,
+        "window_size": 20,
+        "kernel_size": [3, 3, 3],
+        "backend": "numpy",
+    }
+
+
+def test_run_batch(tmp_path, h5_files, parameters):
+    output_dir = tmp_path / "output"
+    manifest = _batch.create_manifest(output_dir, h5_files, parameters)
+    assert len(manifest["entries"]) == len(h5_files)
+
+    computed = _batch.run_batch(output_dir)
+    for entry in manifest["entries"]:
+        assert computed[entry["id"]] == list(_batch.STEPS)
+        entry_dir = output_dir / entry["id"]
+        resliced = np.load(entry_dir / "resliced.npy")
+        assert resliced.shape == (12, 20, 20)
+        radial_gradient = np.load(entry_dir / "radial_gradient.npy")
+        assert radial_gradient.shape == resliced.shape
+        assert radial_gradient.dtype == np.float32
+
+    # Nothing is recomputed on restart
+    computed = _batch.run_batch(output_dir)
+    assert all(steps == [] for steps in computed.values())
+
+
+def test_run_batch_resume(tmp_path, h5_files, parameters):
+    output_dir = tmp_path / "output"
+    manifest = _batch.create_manifest(output_dir, h5_files, parameters)
+    _batch.run_batch(output_dir)
+    entry_dir = output_dir / manifest["entries"][0]["id"]
+
+    # A missing output is recomputed together with the steps after it
+    (entry_dir / "filtered.npy").unlink()
+    computed = _batch.run_batch(output_dir)
+    assert computed[manifest["entries"][0]["id"]] == ["filter"]
+
+    # A changed output invalidates the step
+    filtered = np.load(entry_dir / "filtered.npy")
+    np.save(entry_dir / "filtered.npy", filtered + 1)
+    computed = _batch.run_batch(output_dir)
+    assert computed[manifest["entries"][0]["id"]] == ["filter"]
+
+    # A changed input invalidates all steps
+    with h5py.File(h5_files[1], "a") as f:
+        f["image_stack"][0, 0, 0] += 1
+    computed = _batch.run_batch(output_dir)
+    assert computed[manifest["entries"][1]["id"]] == list(_batch.STEPS)
+    assert computed[manifest["entries"][2]["id"]] == []
+
+
+def test_run_batch_shards(tmp_path, h5_files, parameters):
+    output_dir = tmp_path / "output"
+    manifest = _batch.create_manifest(output_dir, h5_files, parameters)
+    computed = _batch.run_batch(output_dir, shard_index=0, shard_count=2)
+    computed.update(_batch.run_batch(output_dir, shard_index=1, shard_count=2))
+    assert sorted(computed) == sorted(e["id"] for e in manifest["entries"])
+    assert all(steps == list(_batch.STEPS) for steps in computed.values())
+
+    with pytest.raises(ValueError):
+        _batch.run_batch(output_dir, shard_index=2, shard_count=2)
+
+
+def test_create_manifest_mismatch(tmp_path, h5_files, parameters):
+    output_dir = tmp_path / "output"
+    _batch.create_manifest(output_dir, h5_files, parameters)
+    _batch.create_manifest(output_dir, h5_files, parameters)
+    with pytest.raises(ValueError):
+        _batch.create_manifest(output_dir, h5_files[:1], parameters)
+    with pytest.raises(ValueError):
+        _batch.create_manifest(output_dir, h5_files, {"window_size": 10})
+    with pytest.raises(ValueError):
+        _batch.create_manifest(tmp_path / "other", h5_files, {"size": 10})
+
+
+def test_main(tmp_path, h5_files, capsys):
+    output_dir = str(tmp_path / "output")
+    _batch.main(["create", output_dir, *h5_files])
+    _batch.main(["run", output_dir, "--shard", "0", "--shards", "1"])
+    _batch.main(["run", output_dir])
+    captured = capsys.readouterr()
+    assert captured.out.count("up to date") == len(h5_files)
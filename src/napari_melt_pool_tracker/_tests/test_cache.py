@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from napari_melt_pool_tracker import _cache
+
+
+@pytest.fixture
+def results():
+    rng = np.random.default_rng(seed=0)
+    return {
+        "resliced": rng.random((5, 10, 20), dtype=np.float32),
+        "positions": pd.DataFrame(
+            {"Time frame": np.arange(5), "Laser position": np.arange(5) * 2}
+        ),
+        "coef": 1.5,
+    }
+
+
+def test_put_get(tmp_path, results):
+    cache = _cache.StepCache(tmp_path)
+    key = _cache.make_key("source", "reslice", {"window_size": 20})
+    assert cache.get(key) is None
+    cache.put(key, results)
+
+    cached = cache.get(key)
+    np.testing.assert_array_equal(cached["resliced"], results["resliced"])
+    assert cached["resliced"].dtype == np.float32
+    pd.testing.assert_frame_equal(cached["positions"], results["positions"])
+    assert cached["coef"] == 1.5
+
+    # Other parameters have a different key
+    other_key = _cache.make_key("source", "reslice", {"window_size": 30})
+    assert other_key != key
+    assert cache.get(other_key) is None
+
+
+def test_put_dask(tmp_path, results):
+    da = pytest.importorskip("dask.array")
+    cache = _cache.StepCache(tmp_path)
+    cache.put("key", {"resliced": da.from_array(results["resliced"], 2)})
+    np.testing.assert_array_equal(
+        cache.get("key")["resliced"], results["resliced"]
+    )
+
+
+def test_lru_eviction(tmp_path, results):
+    cache = _cache.StepCache(tmp_path)
+    cache.put("a", results)
+    size = (tmp_path / "a.h5").stat().st_size
+    cache.max_bytes = 2.5 * size
+    cache.put("b", results)
+    # Make sure "a" is older than "b" before reading it
+    os.utime(tmp_path / "a.h5", ns=(0, 0))
+    assert cache.get("a") is not None
+    cache.put("c", results)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_source_key(tmp_path):
+    path = tmp_path / "data.h5"
+    path.write_bytes(b"abc")
+    key = _cache.source_key(path, stride=2)
+    assert key == _cache.source_key(str(path), stride=2)
+    assert key != _cache.source_key(path, stride=3)
+    path.write_bytes(b"abcd")
+    assert key != _cache.source_key(path, stride=2)
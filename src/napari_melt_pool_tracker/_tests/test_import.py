@@ -0,0 +1,80 @@
+import subprocess
+import sys
+
+import pytest
+
+# Budget in seconds for the cumulative import time of a module reported
+# by `python -X importtime`. Most of it is spent importing numpy and
+# h5py. Importing napari, Qt or scikit-image exceeds it by far.
+IMPORT_TIME_BUDGET = 1.0
+
+MODULES = (
+    "napari_melt_pool_tracker",
+    "napari_melt_pool_tracker._utils",
+    "napari_melt_pool_tracker._reader",
+    "napari_melt_pool_tracker._batch",
+)
+
+# Modules that should only be imported when they are used
+DEFERRED_MODULES = (
+    "napari",
+    "qtpy",
+    "napari_cursor_tracker",
+    "pandas",
+    "scipy.ndimage",
+    "skimage.filters",
+    "tifffile",
+)
+
+
+def _import_time(module):
+    """
+    Cumulative import time of `module` in seconds, measured in a new
+    interpreter.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e6
+    raise ValueError(f"No import time found for {module}.")
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_import_time(module):
+    # The first import can include writing the bytecode cache
+    _import_time(module)
+    assert _import_time(module) < IMPORT_TIME_BUDGET
+
+
+def test_deferred_imports():
+    code = "\n".join(
+        [
+            "import sys",
+            *(f"import {module}" for module in MODULES),
+            "import napari_melt_pool_tracker._live",
+            "import napari_melt_pool_tracker._metrics",
+            "import napari_melt_pool_tracker._passes",
+            f"print(*(m for m in {DEFERRED_MODULES} if m in sys.modules))",
+        ]
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == ""
+
+
+def test_lazy_attributes():
+    import napari_melt_pool_tracker
+
+    assert callable(napari_melt_pool_tracker.napari_get_reader)
+    assert "MeltPoolTrackerQWidget" in dir(napari_melt_pool_tracker)
+    assert not hasattr(napari_melt_pool_tracker, "does_not_exist")
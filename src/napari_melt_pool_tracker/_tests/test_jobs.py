@@ -0,0 +1,180 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from napari_melt_pool_tracker import _batch, _jobs, _utils
+
+
+@pytest.fixture
+def stacks():
+    rng = np.random.default_rng(seed=0)
+    stacks = []
+    for speed in (2, 3, 4):
+        stack = rng.normal(loc=0.2, scale=0.02, size=(20, 30, 120))
+        stack[:, 15:] += 0.3
+        for t in range(20):
+            x = 10 + speed * t
+            stack[t, :8, x - 1 : x + 2] = 1
+        stacks.append(stack.astype(np.float32))
+    return stacks
+
+
+PARAMETERS = {
+    "window_offset": 10,
+    "window_size": 40,
+    "kernel_size": [3, 3, 3],
+    "backend": "numpy",
+}
+
+
+def test_run_steps(stacks):
+    outputs = _jobs.run_steps({"stack": stacks[0]}, PARAMETERS)
+    _, coef, intercept = _utils.determine_laser_speed_and_position(
+        stacks[0], "Default"
+    )
+    assert outputs["laser.json"] == {"coef": coef, "intercept": intercept}
+    resliced, positions = _utils.reslice_with_moving_window(
+        stacks[0], coef, intercept, window_offset=10, window_size=40
+    )
+    np.testing.assert_array_equal(outputs["resliced.npy"], resliced)
+    filtered = _utils.median_filter(resliced, (3, 3, 3))
+    np.testing.assert_array_equal(outputs["filtered.npy"], filtered)
+    np.testing.assert_array_equal(
+        outputs["radial_gradient.npy"],
+        _utils.calculate_radial_gradient(filtered, xpos=10),
+    )
+
+    # A single step on the input of that step
+    steps = []
+    filter_outputs = _jobs.run_steps(
+        {"resliced.npy": resliced},
+        PARAMETERS,
+        ["filter"],
+        progress=lambda: steps.append(True),
+    )
+    np.testing.assert_array_equal(filter_outputs["filtered.npy"], filtered)
+    assert steps == [True]
+
+    # The contrast limits of outputs are collected in the worker
+    outputs = _jobs.run_steps(
+        {"resliced.npy": resliced},
+        PARAMETERS,
+        ["filter"],
+        stats=["filtered.npy", "radial_gradient.npy"],
+    )
+    summary = outputs["filtered.npy_stats"]
+    assert tuple(summary["contrast_limits"]) == (
+        filtered.min(),
+        filtered.max(),
+    )
+    assert "radial_gradient.npy_stats" not in outputs
+
+
+def test_job_pool(stacks):
+    pool = _jobs.JobPool(max_workers=2)
+    futures = pool.submit_all(
+        [({"stack": stack}, PARAMETERS, None) for stack in stacks]
+    )
+    results = [future.result() for future in futures]
+    assert not pool.busy
+    assert pool.progress == (12, 12)
+    for stack, result in zip(stacks, results):
+        expected = _jobs.run_steps({"stack": stack}, PARAMETERS)
+        np.testing.assert_array_equal(
+            result["radial_gradient.npy"], expected["radial_gradient.npy"]
+        )
+
+    # The progress starts again for the next jobs
+    futures = pool.submit_all(
+        [
+            (
+                {"resliced.npy": results[0]["resliced.npy"]},
+                PARAMETERS,
+                ["filter"],
+            )
+        ]
+    )
+    futures[0].result()
+    assert pool.progress == (1, 1)
+    pool.shutdown()
+
+
+def test_job_pool_limit(monkeypatch):
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_step(outputs, parameters):
+        with lock:
+            running.append(True)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+        return {"slow": True}
+
+    monkeypatch.setitem(_batch.STEPS, "slow", slow_step)
+    pool = _jobs.JobPool(max_workers=2)
+    futures = pool.submit_all(
+        [({}, {"backend": "numpy"}, ["slow"]) for _ in range(6)]
+    )
+    assert all(future.result()["slow"] for future in futures)
+    assert max(peak) == 2
+
+    # A new limit applies to the next jobs
+    pool.max_workers = 1
+    peak.clear()
+    futures = pool.submit_all(
+        [({}, {"backend": "numpy"}, ["slow"]) for _ in range(3)]
+    )
+    [future.result() for future in futures]
+    assert max(peak) == 1
+    pool.shutdown()
+
+
+def test_job_pool_numba(stacks, monkeypatch):
+    pytest.importorskip("numba")
+    pool = _jobs.JobPool(max_workers=2)
+    parameters = {**PARAMETERS, "backend": "numba"}
+    futures = pool.submit_all(
+        [({"stack": stack}, parameters, None) for stack in stacks[:2]]
+    )
+    for future, stack in zip(futures, stacks):
+        np.testing.assert_array_equal(
+            future.result()["radial_gradient.npy"],
+            _jobs.run_steps({"stack": stack}, PARAMETERS)[
+                "radial_gradient.npy"
+            ],
+        )
+    assert pool.progress == (8, 8)
+
+    # The jobs run one after the other, but not in the calling thread
+    running = []
+    peak = []
+    threads = set()
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def slow_step(outputs, parameters):
+        release.wait(timeout=10)
+        with lock:
+            running.append(True)
+            peak.append(len(running))
+            threads.add(threading.get_ident())
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+        return {"slow": True}
+
+    monkeypatch.setitem(_batch.STEPS, "slow", slow_step)
+    futures = pool.submit_all([({}, parameters, ["slow"]) for _ in range(4)])
+    # Submitting returns before the jobs are done
+    assert not any(future.done() for future in futures)
+    release.set()
+    assert all(future.result()["slow"] for future in futures)
+    assert max(peak) == 1
+    assert threads and threading.get_ident() not in threads
+    assert len(threads) == 1
+    pool.shutdown()
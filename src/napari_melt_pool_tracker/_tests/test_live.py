@@ -0,0 +1,110 @@
+import h5py
+import numpy as np
+import pytest
+
+from napari_melt_pool_tracker import _live, _utils
+
+
+@pytest.fixture
+def stack():
+    rng = np.random.default_rng(seed=0)
+    stack = rng.normal(loc=0.3, scale=0.05, size=(40, 30, 50))
+    stack[:, :12] += 0.7
+    return stack.astype(np.float32)
+
+
+def _append(dataset, frames):
+    dataset.resize(dataset.shape[0] + len(frames), axis=0)
+    dataset[-len(frames) :] = frames
+
+
+@pytest.mark.parametrize("swmr", [False, True])
+def test_live_processing(tmp_path, stack, swmr):
+    path = str(tmp_path / "live.h5")
+    f = h5py.File(path, "w", libver="latest")
+    dataset = f.create_dataset(
+        "image_stack",
+        shape=(0,) + stack.shape[1:],
+        maxshape=(None,) + stack.shape[1:],
+        dtype=stack.dtype,
+    )
+    if swmr:
+        f.swmr_mode = True
+    else:
+        f.close()
+
+    parameters = {
+        "coef": 1.5,
+        "intercept": -10,
+        "window_offset": 8,
+        "window_size": 20,
+    }
+    follower = _live.H5Follower(path)
+    processor = _live.LiveProcessor(
+        **parameters, kernel_size=(5, 3, 3), threshold=0.65
+    )
+    results = {
+        name: _live.GrowingStack()
+        for name in ("resliced", "filtered", "radial_gradient")
+    }
+    positions = []
+    for start in range(0, len(stack), 7):
+        frames = stack[start : start + 7]
+        if swmr:
+            _append(dataset, frames)
+            dataset.flush()
+        else:
+            with h5py.File(path, "a") as writer:
+                _append(writer["image_stack"], frames)
+        new = processor.process(follower.read_new_frames())
+        for name, growing_stack in results.items():
+            growing_stack.append(new[name])
+        positions.append(new["positions"])
+    for name, frames in processor.finish().items():
+        results[name].append(frames)
+    if swmr:
+        f.close()
+
+    expected_resliced, expected_positions = _utils.reslice_with_moving_window(
+        stack, **parameters
+    )
+    expected_filtered = _utils.median_filter(expected_resliced, (5, 3, 3))
+    expected_radial_gradient = _utils.calculate_radial_gradient(
+        expected_filtered,
+        xpos=8,
+        material_surface=_utils.estimate_material_surface(
+            expected_filtered, 0.65
+        ),
+    )
+    np.testing.assert_array_equal(results["resliced"].data, expected_resliced)
+    np.testing.assert_array_equal(results["filtered"].data, expected_filtered)
+    np.testing.assert_array_equal(
+        results["radial_gradient"].data, expected_radial_gradient
+    )
+    positions = np.concatenate([p.to_numpy() for p in positions])
+    np.testing.assert_array_equal(positions, expected_positions.to_numpy())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 6])
+def test_streaming_median_filter(stack, chunk_size):
+    kernel_size = (7, 3, 1)
+    streaming = _utils.StreamingMedianFilter(kernel_size)
+    chunks = []
+    for start in range(0, len(stack), chunk_size):
+        chunks.append(streaming.push(stack[start : start + chunk_size]))
+        # Only the halo of the kernel is kept between chunks
+        assert len(streaming.buffer) < chunk_size + kernel_size[0] * 2
+    chunks.append(streaming.flush())
+    np.testing.assert_array_equal(
+        np.concatenate(chunks), _utils.median_filter(stack, kernel_size)
+    )
+
+
+def test_growing_stack():
+    growing_stack = _live.GrowingStack()
+    assert growing_stack.data is None
+    frames = np.arange(5 * 2 * 3).reshape(5, 2, 3)
+    for i in range(len(frames)):
+        growing_stack.append(frames[i : i + 1])
+    growing_stack.append(frames[:0])
+    np.testing.assert_array_equal(growing_stack.data, frames)
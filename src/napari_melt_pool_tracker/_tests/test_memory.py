@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from napari_melt_pool_tracker import _memory, _utils
+
+
+@pytest.fixture
+def stack():
+    rng = np.random.default_rng(seed=0)
+    stack = rng.integers(0, 1000, size=(20, 100, 120), dtype=np.uint16)
+    stack[:, 60:] += 2000
+    return stack
+
+
+def _peak_memory(func):
+    tracemalloc = pytest.importorskip("tracemalloc")
+    # Run once so imports and caches do not count
+    func()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def test_median_filter_estimate(stack):
+    peak = _peak_memory(lambda: _utils.median_filter(stack, (7, 3, 3)))
+    memory = _memory.median_filter_memory(stack.shape, stack.dtype, (7, 3, 3))
+    assert 0.8 * memory.in_memory < peak < 1.2 * memory.in_memory
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+@pytest.mark.parametrize("with_surface", [True, False])
+def test_radial_gradient_estimate(stack, dtype, with_surface):
+    surface = None if with_surface else _utils.estimate_material_surface(stack)
+    peak = _peak_memory(
+        lambda: _utils.calculate_radial_gradient(
+            stack, xpos=60, material_surface=surface, dtype=dtype
+        )
+    )
+    memory = _memory.radial_gradient_memory(
+        stack.shape, stack.dtype, dtype, with_surface=with_surface
+    )
+    assert 0.8 * memory.in_memory < peak < 1.2 * memory.in_memory
+
+
+def test_plan(monkeypatch):
+    memory = _memory.MemoryEstimate(
+        100, result_bytes=10, temporary_bytes=40, input_bytes=10, halo=2
+    )
+    assert memory.plan(5000) == (_memory.IN_MEMORY, None, 5000)
+
+    # The result takes 1000 bytes and every frame of a chunk 60 bytes
+    strategy, frames, estimate = memory.plan(2000)
+    assert strategy == _memory.CHUNKED
+    assert frames == 14
+    assert estimate == memory.chunked(frames) <= 2000
+
+    # Not even the result fits
+    monkeypatch.setattr(_memory.os, "cpu_count", lambda: 2)
+    monkeypatch.setattr(_memory, "dask_available", lambda: True)
+    strategy, frames, estimate = memory.plan(900)
+    assert strategy == _memory.OUT_OF_CORE
+    assert frames == 5
+    assert estimate == memory.out_of_core(frames) <= 900
+
+    # Without dask the step runs in chunks even beyond the budget
+    monkeypatch.setattr(_memory, "dask_available", lambda: False)
+    strategy, frames, estimate = memory.plan(900)
+    assert strategy == _memory.CHUNKED
+    assert frames == 1
+    assert estimate > 900
+
+
+def test_describe():
+    text = _memory.describe(_memory.CHUNKED, 14, 2 * 2**30, 4 * 2**30)
+    assert text == "Peak memory ~2.00 GB: chunked (14 frames per chunk)"
+    text = _memory.describe(_memory.IN_MEMORY, None, 2 * 2**30, 2**29)
+    assert text.endswith("in memory, exceeds the budget of 512.0 MB")
+
+
+def test_as_dask(stack):
+    pytest.importorskip("dask.array")
+    lazy = _memory.as_dask(stack, 6)
+    assert lazy.chunks[0] == (6, 6, 6, 2)
+    filtered = _utils.median_filter(lazy, (3, 3, 3))
+    np.testing.assert_array_equal(
+        filtered.compute(), _utils.median_filter(stack, (3, 3, 3))
+    )
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from napari_melt_pool_tracker import _metrics, _utils
+
+
+@pytest.fixture
+def positions():
+    stack = np.zeros((10, 20, 100))
+    _, positions = _utils.reslice_with_moving_window(
+        stack, coef=5, intercept=-30, window_offset=10, window_size=30
+    )
+    return positions
+
+
+@pytest.fixture
+def boundary():
+    """
+    A 4 x 6 rectangle at the laser position in every frame, with the
+    vertices of the frames interleaved.
+    """
+    corners = np.array([[2, 10], [6, 10], [6, 16], [2, 16]])
+    points = [(t, y, x) for y, x in corners for t in range(10) if t != 5]
+    return np.array(points, dtype=float)
+
+
+def test_to_original_coordinates(positions, boundary):
+    points = _metrics.to_original_coordinates(boundary, positions, 10)
+    # Frames 0 and 1 have no window
+    assert set(points["Time frame"]) == set(range(2, 10)) - {5}
+    expected_x = boundary[:, 2] + 5 * boundary[:, 0] - 30 - 10
+    valid = boundary[:, 0] >= 2
+    np.testing.assert_array_equal(points["x"], expected_x[valid])
+    np.testing.assert_array_equal(points["y"], boundary[valid, 1])
+
+
+def test_to_original_coordinates_compact(positions, boundary):
+    _, compact_positions = _utils.reslice_with_moving_window(
+        np.zeros((10, 20, 100)),
+        coef=5,
+        intercept=-30,
+        window_offset=10,
+        window_size=30,
+        compact=True,
+    )
+    # Frame 0 of the compact stack is time frame 2
+    compact_boundary = boundary[boundary[:, 0] >= 2]
+    compact_boundary[:, 0] -= 2
+    points = _metrics.to_original_coordinates(
+        compact_boundary, compact_positions, 10
+    )
+    expected = _metrics.to_original_coordinates(boundary, positions, 10)
+    assert points.equals(expected)
+
+
+def test_frame_metrics(positions, boundary):
+    metrics = _metrics.frame_metrics(boundary, positions, 10)
+    np.testing.assert_array_equal(metrics["Time frame"], [2, 3, 4, 6, 7, 8, 9])
+    np.testing.assert_array_equal(metrics["Depth"], 4)
+    np.testing.assert_array_equal(metrics["Length"], 6)
+    np.testing.assert_array_equal(metrics["Area"], 24)
+    # The melt pool moves with the laser
+    np.testing.assert_allclose(metrics["Velocity"], 5)
+    np.testing.assert_array_equal(
+        metrics["Centroid x"], metrics["Laser position"] + 3
+    )
+
+    surface = np.ones(len(positions))
+    metrics = _metrics.frame_metrics(boundary, positions, 10, surface)
+    np.testing.assert_array_equal(metrics["Depth"], 5)
+
+    empty = _metrics.frame_metrics(np.empty((0, 3)), positions, 10)
+    assert len(empty) == 0
+
+
+def test_run_metrics(positions, boundary):
+    metrics = _metrics.frame_metrics(boundary, positions, 10)
+    summary = _metrics.run_metrics(metrics)
+    assert len(summary) == 1
+    assert summary["Frames"][0] == 7
+    assert summary["Area mean"][0] == 24
+
+    runs = pd.concat(
+        [metrics.assign(Run="a"), metrics.iloc[:3].assign(Run="b")]
+    )
+    summary = _metrics.run_metrics(runs)
+    assert list(summary["Run"]) == ["a", "b"]
+    assert list(summary["Frames"]) == [7, 3]
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet", ".feather"])
+def test_export_metrics(tmp_path, positions, boundary, suffix):
+    if suffix != ".csv":
+        pytest.importorskip("pyarrow")
+    metrics = _metrics.frame_metrics(boundary, positions, 10)
+    path = tmp_path / f"metrics{suffix}"
+    _metrics.export_metrics({"run_0": metrics, "run_1": metrics}, path)
+    read = {
+        ".csv": pd.read_csv,
+        ".parquet": pd.read_parquet,
+        ".feather": pd.read_feather,
+    }[suffix]
+    exported = read(path)
+    assert len(exported) == 2 * len(metrics)
+    assert list(exported["Run"].unique()) == ["run_0", "run_1"]
+    np.testing.assert_allclose(
+        exported[list(_metrics.FRAME_METRICS)].to_numpy(dtype=float),
+        pd.concat([metrics, metrics])[list(_metrics.FRAME_METRICS)],
+    )
+
+    with pytest.raises(ValueError):
+        _metrics.export_metrics(metrics, tmp_path / "metrics.txt")
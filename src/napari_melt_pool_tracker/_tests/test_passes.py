@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from napari_melt_pool_tracker import _passes, _utils
+
+
+@pytest.fixture
+def stack():
+    """
+    Two passes in opposite directions with a pause in between.
+    """
+    rng = np.random.default_rng(seed=0)
+    stack = rng.normal(loc=0.2, scale=0.02, size=(70, 20, 90))
+    stack[:, 12:] += 0.3
+    for t in range(5, 25):
+        x = 10 + 3 * (t - 5)
+        stack[t, :6, x - 1 : x + 2] = 1
+    for t in range(40, 60):
+        x = 80 - 3 * (t - 40)
+        stack[t, :6, x - 1 : x + 2] = 1
+    return stack.astype(np.float32)
+
+
+def test_detect_passes(stack):
+    proj_resliced, _, _ = _utils.determine_laser_speed_and_position(
+        stack, "Default"
+    )
+    passes = _passes.detect_passes(proj_resliced)
+    assert len(passes) == 2
+    np.testing.assert_array_equal(passes["First frame"], [5, 40])
+    np.testing.assert_array_equal(passes["Last frame"], [24, 59])
+    np.testing.assert_array_equal(passes["Direction"], [1, -1])
+    np.testing.assert_allclose(passes["Coef"], [3, -3], atol=0.1)
+
+    # Lines through the first and last laser positions give
+    # the same passes
+    lines = [
+        np.array([[10, 5], [67, 24]]),
+        np.array([[80, 40], [23, 59]]),
+    ]
+    from_lines = _passes.passes_from_lines(lines)
+    np.testing.assert_array_equal(
+        from_lines[["First frame", "Last frame", "Direction"]],
+        passes[["First frame", "Last frame", "Direction"]],
+    )
+    np.testing.assert_allclose(from_lines["Coef"], [3, -3])
+
+
+def test_detect_passes_without_laser():
+    proj_resliced = np.ones((50, 30))
+    assert len(_passes.detect_passes(proj_resliced)) == 0
+
+
+def test_process_passes(stack):
+    proj_resliced, _, _ = _utils.determine_laser_speed_and_position(
+        stack, "Default"
+    )
+    passes = _passes.detect_passes(proj_resliced)
+    parameters = {
+        "window_offset": 10,
+        "window_size": 30,
+        "kernel_size": (3, 3, 3),
+    }
+    results = _passes.process_passes(
+        stack, passes, **parameters, max_workers=2
+    )
+    assert len(results) == len(passes)
+    for (_, laser_pass), result in zip(passes.iterrows(), results):
+        expected = _passes.process_pass(stack, laser_pass, **parameters)
+        for name in ("resliced", "filtered", "radial_gradient"):
+            np.testing.assert_array_equal(result[name], expected[name])
+        positions = result["positions"]
+        assert positions["Time frame"].iloc[0] == laser_pass["First frame"]
+        assert len(result["resliced"]) == (
+            laser_pass["Last frame"] - laser_pass["First frame"] + 1
+        )
+        # The laser stays at the same column of the mirrored window
+        laser_column = positions["Laser position"] - (
+            positions["Window start"]
+        )
+        offset = 10 if laser_pass["Direction"] == 1 else 20
+        assert np.all(laser_column[positions["Window start"] > 0] == offset)
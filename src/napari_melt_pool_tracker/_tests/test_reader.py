@@ -3,7 +3,8 @@ import numpy
 import numpy as np
 import pytest
 
-from napari_melt_pool_tracker import napari_get_reader
+from napari_melt_pool_tracker import _cache, _reader, _utils, napari_get_reader
+from napari_melt_pool_tracker._reader import read_stack
 
 
 @pytest.fixture(params=[0, 1, 2])
@@ -70,6 +71,12 @@ def test_reader(random_h5_file):
     # make sure it's the same as it started
     np.testing.assert_allclose(original_data, layer_data_tuple[0])
 
+    # The contrast limits are collected while reading
+    assert layer_data_tuple[1]["contrast_limits"] == (
+        original_data.min(),
+        original_data.max(),
+    )
+
     # Image stacks are not supported and one h5 file should be loaded at a time
     with pytest.raises(ValueError):
         napari_get_reader([test_file, test_file])
@@ -78,3 +85,109 @@ def test_reader(random_h5_file):
 def test_get_reader_pass():
     reader = napari_get_reader("fake.file")
     assert reader is None
+
+
+@pytest.fixture
+def h5_stack_file(tmp_path, beamline):
+    rng = numpy.random.default_rng(seed=0)
+    original_data = rng.integers(
+        low=0, high=2**14, size=(30, 21, 26), dtype=np.uint16
+    )
+    test_file = str(tmp_path / "test_stack.h5")
+    with h5py.File(test_file, "w") as f:
+        if beamline == "TOMCAT":
+            f.create_group("exchange").create_dataset(
+                "data", data=original_data
+            )
+        elif beamline == "ID19":
+            f.create_dataset("image_stack", data=original_data)
+    return original_data, test_file
+
+
+def test_read_stack(h5_stack_file):
+    original_data, test_file = h5_stack_file
+
+    stack = read_stack(test_file)
+    np.testing.assert_array_equal(stack, original_data)
+
+    stack = read_stack(
+        test_file, time_range=(3, 20), stride=4, roi=(2, 15, 5, 100)
+    )
+    assert stack.dtype == original_data.dtype
+    np.testing.assert_array_equal(stack, original_data[3:20:4, 2:15, 5:])
+
+    stack = read_stack(
+        test_file,
+        time_range=(1, 29),
+        stride=3,
+        roi=(1, 20, 0, 26),
+        binning=4,
+        frames_per_read=2,
+    )
+    expected = original_data[1:29:3, 1:17, :24].reshape(10, 4, 4, 6, 4)
+    expected = expected.mean(axis=(2, 4))
+    assert stack.dtype == np.float32
+    np.testing.assert_allclose(stack, expected)
+
+    with pytest.raises(ValueError):
+        read_stack(test_file, time_range=(40, 50))
+    with pytest.raises(ValueError):
+        read_stack(test_file, stride=0)
+
+
+@pytest.fixture
+def flat_field_file(tmp_path):
+    rng = numpy.random.default_rng(seed=0)
+    dark = rng.integers(90, 110, size=(3, 21, 26), dtype=np.uint16)
+    white = rng.integers(900, 1100, size=(5, 21, 26), dtype=np.uint16)
+    # A dead pixel that is not brighter in the flat field
+    white[:, 0, 0] = dark[:, 0, 0].mean()
+    data = rng.integers(100, 1000, size=(30, 21, 26), dtype=np.uint16)
+    test_file = str(tmp_path / "flat_field.h5")
+    with h5py.File(test_file, "w") as f:
+        group = f.create_group("exchange")
+        group.create_dataset("data", data=data)
+        group.create_dataset("data_white", data=white)
+        group.create_dataset("data_dark", data=dark)
+    mean_dark = dark.mean(axis=0)
+    difference = white.mean(axis=0) - mean_dark
+    difference[0, 0] = np.inf
+    expected = (data - mean_dark) / difference
+    return expected, test_file
+
+
+def test_read_stack_flat_field(flat_field_file):
+    expected, test_file = flat_field_file
+
+    stack = read_stack(test_file, flat_field=True, frames_per_read=4)
+    assert stack.dtype == np.float32
+    np.testing.assert_allclose(stack, expected, rtol=1e-5)
+
+    # The frames are corrected before binning
+    stack = read_stack(
+        test_file,
+        time_range=(1, 29),
+        stride=3,
+        roi=(1, 20, 0, 26),
+        binning=4,
+        flat_field=True,
+    )
+    binned = expected[1:29:3, 1:17, :24].reshape(10, 4, 4, 6, 4)
+    np.testing.assert_allclose(stack, binned.mean(axis=(2, 4)), rtol=1e-5)
+
+
+def test_flat_field_reader(flat_field_file, h5_stack_file):
+    expected, test_file = flat_field_file
+    reader = _reader.napari_get_flat_field_reader(test_file)
+    data, add_kwargs, _ = reader(test_file)[0]
+    if _reader.importlib.util.find_spec("dask") is not None:
+        assert _utils.is_dask_array(data)
+        assert data.chunks[0] == (16, 14)
+    np.testing.assert_allclose(np.asarray(data), expected, rtol=1e-5)
+    assert add_kwargs["metadata"]["cache_key"] != _cache.source_key(test_file)
+
+    # Files without flat and dark fields
+    _, test_file = h5_stack_file
+    assert _reader.napari_get_flat_field_reader(test_file) is None
+    with h5py.File(test_file, "r") as f, pytest.raises(ValueError):
+        _reader.read_flat_field(f)
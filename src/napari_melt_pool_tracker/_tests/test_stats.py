@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from napari_melt_pool_tracker import _stats
+
+
+@pytest.fixture
+def stack():
+    rng = np.random.default_rng(seed=0)
+    return rng.normal(loc=10, scale=2, size=(40, 60, 70)).astype(np.float32)
+
+
+def test_running_stats(stack):
+    stats = _stats.RunningStats()
+    for start in range(0, len(stack), 7):
+        stats.update(stack[start : start + 7])
+    assert stats.contrast_limits == (stack.min(), stack.max())
+    # The samples are bounded and evenly spaced
+    assert sum(map(len, stats.samples)) <= _stats.MAX_SAMPLES
+    counts, edges = stats.histogram()
+    expected, _ = np.histogram(stack, bins=edges)
+    assert len(counts) == _stats.HISTOGRAM_BINS
+    assert abs(counts.sum() - stack.size) < 0.01 * stack.size
+    np.testing.assert_allclose(counts, expected, rtol=0.2, atol=500)
+
+
+def test_running_stats_special_values():
+    stats = _stats.RunningStats()
+    assert stats.contrast_limits == (0, 1)
+    stats.update(np.full((2, 3, 3), np.nan))
+    assert stats.contrast_limits == (0, 1)
+    stats.update(np.full((2, 3, 3), 5.0))
+    assert stats.contrast_limits == (5, 6)
+    frames = np.array([[[1, np.nan], [3, 4]]])
+    stats.update(frames)
+    assert stats.contrast_limits == (1, 5)
+    assert stats.histogram()[0].sum() == 21
+
+
+def test_image_stats(stack):
+    stats = _stats.image_stats(stack)
+    assert stats.contrast_limits == (stack.min(), stack.max())
+
+    # Lazy stacks are sampled
+    da = pytest.importorskip("dask.array")
+    lazy = da.from_array(stack, chunks=(1, -1, -1))
+    stats = _stats.image_stats(lazy)
+    frames = np.linspace(0, 39, _stats.SAMPLE_FRAMES).round().astype(int)
+    assert stats.contrast_limits == (
+        stack[frames].min(),
+        stack[frames].max(),
+    )
+
+
+def test_layer_kwargs(stack):
+    summary = _stats.image_stats(stack).summary()
+    kwargs = _stats.layer_kwargs(summary, {"cache_key": "key"})
+    assert kwargs["contrast_limits"] == (stack.min(), stack.max())
+    assert kwargs["metadata"]["cache_key"] == "key"
+    counts, edges = kwargs["metadata"]["histogram"]
+    assert len(edges) == len(counts) + 1
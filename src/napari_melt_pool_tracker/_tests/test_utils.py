@@ -71,3 +71,652 @@ def test_reslice_with_moving_window(
         assert result.shape[0] == stack.shape[0]
         assert result.shape[1] == stack.shape[1]
         assert result.shape[2] == window_size
+
+
+@pytest.fixture(params=[1, 2**14])
+def background_value(request):
+    return request.param
+
+
+def test_estimate_material_surface(seed, background_value):
+    rng = np.random.default_rng(seed=seed)
+    n_t, height, width = 5, 40, 30
+    expected = rng.integers(low=5, high=35, size=(n_t, width))
+    rows = np.arange(height)[np.newaxis, :, np.newaxis]
+    stack = np.where(
+        rows < expected[:, np.newaxis, :],
+        background_value,
+        0.3 * background_value,
+    )
+    stack = stack + rng.normal(scale=0.03 * background_value, size=stack.shape)
+
+    surface = _utils.estimate_material_surface(stack)
+    assert surface.shape == (n_t, width)
+    np.testing.assert_array_equal(surface, expected)
+
+
+def test_calculate_radial_gradient_reuses_material_surface():
+    stack = np.zeros((4, 30, 20))
+    stack[:, :12, :] = 1
+    surface = _utils.estimate_material_surface(stack)
+    np.testing.assert_array_equal(surface, 12)
+
+    expected = _utils.calculate_radial_gradient(stack, xpos=10)
+    result = _utils.calculate_radial_gradient(
+        stack, xpos=10, material_surface=surface
+    )
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_resolve_backend():
+    assert _utils.resolve_backend("numpy") == "numpy"
+    assert _utils.resolve_backend("auto") in ("numpy", "numba")
+    with pytest.raises(ValueError):
+        _utils.resolve_backend("cuda")
+
+
+@pytest.fixture(params=[np.uint16, np.float64])
+def dtype(request):
+    return request.param
+
+
+@pytest.fixture
+def random_stack(seed, dtype):
+    rng = np.random.default_rng(seed=seed)
+    stack = rng.integers(low=0, high=2**12, size=(6, 20, 30))
+    return stack.astype(dtype)
+
+
+@pytest.mark.parametrize("coef,intercept", [(3, -10), (-4, 25), (0.5, 2)])
+def test_reslice_with_moving_window_numba(random_stack, coef, intercept):
+    pytest.importorskip("numba")
+    expected, expected_positions = _utils.reslice_with_moving_window(
+        random_stack, coef, intercept, 5, 12, backend="numpy"
+    )
+    result, positions = _utils.reslice_with_moving_window(
+        random_stack, coef, intercept, 5, 12, backend="numba"
+    )
+    assert result.dtype == expected.dtype
+    np.testing.assert_array_equal(result, expected)
+    assert positions.equals(expected_positions)
+
+
+@pytest.mark.parametrize("method", ["sobel", "prewitt", "scharr", "farid"])
+def test_radial_gradient_numba(random_stack, method):
+    pytest.importorskip("numba")
+    center = np.stack((np.arange(6) + 0.5, np.full(6, 10.5)), axis=-1)
+    expected = _utils.radial_gradient(
+        random_stack, center, method=method, backend="numpy", dtype=np.float64
+    )
+    result = _utils.radial_gradient(
+        random_stack, center, method=method, backend="numba", dtype=np.float64
+    )
+    for array, expected_array in zip(result, expected):
+        np.testing.assert_allclose(array, expected_array, atol=1e-10)
+
+
+@pytest.mark.parametrize("kernel_size", [(1, 1, 1), (3, 3, 3), (7, 2, 4)])
+def test_median_filter_numba(random_stack, kernel_size):
+    pytest.importorskip("numba")
+    expected = _utils.median_filter(random_stack, kernel_size, "numpy")
+    result = _utils.median_filter(random_stack, kernel_size, "numba")
+    assert result.dtype == expected.dtype
+    np.testing.assert_array_equal(result, expected)
+
+
+@pytest.mark.parametrize("mode", ["Default", "Pre mean", "Post median"])
+def test_determine_laser_speed_and_position_dtype(random_stack, mode):
+    proj_resliced, _, _ = _utils.determine_laser_speed_and_position(
+        random_stack + 1, mode
+    )
+    if mode == "Default":
+        assert proj_resliced.dtype == random_stack.dtype
+    else:
+        assert proj_resliced.dtype == np.float32
+
+
+@pytest.mark.parametrize(
+    "speed,start", [(3, 10), (-2.5, 250), (1.3, -20), (0.4, 100)]
+)
+def test_estimate_laser_speed_phase_correlation(speed, start):
+    # A faint spot moving over a noisy image with a static edge
+    rng = np.random.default_rng(seed=0)
+    stack = rng.normal(100, 10, size=(100, 40, 300))
+    stack[:, 25:] += 30
+    x = np.arange(300)
+    for t in range(100):
+        stack[t, 10:20] += 30 * np.exp(-(((x - speed * t - start) / 4) ** 2))
+    stack = stack.astype(np.uint16)
+
+    coef, intercept = _utils.estimate_laser_speed_phase_correlation(stack)
+    assert coef == pytest.approx(speed, abs=0.05)
+    # The laser position of every frame is within two pixels
+    times = np.arange(100)
+    np.testing.assert_allclose(
+        coef * times + intercept, speed * times + start, atol=2
+    )
+    _, mode_coef, mode_intercept = _utils.determine_laser_speed_and_position(
+        stack, "Phase correlation"
+    )
+    assert (mode_coef, mode_intercept) == (coef, intercept)
+
+    da = pytest.importorskip("dask.array")
+    lazy = da.from_array(stack, chunks=(10, 40, 300))
+    assert _utils.estimate_laser_speed_phase_correlation(lazy) == (
+        pytest.approx(coef),
+        pytest.approx(intercept),
+    )
+
+    with pytest.raises(ValueError):
+        _utils.estimate_laser_speed_phase_correlation(stack[:1])
+
+
+@pytest.mark.parametrize("backend", ["numpy", "numba"])
+def test_dtypes(random_stack, backend):
+    if backend == "numba":
+        pytest.importorskip("numba")
+    resliced, _ = _utils.reslice_with_moving_window(
+        random_stack, 3, 0, 5, 12, backend=backend
+    )
+    assert resliced.dtype == random_stack.dtype
+    filtered = _utils.median_filter(random_stack, (3, 3, 3), backend)
+    assert filtered.dtype == random_stack.dtype
+    assert _utils.estimate_material_surface(random_stack).dtype.kind == "i"
+    for dtype in (np.float32, np.float64):
+        rad_grad, angles = _utils.radial_gradient(
+            random_stack,
+            np.ones((random_stack.shape[0], 2)),
+            backend=backend,
+            dtype=dtype,
+        )
+        assert rad_grad.dtype == dtype
+        assert angles.dtype == dtype
+
+
+def test_radial_gradient_memory():
+    """
+    Compares the peak memory of the radial gradient with float32
+    and float64 on a stack with the size of a typical resliced run.
+    """
+    tracemalloc = pytest.importorskip("tracemalloc")
+    stack = np.ones((50, 256, 400), dtype=np.uint16)
+    center = np.ones((stack.shape[0], 2))
+    peaks = {}
+    for dtype in (np.float32, np.float64):
+        tracemalloc.start()
+        _utils.calculate_radial_gradient(stack, xpos=200, dtype=dtype)
+        peaks[dtype] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    assert peaks[np.float32] < 0.6 * peaks[np.float64]
+    rad_grad, _ = _utils.radial_gradient(stack, center)
+    assert rad_grad.nbytes == 2 * stack.nbytes
+
+
+@pytest.fixture
+def dask_stack(random_stack):
+    da = pytest.importorskip("dask.array")
+    return da.from_array(random_stack, chunks=(2, 10, 30))
+
+
+@pytest.mark.parametrize("mode", ["Default", "Pre mean", "Post median"])
+def test_determine_laser_speed_and_position_dask(
+    random_stack, dask_stack, mode
+):
+    expected, _, _ = _utils.determine_laser_speed_and_position(
+        random_stack + 1, mode
+    )
+    result, _, _ = _utils.determine_laser_speed_and_position(
+        dask_stack + 1, mode
+    )
+    assert _utils.is_dask_array(result)
+    np.testing.assert_allclose(result.compute(), expected, rtol=1e-6)
+
+
+def test_reslice_with_moving_window_dask(random_stack, dask_stack):
+    expected, expected_positions = _utils.reslice_with_moving_window(
+        random_stack, 3, -10, 5, 12
+    )
+    result, positions = _utils.reslice_with_moving_window(
+        dask_stack, 3, -10, 5, 12
+    )
+    assert _utils.is_dask_array(result)
+    np.testing.assert_array_equal(result.compute(), expected)
+    assert positions.equals(expected_positions)
+
+
+@pytest.mark.parametrize("backend", ["numpy", "numba", "dask"])
+def test_reslice_with_moving_window_compact(backend):
+    if backend == "numba":
+        pytest.importorskip("numba")
+    rng = np.random.default_rng(seed=0)
+    stack = rng.integers(0, 2**12, size=(20, 10, 60), dtype=np.uint16)
+    expected, expected_positions = _utils.reslice_with_moving_window(
+        stack, 5, -30, 5, 12
+    )
+    if backend == "dask":
+        da = pytest.importorskip("dask.array")
+        stack = da.from_array(stack, chunks=(4, 10, 60))
+    result, positions = _utils.reslice_with_moving_window(
+        stack,
+        5,
+        -30,
+        5,
+        12,
+        backend="numpy" if backend == "dask" else backend,
+        compact=True,
+    )
+    # Only frames 5 to 18 overlap the image
+    frames = np.arange(5, 19)
+    assert len(result) == len(frames)
+    np.testing.assert_array_equal(np.asarray(result), expected[frames])
+    np.testing.assert_array_equal(
+        positions["Resliced frame"], np.arange(len(frames))
+    )
+    assert positions.drop(columns="Resliced frame").equals(expected_positions)
+
+
+@pytest.mark.parametrize("interpolation", ["linear", "cubic"])
+@pytest.mark.parametrize("backend", ["numpy", "numba", "dask"])
+def test_reslice_subpixel(interpolation, backend):
+    if backend == "numba":
+        pytest.importorskip("numba")
+    kernel_backend = "numpy" if backend == "dask" else backend
+    rng = np.random.default_rng(seed=0)
+    stack = rng.integers(0, 2**12, size=(20, 30, 60), dtype=np.uint16)
+    # Whole pixel positions give the same windows as rounding
+    expected, _ = _utils.reslice_with_moving_window(stack, 3, -10, 5, 12)
+    result, _ = _utils.reslice_with_moving_window(
+        stack,
+        3,
+        -10,
+        5,
+        12,
+        backend=kernel_backend,
+        interpolation=interpolation,
+    )
+    assert result.dtype == _utils.DEFAULT_DTYPE
+    np.testing.assert_array_equal(result, expected)
+
+    # A peak moving by 0.3 pixels per frame stays in place
+    x = np.arange(60)
+    stack = np.stack(
+        [
+            np.broadcast_to(
+                1000 * np.exp(-(((x - 20 - 0.3 * t) / 5) ** 2)), (30, 60)
+            )
+            for t in range(50)
+        ]
+    )
+    if backend == "dask":
+        da = pytest.importorskip("dask.array")
+        stack = da.from_array(stack, chunks=(7, 30, 60))
+    result, positions = _utils.reslice_with_moving_window(
+        stack,
+        0.3,
+        20,
+        10,
+        30,
+        backend=kernel_backend,
+        interpolation=interpolation,
+    )
+    result = np.asarray(result)[:, 0]
+    centers = np.sum(result * np.arange(30), axis=1) / np.sum(result, axis=1)
+    # Rounding the positions makes the peak jitter by a pixel
+    assert np.ptp(centers) < 0.01
+    np.testing.assert_allclose(centers, 10, atol=0.05)
+    np.testing.assert_allclose(
+        positions["Laser position"], 20 + 0.3 * np.arange(50)
+    )
+    np.testing.assert_array_equal(
+        positions["Window start"], np.floor(20 + 0.3 * np.arange(50)) - 10
+    )
+
+    with pytest.raises(ValueError):
+        _utils.reslice_with_moving_window(
+            stack, 0.3, 20, 10, 30, interpolation="nearest"
+        )
+
+
+def test_laser_positions_from_points():
+    # Two points give the straight line
+    coef, intercept = _utils.determine_laser_speed_and_position_from_points(
+        (10, 2), (40, 8)
+    )
+    np.testing.assert_allclose(
+        _utils.laser_positions_from_points([(10, 2), (40, 8)], 12),
+        coef * np.arange(12) + intercept,
+    )
+
+    # The laser pauses between frames 4 and 8 and the segments are
+    # extended before the first and after the last vertex
+    points = [(30, 4), (10, 0), (30, 8), (50, 12), (54, 12)]
+    np.testing.assert_allclose(
+        _utils.laser_positions_from_points(points, 16),
+        [
+            10,
+            15,
+            20,
+            25,
+            30,
+            30,
+            30,
+            30,
+            30,
+            35.5,
+            41,
+            46.5,
+            52,
+            57.5,
+            63,
+            68.5,
+        ],
+    )
+
+    # A smoothing spline through points on a parabola
+    times = np.arange(0, 20, 4)
+    positions = _utils.laser_positions_from_points(
+        np.stack([times**2 / 4, times], axis=1), 20, smoothing=0
+    )
+    np.testing.assert_allclose(positions, np.arange(20) ** 2 / 4, atol=1e-9)
+
+    with pytest.raises(ValueError):
+        _utils.laser_positions_from_points([(10, 2), (20, 2)], 12)
+
+
+@pytest.mark.parametrize("backend", ["numpy", "numba", "dask"])
+def test_reslice_with_laser_positions(backend):
+    if backend == "numba":
+        pytest.importorskip("numba")
+    rng = np.random.default_rng(seed=0)
+    stack = rng.integers(0, 2**12, size=(20, 10, 60), dtype=np.uint16)
+    # Constant speed gives the same result as the straight line
+    expected, expected_positions = _utils.reslice_with_moving_window(
+        stack, 3, -10, 5, 12
+    )
+    laser_positions = _utils.laser_positions_from_points(
+        [(-10, 0), (50, 20)], 20
+    )
+    # The laser accelerates from frame 10 on
+    variable_positions = np.where(
+        np.arange(20) < 10, laser_positions, 20 + 5 * (np.arange(20) - 10)
+    )
+    if backend == "dask":
+        da = pytest.importorskip("dask.array")
+        stack = da.from_array(stack, chunks=(4, 10, 60))
+    backend = "numpy" if backend == "dask" else backend
+    result, positions = _utils.reslice_with_laser_positions(
+        stack, laser_positions, 5, 12, backend=backend
+    )
+    np.testing.assert_array_equal(np.asarray(result), expected)
+    assert positions.equals(expected_positions)
+
+    result, positions = _utils.reslice_with_laser_positions(
+        stack, variable_positions, 5, 12, backend=backend, compact=True
+    )
+    # Frame 0 is left and frame 19 right of the image
+    np.testing.assert_array_equal(positions["Time frame"], np.arange(1, 19))
+    np.testing.assert_array_equal(
+        positions["Laser position"], variable_positions[1:19]
+    )
+    variable_positions = variable_positions.astype(int)
+    stack = np.asarray(stack)
+    for frame, t in enumerate(positions["Time frame"]):
+        start = variable_positions[t] - 5
+        lo, hi = max(0, -start), min(12, 60 - start)
+        np.testing.assert_array_equal(
+            result[frame, :, lo:hi], stack[t, :, start + lo : start + hi]
+        )
+        assert np.all(np.asarray(result[frame, :, :lo]) == 0)
+        assert np.all(np.asarray(result[frame, :, hi:]) == 0)
+
+    with pytest.raises(ValueError):
+        _utils.reslice_with_laser_positions(stack, variable_positions[1:])
+
+
+def test_radial_gradient_dask(random_stack, dask_stack):
+    expected = _utils.calculate_radial_gradient(random_stack, xpos=10)
+    result = _utils.calculate_radial_gradient(
+        dask_stack,
+        xpos=10,
+        material_surface=_utils.estimate_material_surface(random_stack),
+    )
+    assert _utils.is_dask_array(result)
+    np.testing.assert_array_equal(result.compute(), expected)
+
+
+@pytest.mark.parametrize("kernel_size", [(1, 1, 1), (3, 3, 3), (5, 2, 4)])
+def test_median_filter_dask(random_stack, dask_stack, kernel_size):
+    expected = _utils.median_filter(random_stack, kernel_size)
+    result = _utils.median_filter(dask_stack, kernel_size)
+    assert _utils.is_dask_array(result)
+    np.testing.assert_array_equal(result.compute(), expected)
+
+
+def test_pipeline_dask_processes(random_stack, dask_stack):
+    resliced, _ = _utils.reslice_with_moving_window(dask_stack, 3, -10, 5, 12)
+    filtered = _utils.median_filter(resliced, (3, 3, 3))
+    expected, _ = _utils.reslice_with_moving_window(
+        random_stack, 3, -10, 5, 12
+    )
+    expected = _utils.median_filter(expected, (3, 3, 3))
+    np.testing.assert_array_equal(
+        filtered.compute(scheduler="processes", num_workers=2), expected
+    )
+
+
+@pytest.mark.parametrize("backend", ["numpy", "numba"])
+@pytest.mark.parametrize("method", ["sobel", "prewitt", "scharr", "farid"])
+@pytest.mark.parametrize(
+    "roi", [(5, 12, 8, 20), (0, 20, 0, 30), (-3, 4, 25, 40)]
+)
+def test_radial_gradient_roi(random_stack, method, backend, roi):
+    if backend == "numba":
+        pytest.importorskip("numba")
+    center = np.stack((np.arange(6) + 0.5, np.full(6, 10.5)), axis=-1)
+    expected = _utils.radial_gradient(
+        random_stack, center, method=method, backend=backend
+    )
+    result = _utils.radial_gradient(
+        random_stack, center, method=method, backend=backend, roi=roi
+    )
+    inside = np.zeros(random_stack.shape, dtype=bool)
+    inside[:, max(roi[0], 0) : roi[1], max(roi[2], 0) : roi[3]] = True
+    for array, expected_array in zip(result, expected):
+        assert array.shape == expected_array.shape
+        np.testing.assert_array_equal(array[inside], expected_array[inside])
+        np.testing.assert_array_equal(array[~inside], 0)
+
+    with pytest.raises(ValueError):
+        _utils.radial_gradient(random_stack, center, roi=(5, 5, 0, 30))
+
+
+def test_calculate_radial_gradient_roi(random_stack, dask_stack):
+    surface = _utils.estimate_material_surface(random_stack)
+    expected = _utils.calculate_radial_gradient(
+        random_stack, xpos=10, material_surface=surface
+    )
+    result = _utils.calculate_radial_gradient(
+        random_stack, xpos=10, material_surface=surface, roi_radius=4
+    )
+    inside = np.zeros(random_stack.shape, dtype=bool)
+    y_start = max(np.min(surface[:, 10]) - 4, 0)
+    inside[:, y_start : np.max(surface[:, 10]) + 5, 6:15] = True
+    np.testing.assert_array_equal(result[inside], expected[inside])
+    np.testing.assert_array_equal(result[~inside], 0)
+
+    dask_result = _utils.calculate_radial_gradient(
+        dask_stack, xpos=10, material_surface=surface, roi_radius=4
+    )
+    assert _utils.is_dask_array(dask_result)
+    np.testing.assert_array_equal(dask_result.compute(), result)
+
+
+@pytest.mark.parametrize("frames_per_chunk", [1, 4, 100])
+@pytest.mark.parametrize("kernel_size", [(1, 1, 1), (3, 3, 3), (5, 2, 4)])
+def test_median_filter_chunked(random_stack, kernel_size, frames_per_chunk):
+    expected = _utils.median_filter(random_stack, kernel_size)
+    result = _utils.median_filter(
+        random_stack, kernel_size, frames_per_chunk=frames_per_chunk
+    )
+    np.testing.assert_array_equal(result, expected)
+
+
+@pytest.mark.parametrize("roi_radius", [None, 4])
+def test_calculate_radial_gradient_chunked(random_stack, roi_radius):
+    surface = _utils.estimate_material_surface(random_stack)
+    expected = _utils.calculate_radial_gradient(
+        random_stack, xpos=10, material_surface=surface, roi_radius=roi_radius
+    )
+    result = _utils.calculate_radial_gradient(
+        random_stack,
+        xpos=10,
+        material_surface=surface,
+        roi_radius=roi_radius,
+        frames_per_chunk=4,
+    )
+    np.testing.assert_array_equal(result, expected)
+
+    # The threshold of the surface is estimated from a subset of the
+    # frames, so it only matches for a given threshold
+    np.testing.assert_array_equal(
+        _utils.estimate_material_surface(
+            random_stack, threshold=2000, frames_per_chunk=4
+        ),
+        _utils.estimate_material_surface(random_stack, threshold=2000),
+    )
+
+
+@pytest.fixture
+def laser_stack():
+    rng = np.random.default_rng(seed=0)
+    stack = rng.normal(loc=0.2, scale=0.02, size=(40, 30, 150))
+    stack[:, 15:] += 0.3
+    return stack.astype(np.float32)
+
+
+@pytest.mark.parametrize("frames_per_chunk", [1, 5, 16, 100])
+def test_streaming_pipeline(laser_stack, frames_per_chunk):
+    reslice_parameters = {
+        "coef": 3,
+        "intercept": -20,
+        "window_offset": 10,
+        "window_size": 40,
+    }
+    chunks = _utils.iter_frames(laser_stack, frames_per_chunk)
+    resliced_chunks = _utils.iter_reslice(chunks, **reslice_parameters)
+    filtered_chunks = _utils.iter_filter(resliced_chunks, (5, 3, 3))
+    radial_chunks = _utils.iter_radial_gradient(
+        filtered_chunks, xpos=10, threshold=0.35
+    )
+    radial_gradient, positions = _utils.concatenate_chunks(radial_chunks)
+
+    resliced, expected_positions = _utils.reslice_with_moving_window(
+        laser_stack, **reslice_parameters
+    )
+    filtered = _utils.median_filter(resliced, (5, 3, 3))
+    expected = _utils.calculate_radial_gradient(
+        filtered,
+        xpos=10,
+        material_surface=_utils.estimate_material_surface(filtered, 0.35),
+    )
+    np.testing.assert_array_equal(radial_gradient, expected)
+    pd = pytest.importorskip("pandas")
+    pd.testing.assert_frame_equal(positions, expected_positions)
+
+
+def test_iter_filter_chunks(laser_stack):
+    pulled = []
+
+    def chunks():
+        for chunk in _utils.iter_frames(laser_stack, 4):
+            pulled.append(chunk[0])
+            yield chunk
+
+    filtered_chunks = _utils.iter_filter(chunks(), (5, 1, 1))
+    # The frames with their two following frames in the first chunk
+    # are complete without reading further chunks
+    first_frame, filtered, positions = next(filtered_chunks)
+    assert pulled == [0]
+    assert (first_frame, len(filtered), positions) == (0, 2, None)
+    frames = [first_frame] + [chunk[0] for chunk in filtered_chunks]
+    assert frames == [0, 2, 6, 10, 14, 18, 22, 26, 30, 34, 38]
+    assert pulled == list(range(0, 40, 4))
+
+    # A stream can start at a later frame, but has to be consecutive
+    later = [(10, laser_stack[:4], None), (14, laser_stack[4:8], None)]
+    assert [c[0] for c in _utils.iter_filter(later, (3, 1, 1))] == [10, 13, 17]
+    with pytest.raises(ValueError):
+        list(_utils.iter_filter(later[::-1], (3, 1, 1)))
+
+
+def _naive_rolling_background(stack, window, statistic):
+    statistic = np.mean if statistic == "mean" else np.median
+    background = np.empty(stack.shape)
+    background[0] = stack[0]
+    for t in range(1, len(stack)):
+        background[t] = statistic(stack[max(0, t - window) : t], axis=0)
+    return stack - background
+
+
+@pytest.mark.parametrize("statistic", ["mean", "median"])
+@pytest.mark.parametrize("window", [1, 2, 5, 50])
+@pytest.mark.parametrize("backend", ["numpy", "numba"])
+def test_subtract_rolling_background(statistic, window, backend):
+    if backend == "numba":
+        pytest.importorskip("numba")
+    rng = np.random.default_rng(seed=0)
+    # Few gray values, so the sorted windows contain ties
+    stack = rng.integers(0, 6, size=(40, 5, 7)).astype(np.uint16)
+    expected = _naive_rolling_background(stack, window, statistic)
+    result = _utils.subtract_rolling_background(
+        stack, window, statistic, backend, frames_per_chunk=6
+    )
+    assert result.dtype == _utils.DEFAULT_DTYPE
+    np.testing.assert_allclose(result, expected, atol=1e-5)
+
+    # Streaming chunks of different sizes gives the same frames
+    chunks = [
+        (0, stack[:3], None),
+        (3, stack[3:4], None),
+        (4, stack[4:], None),
+    ]
+    streamed = list(
+        _utils.iter_subtract_background(chunks, window, statistic, backend)
+    )
+    assert [chunk[0] for chunk in streamed] == [0, 3, 4]
+    np.testing.assert_array_equal(
+        np.concatenate([chunk[1] for chunk in streamed]), result
+    )
+
+
+def test_iter_subtract_background(laser_stack):
+    resliced = list(
+        _utils.iter_reslice(
+            _utils.iter_frames(laser_stack, 8),
+            coef=3,
+            intercept=-20,
+            window_offset=10,
+            window_size=40,
+        )
+    )
+    subtracted = list(_utils.iter_subtract_background(resliced, 4, "median"))
+    # The chunks keep their frames and positions
+    assert len(subtracted) == len(resliced)
+    for (first_frame, frames, positions), chunk in zip(subtracted, resliced):
+        assert first_frame == chunk[0]
+        assert frames.shape == chunk[1].shape
+        assert positions.equals(chunk[2])
+    np.testing.assert_array_equal(
+        np.concatenate([chunk[1] for chunk in subtracted]),
+        _utils.subtract_rolling_background(
+            _utils.concatenate_chunks(resliced)[0], 4, "median"
+        ),
+    )
+
+    later = [(10, laser_stack[:4], None), (15, laser_stack[4:8], None)]
+    with pytest.raises(ValueError):
+        list(_utils.iter_subtract_background(later, 4))
+    with pytest.raises(ValueError):
+        _utils.RollingBackground(0)
+    with pytest.raises(ValueError):
+        _utils.RollingBackground(4, "max")
@@ -1,6 +1,17 @@
+import subprocess
+import sys
+import time
+
+import h5py
 import numpy as np
+import pytest
 
-from napari_melt_pool_tracker import MeltPoolTrackerQWidget
+from napari_melt_pool_tracker import (
+    MeltPoolTrackerQWidget,
+    _cache,
+    _utils,
+    _worker,
+)
 
 
 # make_napari_viewer is a pytest fixture that returns a napari viewer object
@@ -253,3 +264,447 @@ def test_calculate_radial_gradient(make_napari_viewer, capsys):
     # read captured output and check that it's as we expected
     captured = capsys.readouterr()
     assert captured.out == ""
+
+
+def test_open_subset(make_napari_viewer, tmp_path, capsys):
+    viewer = make_napari_viewer()
+    path = tmp_path / "test_stack.h5"
+    data = np.arange(20 * 30 * 40, dtype=np.uint16).reshape(20, 30, 40)
+    with h5py.File(path, "w") as f:
+        f.create_dataset("image_stack", data=data)
+
+    widget = MeltPoolTrackerQWidget(viewer)
+    widget.open_widgets["path"].value = path
+    widget.open_widgets["t_start"].value = 2
+    widget.open_widgets["stride"].value = 2
+    widget.open_widgets["x_stop"].value = 31
+    widget._open_subset()
+
+    layer = viewer.layers["test_stack"]
+    np.testing.assert_array_equal(layer.data, data[2::2, :, :31])
+    assert layer.metadata["path"] == str(path)
+
+    # read captured output and check that it's as we expected
+    captured = capsys.readouterr()
+    assert captured.out == ""
+
+
+def test_live_mode(make_napari_viewer, tmp_path, capsys):
+    viewer = make_napari_viewer()
+    path = tmp_path / "live.h5"
+    data = np.zeros((30, 40, 100), dtype=np.float32)
+    data[:, 20:, :] = 1
+    with h5py.File(path, "w") as f:
+        f.create_dataset(
+            "image_stack", data=data[:10], maxshape=(None, 40, 100)
+        )
+    viewer.add_shapes(
+        [np.array([[0, 10], [29, 60]])], shape_type="line", name="line"
+    )
+
+    widget = MeltPoolTrackerQWidget(viewer)
+    widget.window_groupbox.comboboxes["Line"].value = viewer.layers["line"]
+    widget.open_widgets["path"].value = path
+    widget.live_btn.setChecked(True)
+    widget._poll_live()
+    with h5py.File(path, "a") as f:
+        f["image_stack"].resize(30, axis=0)
+        f["image_stack"][10:] = data[10:]
+    widget._poll_live()
+    widget.live_btn.setChecked(False)
+
+    for step in ("resliced", "filtered", "radial_gradient"):
+        assert viewer.layers[f"live_live_{step}"].data.shape == (30, 40, 70)
+
+    # read captured output and check that it's as we expected
+    captured = capsys.readouterr()
+    assert captured.out == ""
+
+
+def test_passes(make_napari_viewer, capsys):
+    viewer = make_napari_viewer()
+    stack = np.full((70, 20, 90), 0.2, dtype=np.float32)
+    for t in range(5, 25):
+        stack[t, :6, 9 + 3 * (t - 5)] = 1
+    for t in range(40, 60):
+        stack[t, :6, 79 - 3 * (t - 40)] = 1
+    viewer.add_image(stack, name="test_image")
+
+    widget = MeltPoolTrackerQWidget(viewer)
+    widget.speed_pos_groupbox.comboboxes["Input"].value = viewer.layers[
+        "test_image"
+    ]
+    widget._detect_passes()
+    assert len(viewer.layers["test_image_line"].data) == 2
+
+    widget.window_groupbox.comboboxes["Stack"].value = viewer.layers[
+        "test_image"
+    ]
+    widget.window_groupbox.comboboxes["Line"].value = viewer.layers[
+        "test_image_line"
+    ]
+    widget._process_passes()
+    for i in range(2):
+        layer = viewer.layers[f"test_image_pass{i}_radial_gradient"]
+        assert len(layer.data) == 20
+        assert len(layer.metadata["positions"]) == 20
+
+    # read captured output and check that it's as we expected
+    captured = capsys.readouterr()
+    assert captured.out == ""
+
+
+def test_cache(make_napari_viewer, tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv(_cache.CACHE_ENV, str(tmp_path / "cache"))
+    viewer = make_napari_viewer()
+    path = tmp_path / "test_stack.h5"
+    data = np.arange(10 * 20 * 30, dtype=np.uint16).reshape(10, 20, 30)
+    with h5py.File(path, "w") as f:
+        f.create_dataset("image_stack", data=data)
+
+    widget = MeltPoolTrackerQWidget(viewer)
+    widget.open_widgets["path"].value = path
+    widget._open_subset()
+    widget.filter_groupbox.comboboxes["Input"].value = viewer.layers[
+        "test_stack"
+    ]
+    widget._filter()
+    filtered = viewer.layers["test_stack_filtered"]
+    assert filtered.metadata["cache_key"] is not None
+    assert len(list((tmp_path / "cache").glob("*.h5"))) == 1
+
+    # The second run loads the result from the cache
+    def fail(*args, **kwargs):
+        raise AssertionError("The result should be loaded from the cache.")
+
+    monkeypatch.setattr(_utils, "median_filter", fail)
+    widget._filter()
+    np.testing.assert_array_equal(
+        viewer.layers["test_stack_filtered"].data, filtered.data
+    )
+
+    # read captured output and check that it's as we expected
+    captured = capsys.readouterr()
+    assert captured.out == ""
+
+
+def test_radial_gradient_roi(make_napari_viewer, capsys):
+    viewer = make_napari_viewer()
+    test_data = np.zeros((5, 40, 60))
+    test_data[:, 20:, :] = 1
+    viewer.add_image(test_data, name="test_image")
+
+    widget = MeltPoolTrackerQWidget(viewer)
+    widget.radial_groupbox.comboboxes["Input"].value = viewer.layers[
+        "test_image"
+    ]
+    widget.radial_groupbox.sliders["ROI radius (0 = all)"].setValue(5)
+    widget._calculate_radial_gradient()
+    radial_gradient = viewer.layers["test_image_radial_gradient"].data
+    np.testing.assert_array_equal(radial_gradient[:, :, :25], 0)
+    np.testing.assert_array_equal(radial_gradient[:, :, 36:], 0)
+    assert np.any(radial_gradient[:, :, 25:36] != 0)
+
+    # read captured output and check that it's as we expected
+    captured = capsys.readouterr()
+    assert captured.out == ""
+
+
+def test_memory_budget(make_napari_viewer, capsys):
+    viewer = make_napari_viewer()
+    rng = np.random.default_rng(seed=0)
+    test_data = rng.random((20, 200, 300), dtype=np.float32)
+    test_data[:, 100:] += 1
+    viewer.add_image(test_data, name="test_image")
+
+    widget = MeltPoolTrackerQWidget(viewer)
+    widget.filter_groupbox.comboboxes["Input"].value = viewer.layers[
+        "test_image"
+    ]
+    widget.radial_groupbox.comboboxes["Input"].value = viewer.layers[
+        "test_image"
+    ]
+    assert "in memory" in widget.filter_groupbox.memory_label.text()
+    widget._filter()
+    widget._calculate_radial_gradient()
+    filtered = viewer.layers["test_image_filtered"].data
+    radial_gradient = viewer.layers["test_image_radial_gradient"].data
+
+    # The radial gradient fits in chunks into a budget of two stacks
+    widget.memory_budget.value = 2 * test_data.nbytes // 2**20
+    widget._calculate_radial_gradient()
+    assert "chunked" in widget.radial_groupbox.memory_label.text()
+    # The material surface is reused from the metadata of the layer
+    np.testing.assert_array_equal(
+        viewer.layers["test_image_radial_gradient"].data, radial_gradient
+    )
+
+    # Not even the filtered stack fits into half a stack
+    pytest.importorskip("dask")
+    widget.memory_budget.value = test_data.nbytes // 2**21
+    widget._filter()
+    assert "out of core" in widget.filter_groupbox.memory_label.text()
+    np.testing.assert_array_equal(
+        np.asarray(viewer.layers["test_image_filtered"].data), filtered
+    )
+
+    # read captured output and check that it's as we expected
+    captured = capsys.readouterr()
+    assert captured.out == ""
+
+
+def test_run_on_layers(make_napari_viewer, capsys):
+    viewer = make_napari_viewer()
+    for i, speed in enumerate((2, 3)):
+        stack = np.full((20, 30, 120), 0.2, dtype=np.float32)
+        stack[:, 15:] += 0.3
+        for t in range(20):
+            x = 10 + speed * t
+            stack[t, :8, x - 1 : x + 2] = 1
+        viewer.add_image(stack, name=f"run{i}")
+
+    widget = MeltPoolTrackerQWidget(viewer)
+    widget.multi_widgets["layers"].value = [
+        viewer.layers["run0"],
+        viewer.layers["run1"],
+    ]
+    widget.multi_widgets["steps"].value = "1-4. Whole pipeline"
+    widget.multi_widgets["max_workers"].value = 2
+    widget._run_on_layers()
+    for _, _, future in widget.jobs:
+        future.result()
+    widget._poll_jobs()
+    assert widget.multi_progress.value() == 8
+    for name in ("run0", "run1"):
+        for suffix in ("line", "resliced", "filtered", "radial_gradient"):
+            assert f"{name}_{suffix}" in viewer.layers
+        assert viewer.layers[f"{name}_radial_gradient"].visible
+    assert "positions" in viewer.layers["run0_resliced"].metadata
+    # The window is limited by the width of the stacks
+    assert viewer.layers["run1_resliced"].data.shape == (20, 30, 90)
+
+    # A single step on the results of the pipeline
+    widget.multi_widgets["layers"].value = [
+        viewer.layers["run0_resliced"],
+        viewer.layers["run1_resliced"],
+    ]
+    widget.multi_widgets["steps"].value = "3. Filter image"
+    widget._run_on_layers()
+    for _, _, future in widget.jobs:
+        future.result()
+    widget._poll_jobs()
+    assert "run0_resliced_filtered" in viewer.layers
+    assert widget.multi_progress.value() == 2
+
+    # read captured output and check that it's as we expected
+    captured = capsys.readouterr()
+    assert captured.out == ""
+
+
+def test_run_on_layers_with_worker(
+    make_napari_viewer, tmp_path, monkeypatch, capsys
+):
+    monkeypatch.setenv(_cache.CACHE_ENV, str(tmp_path / "cache"))
+    viewer = make_napari_viewer()
+    path = tmp_path / "run.h5"
+    stack = np.full((20, 30, 120), 200, dtype=np.uint16)
+    stack[:, 15:] += 300
+    for t in range(20):
+        stack[t, :8, 9 + 3 * t : 12 + 3 * t] = 1000
+    with h5py.File(path, "w") as f:
+        f.create_dataset("image_stack", data=stack)
+
+    widget = MeltPoolTrackerQWidget(viewer)
+    widget.open_widgets["path"].value = path
+    widget.open_widgets["stride"].value = 2
+    widget._open_subset()
+    widget.multi_widgets["layers"].value = [viewer.layers["run"]]
+    widget.multi_widgets["steps"].value = "1-4. Whole pipeline"
+    widget._run_on_layers()
+    for _, _, future in widget.jobs:
+        future.result()
+    widget._poll_jobs()
+    expected = viewer.layers["run_radial_gradient"].data
+
+    # Without a running worker, the layers in memory are used
+    widget.worker_cb.setChecked(True)
+    widget._run_on_layers()
+    for _, _, future in widget.jobs:
+        future.result()
+    widget._poll_jobs()
+    np.testing.assert_array_equal(
+        viewer.layers["run_radial_gradient"].data, expected
+    )
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "napari_melt_pool_tracker._worker"]
+    )
+    try:
+        for _ in range(600):
+            if _worker.default_address_file().exists():
+                break
+            time.sleep(0.1)
+        widget._run_on_layers()
+        for _, _, future in widget.jobs:
+            future.result()
+        widget._poll_jobs()
+        data = viewer.layers["run_radial_gradient"].data
+        np.testing.assert_array_equal(data, expected)
+        # The results are views of the memory of the worker
+        assert not data.flags.writeable
+        assert _worker.get_executor().ping()[1] > 0
+    finally:
+        _worker.get_executor().shutdown()
+        process.wait(timeout=60)
+
+    # read captured output and check that it's as we expected
+    captured = capsys.readouterr()
+    assert "Worker listening" in captured.out
+
+
+def test_contrast_limits(make_napari_viewer, capsys):
+    viewer = make_napari_viewer()
+    rng = np.random.default_rng(seed=0)
+    test_data = rng.random((10, 40, 60), dtype=np.float32)
+    test_data[:, 20:] += 1
+    viewer.add_image(test_data, name="test_image")
+
+    widget = MeltPoolTrackerQWidget(viewer)
+    widget.filter_groupbox.comboboxes["Input"].value = viewer.layers[
+        "test_image"
+    ]
+    widget.radial_groupbox.comboboxes["Input"].value = viewer.layers[
+        "test_image"
+    ]
+    widget._filter()
+    widget._calculate_radial_gradient()
+    for name in ("test_image_filtered", "test_image_radial_gradient"):
+        layer = viewer.layers[name]
+        assert tuple(layer.contrast_limits) == pytest.approx(
+            (np.nanmin(layer.data), np.nanmax(layer.data))
+        )
+        counts, edges = layer.metadata["histogram"]
+        assert counts.sum() == np.isfinite(layer.data).sum()
+
+    # read captured output and check that it's as we expected
+    captured = capsys.readouterr()
+    assert captured.out == ""
+
+
+def test_reslice_compact(make_napari_viewer, capsys):
+    viewer = make_napari_viewer()
+    test_data = np.zeros((100, 40, 200))
+    test_data[:, 20:, :] = 255
+    image_layer = viewer.add_image(test_data, name="test_image")
+    # The laser leaves the image after half of the frames
+    line_layer = viewer.add_shapes(
+        [[0, 0], [400, 100]], shape_type="line", name="test_line"
+    )
+
+    widget = MeltPoolTrackerQWidget(viewer)
+    widget.window_groupbox.comboboxes["Stack"].value = image_layer
+    widget.window_groupbox.comboboxes["Line"].value = line_layer
+    widget.window_groupbox.sliders["Left margin"].setValue(25)
+    widget.window_groupbox.sliders["Right margin"].setValue(100)
+    widget.compact_cb.setChecked(True)
+    widget._reslice_with_moving_window()
+
+    resliced_layer = viewer.layers["test_image_resliced"]
+    positions = resliced_layer.metadata["positions"]
+    assert resliced_layer.data.shape == (57, 40, 125)
+    np.testing.assert_array_equal(positions["Time frame"], np.arange(57))
+    np.testing.assert_array_equal(positions["Resliced frame"], np.arange(57))
+
+    # read captured output and check that it's as we expected
+    captured = capsys.readouterr()
+    assert captured.out == ""
+
+
+def test_subtract_background(make_napari_viewer, capsys):
+    viewer = make_napari_viewer()
+    rng = np.random.default_rng(seed=0)
+    test_data = rng.integers(0, 100, size=(30, 20, 40)).astype(np.uint16)
+    layer = viewer.add_image(test_data, name="test_image_resliced")
+
+    widget = MeltPoolTrackerQWidget(viewer)
+    widget.background_groupbox.comboboxes["Input"].value = layer
+    widget.background_groupbox.comboboxes["Statistic"].value = "median"
+    widget.background_groupbox.sliders["Frames"].setValue(5)
+    widget._subtract_background()
+
+    subtracted = viewer.layers["test_image_resliced_background_subtracted"]
+    np.testing.assert_allclose(
+        subtracted.data,
+        _utils.subtract_rolling_background(test_data, 5, "median"),
+    )
+
+    # read captured output and check that it's as we expected
+    captured = capsys.readouterr()
+    assert captured.out == ""
+
+
+def test_reslice_subpixel(make_napari_viewer, capsys):
+    viewer = make_napari_viewer()
+    test_data = np.zeros((100, 40, 200), dtype=np.uint16)
+    test_data[:, 20:, :] = 255
+    image_layer = viewer.add_image(test_data, name="test_image")
+    line_layer = viewer.add_shapes(
+        [[0, 0], [30, 100]], shape_type="line", name="test_line"
+    )
+
+    widget = MeltPoolTrackerQWidget(viewer)
+    widget.window_groupbox.comboboxes["Stack"].value = image_layer
+    widget.window_groupbox.comboboxes["Line"].value = line_layer
+    widget.window_groupbox.comboboxes["Sub-pixel"].value = "linear"
+    widget._reslice_with_moving_window()
+
+    resliced_layer = viewer.layers["test_image_resliced"]
+    positions = resliced_layer.metadata["positions"]
+    assert resliced_layer.data.dtype == np.float32
+    np.testing.assert_allclose(
+        positions["Laser position"], 0.3 * np.arange(100), atol=1e-4
+    )
+    assert widget._get_job_parameters(200, ["reslice"])["interpolation"] == (
+        "linear"
+    )
+
+    # read captured output and check that it's as we expected
+    captured = capsys.readouterr()
+    assert captured.out == ""
+
+
+@pytest.mark.parametrize("spline", [False, True])
+def test_reslice_polyline(make_napari_viewer, capsys, spline):
+    viewer = make_napari_viewer()
+    test_data = np.zeros((100, 40, 200))
+    test_data[:, 20:, :] = 255
+    image_layer = viewer.add_image(test_data, name="test_image")
+    # The laser pauses between frames 50 and 70
+    vertices = [[0, 0], [100, 50], [100, 70], [160, 100]]
+    line_layer = viewer.add_shapes(
+        [vertices], shape_type="path", name="test_line"
+    )
+
+    widget = MeltPoolTrackerQWidget(viewer)
+    widget.window_groupbox.comboboxes["Stack"].value = image_layer
+    widget.window_groupbox.comboboxes["Line"].value = line_layer
+    widget.window_groupbox.sliders["Left margin"].setValue(25)
+    widget.window_groupbox.sliders["Right margin"].setValue(50)
+    widget.spline_cb.setChecked(spline)
+    widget._reslice_with_moving_window()
+
+    resliced_layer = viewer.layers["test_image_resliced"]
+    positions = resliced_layer.metadata["positions"]
+    assert resliced_layer.data.shape == (100, 40, 75)
+    expected = _utils.laser_positions_from_points(
+        vertices, 100, smoothing=4.0 if spline else None
+    )
+    np.testing.assert_array_equal(
+        positions["Laser position"], np.round(expected)
+    )
+    if not spline:
+        np.testing.assert_array_equal(positions["Laser position"][50:71], 100)
+
+    # read captured output and check that it's as we expected
+    captured = capsys.readouterr()
+    assert captured.out == ""
@@ -0,0 +1,190 @@
+import contextlib
+import json
+import subprocess
+import sys
+import time
+
+import h5py
+import numpy as np
+import pytest
+
+from napari_melt_pool_tracker import _batch, _jobs, _worker
+
+PARAMETERS = {
+    "window_offset": 10,
+    "window_size": 40,
+    "kernel_size": [3, 3, 3],
+    "backend": "numpy",
+}
+STATS = ["resliced.npy"]
+
+
+@pytest.fixture
+def h5_file(tmp_path):
+    rng = np.random.default_rng(seed=0)
+    stack = rng.normal(loc=200, scale=20, size=(20, 30, 120))
+    stack[:, 15:] += 300
+    for t in range(20):
+        x = 10 + 3 * t
+        stack[t, :8, x - 1 : x + 2] = 1000
+    path = tmp_path / "run.h5"
+    with h5py.File(path, "w") as f:
+        f.create_dataset("image_stack", data=stack.astype(np.uint16))
+    return path
+
+
+@pytest.fixture
+def client(tmp_path):
+    address_file = tmp_path / "worker.json"
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "napari_melt_pool_tracker._worker",
+            "--address-file",
+            str(address_file),
+        ]
+    )
+    for _ in range(600):
+        if address_file.exists():
+            break
+        time.sleep(0.1)
+    client = _worker.get_executor(address_file)
+    assert isinstance(client, _worker.WorkerClient)
+    yield client
+    # Unless a test stopped it already
+    with contextlib.suppress(ConnectionRefusedError):
+        client.shutdown()
+    process.wait(timeout=60)
+
+
+def assert_outputs_equal(outputs, expected):
+    assert outputs.keys() == expected.keys()
+    for name, value in expected.items():
+        if isinstance(value, np.ndarray):
+            np.testing.assert_array_equal(outputs[name], value)
+        elif hasattr(value, "equals"):
+            assert value.equals(outputs[name])
+        else:
+            np.testing.assert_equal(outputs[name], value)
+
+
+def test_get_executor_without_worker(tmp_path):
+    executor = _worker.get_executor(tmp_path / "worker.json")
+    assert isinstance(executor, _worker.LocalExecutor)
+
+    # A worker that stopped without removing its address file
+    address_file = tmp_path / "stale.json"
+    address_file.write_text(
+        json.dumps({"host": "127.0.0.1", "port": 1, "authkey": "00", "pid": 0})
+    )
+    executor = _worker.get_executor(address_file)
+    assert isinstance(executor, _worker.LocalExecutor)
+
+
+def test_local_executor(h5_file):
+    executor = _worker.LocalExecutor()
+    outputs = executor.run_steps(h5_file, parameters=PARAMETERS, stats=STATS)
+    stack = executor.read_stack(h5_file)
+    assert_outputs_equal(
+        outputs, _jobs.run_steps({"stack": stack}, PARAMETERS, stats=STATS)
+    )
+
+
+def test_worker(h5_file, client):
+    expected = _worker.LocalExecutor().run_steps(
+        h5_file, parameters=PARAMETERS, stats=STATS
+    )
+    outputs = client.run_steps(h5_file, parameters=PARAMETERS, stats=STATS)
+    assert_outputs_equal(outputs, expected)
+    assert not outputs["resliced.npy"].flags.writeable
+    pid, nbytes = client.ping()
+    assert nbytes > 0
+
+    # Served from memory without computing anything again
+    again = client.run_steps(h5_file, parameters=PARAMETERS, stats=STATS)
+    assert_outputs_equal(again, expected)
+    assert client.ping() == (pid, nbytes)
+
+    # Only the changed step and the steps after it are computed
+    changed = client.run_steps(
+        h5_file, parameters={**PARAMETERS, "kernel_size": [1, 1, 1]}
+    )
+    np.testing.assert_array_equal(
+        changed["resliced.npy"], expected["resliced.npy"]
+    )
+    _, changed_nbytes = client.ping()
+    assert changed_nbytes == (
+        nbytes
+        + expected["filtered.npy"].nbytes
+        + expected["radial_gradient.npy"].nbytes
+    )
+
+    np.testing.assert_array_equal(
+        client.read_stack(h5_file), expected["stack"]
+    )
+
+    # Errors of the steps are raised by the client
+    with pytest.raises(KeyError):
+        client.run_steps(h5_file, parameters=PARAMETERS, steps=["filter"])
+
+    client.clear()
+    assert client.ping() == (pid, 0)
+    # Results returned before stay valid
+    assert_outputs_equal(outputs, expected)
+
+
+def test_worker_jobs_and_batch(tmp_path, h5_file, client):
+    expected = _worker.LocalExecutor().run_steps(
+        h5_file, parameters=PARAMETERS, stats=STATS
+    )
+    pool = _jobs.JobPool(max_workers=2)
+    futures = pool.submit_all(
+        [
+            (
+                {"stack": expected["stack"]},
+                PARAMETERS,
+                None,
+                STATS,
+                (client, h5_file, {}),
+            )
+        ]
+        * 2
+    )
+    for future in futures:
+        assert_outputs_equal(future.result(), expected)
+    assert pool.progress == (8, 8)
+    pool.shutdown()
+
+    output_dir = tmp_path / "output"
+    manifest = _batch.create_manifest(output_dir, [str(h5_file)], PARAMETERS)
+    _batch.run_batch(output_dir, executor=client)
+    entry_dir = output_dir / manifest["entries"][0]["id"]
+    np.testing.assert_array_equal(
+        np.load(entry_dir / "radial_gradient.npy"),
+        expected["radial_gradient.npy"],
+    )
+
+
+def test_worker_eviction(h5_file):
+    worker = _worker.Worker(max_bytes=1)
+    try:
+        worker.handle("read", str(h5_file), {})
+        worker.handle("read", str(h5_file), {"stride": 2})
+        # The first stack is freed before the second request
+        assert len(worker.entries) == 1
+        worker.handle("ping")
+        assert len(worker.entries) == 0
+    finally:
+        worker.clear()
+
+
+def test_worker_shutdown(tmp_path, client):
+    client.shutdown()
+    for _ in range(100):
+        if not (tmp_path / "worker.json").exists():
+            break
+        time.sleep(0.1)
+    assert not (tmp_path / "worker.json").exists()
+    executor = _worker.get_executor(tmp_path / "worker.json")
+    assert isinstance(executor, _worker.LocalExecutor)
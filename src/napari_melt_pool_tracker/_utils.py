@@ -1,11 +1,83 @@
+from __future__ import annotations
+
 import collections
+import functools
+from typing import TYPE_CHECKING
 
 import numpy as np
-import pandas as pd
-import skimage
+
+# pandas, scipy and skimage are imported in the functions using them,
+# so the plugin and headless workers import quickly.
+if TYPE_CHECKING:
+    import pandas as pd
+
+BACKENDS = ("numpy", "numba", "auto")
+
+# Floating point type used by the functions that cannot preserve
+# the integer type of the input, e.g. the uint16 of the beamline data.
+DEFAULT_DTYPE = np.float32
+
+# Number of frames per chunk of the streaming functions (`iter_*`)
+DEFAULT_FRAMES_PER_CHUNK = 16
+
+# Statistics of the rolling background of `RollingBackground`
+ROLLING_STATISTICS = ("mean", "median")
+
+# Sub pixel interpolations of the windows of the reslicing with the
+# first tap relative to the integer laser position and the number of
+# taps
+INTERPOLATIONS = {"linear": (0, 2), "cubic": (-1, 4)}
+
+
+def resolve_backend(backend: str) -> str:
+    """
+    Determines which backend is used for the compute heavy functions.
+
+    Parameters
+    ----------
+    backend : str
+        One of "numpy", "numba" or "auto". "auto" uses numba if it
+        is installed and falls back to numpy otherwise.
+
+    Returns
+    -------
+    backend : str
+        Either "numpy" or "numba".
+    """
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"`backend` has to be in {BACKENDS}. You specified {backend}."
+        )
+    if backend == "numpy":
+        return backend
+    try:
+        from napari_melt_pool_tracker import _numba  # noqa: F401
+    except ImportError as error:
+        if backend == "numba":
+            raise ImportError(
+                "The numba backend requires numba to be installed."
+            ) from error
+        return "numpy"
+    return "numba"
 
 
-def determine_laser_speed_and_position(stack, mode):
+def is_dask_array(array) -> bool:
+    """
+    Checks if `array` is a dask array without importing dask.
+    """
+    return type(array).__module__.split(".")[0] == "dask"
+
+
+def _block_frames(block_info) -> slice:
+    """
+    Time frames covered by the block that dask's `map_blocks`
+    passes to a function.
+    """
+    start, stop = block_info[0]["array-location"][0]
+    return slice(start, stop)
+
+
+def determine_laser_speed_and_position(stack, mode, dtype=DEFAULT_DTYPE):
     """
     Infers the laser position and speed by fitting a
     line in the spatio tempol resliced version of the
@@ -13,34 +85,50 @@ def determine_laser_speed_and_position(stack, mode):
 
     Parameters
     ----------
-    stack: np.ndarray
+    stack: np.ndarray or dask.array.Array
         The full size original images with one laser pass
-        from right to left.
+        from right to left. For a dask array the projection
+        is returned as a lazy dask array.
     mdoe: string
-        The way the projection is computed.
+        The way the projection is computed. "Phase correlation" returns
+        the projection of "Default" and estimates the laser speed and
+        position with `estimate_laser_speed_phase_correlation` instead,
+        which does not need a visible streak in the projection.
+    dtype : np.dtype
+        Floating point type used for the normalization in the
+        "Pre mean" and "Post median" modes.
 
     Returns
     -------
     proj_resliced : numpy array
-        Resliced image with the height of the image cores
+        Resliced image with the height of the image cores.
+        It has the dtype of the stack for the "Default" mode
+        and `dtype` otherwise.
     coef : float
         The coefficient determining the slope of the line fitted.
     intecept : float
         The intercept of the line fitted.
     """
-    modes = ["Pre mean", "Post median", "Default"]
+    modes = ["Pre mean", "Post median", "Default", "Phase correlation"]
     if mode not in modes:
         raise ValueError(f"Mode has to be in {modes}. You specified {mode}.")
     if mode == "Pre mean":
-        stack = stack / np.mean(stack, axis=0)[np.newaxis, :, :]
+        mean = np.mean(stack, axis=0, dtype=dtype)
+        stack = np.divide(stack, mean[np.newaxis, :, :], dtype=dtype)
     resliced = np.swapaxes(stack, 0, 2)
     proj_resliced = np.max(resliced, axis=1)
     if mode == "Post median":
-        proj_resliced = (
-            proj_resliced / np.median(proj_resliced, axis=1)[:, np.newaxis]
+        proj_resliced = np.divide(
+            proj_resliced,
+            np.median(proj_resliced, axis=1)[:, np.newaxis],
+            dtype=dtype,
         )
     intercept = 0
     coef = proj_resliced.shape[0] / proj_resliced.shape[1]
+    if mode == "Phase correlation":
+        coef, intercept = estimate_laser_speed_phase_correlation(
+            stack, dtype=dtype
+        )
     return (
         proj_resliced,
         coef,
@@ -48,12 +136,128 @@ def determine_laser_speed_and_position(stack, mode):
     )
 
 
+def estimate_laser_speed_phase_correlation(
+    stack, dtype=DEFAULT_DTYPE, lag=4, pairs_per_group=8
+):
+    """
+    Estimates the laser speed and position from the horizontal
+    displacement between frames, measured with phase correlation.
+
+    Every frame is reduced to its horizontal profile (sum over y), and
+    the median profile over time, i.e. the static background, is
+    subtracted, which keeps what moves with the laser. All profiles are
+    transformed with one batched FFT of the same length, so the FFT
+    plan is reused for all frames.
+
+    The cross-power spectra of frame pairs `lag` frames apart are
+    summed over groups of `pairs_per_group` pairs and normalized to
+    their phase, so the correlation peak stands out in low contrast
+    data. The median of the displacements of the groups gives a first
+    estimate of the speed. The profiles are aligned with it and
+    averaged into a template. The displacement of every profile from
+    the template is the peak of their cross-correlation, and a line
+    fitted to these displacements, rejecting outliers, gives the speed
+    and the position.
+
+    Parameters
+    ----------
+    stack : np.ndarray or dask.array.Array
+        The full size original images.
+    dtype : np.dtype
+        Floating point type of the profiles.
+    lag : int
+        Number of frames between the frames of a pair. Larger lags
+        measure slow speeds more precisely.
+    pairs_per_group : int
+        Number of pairs whose cross-power spectra are summed.
+
+    Returns
+    -------
+    coef : float
+        The laser speed in pixels per frame.
+    intercept : float
+        The laser position in the first frame.
+    """
+    n_frames = stack.shape[0]
+    if n_frames < 2:
+        raise ValueError(
+            "At least two frames are needed for the phase correlation."
+        )
+    lag = min(lag, n_frames - 1)
+    profiles = np.asarray(np.sum(stack, axis=1, dtype=dtype))
+    profiles -= np.median(profiles, axis=0)
+    width = profiles.shape[1]
+    # Zero padding, so displacements up to the width do not wrap around
+    n = 2 * width
+    spectra = np.fft.rfft(profiles, n=n, axis=1)
+
+    cross_power = spectra[lag:] * np.conj(spectra[:-lag])
+    group_starts = np.arange(0, len(cross_power), pairs_per_group)
+    cross_power = np.add.reduceat(cross_power, group_starts)
+    magnitude = np.abs(cross_power)
+    np.divide(cross_power, magnitude, out=cross_power, where=magnitude > 0)
+    valid = magnitude.max(axis=1) > 0
+    if not np.any(valid):
+        raise ValueError("No moving feature was found in the stack.")
+    shifts = _spectrum_peaks(cross_power[valid], n)
+    coef = float(np.median(shifts)) / lag
+
+    times = np.arange(n_frames)
+    frequencies = np.fft.rfftfreq(n)
+    template = np.mean(
+        spectra * np.exp(2j * np.pi * frequencies * coef * times[:, None]),
+        axis=0,
+    )
+    displacements = _spectrum_peaks(spectra * np.conj(template), n)
+    # Start from the first estimate, so frames without the feature,
+    # whose displacements are random, do not bias the first fit
+    slope = coef
+    offset = np.median(displacements - slope * times)
+    keep = np.ones(n_frames, dtype=bool)
+    for _ in range(4):
+        residuals = np.abs(displacements - slope * times - offset)
+        # At least half a pixel, so perfect fits do not reject frames
+        mad = max(np.median(residuals[keep]), 0.5)
+        keep = residuals <= 3 * 1.4826 * mad
+        slope, offset = np.polyfit(times[keep], displacements[keep], 1)
+
+    # Peak of the template itself at positions from -width / 2
+    position = _spectrum_peaks(template[np.newaxis], n, -(width // 2))[0]
+    return float(slope), float(position + offset)
+
+
+def _spectrum_peaks(spectra, n, lowest=None):
+    """
+    Sub pixel positions of the peaks of the signals given by their real
+    FFT of length `n`, e.g. correlations given by their cross-power
+    spectra. The peaks are refined with a parabola through the peak and
+    its neighbours. The signals are periodic, and the positions are
+    returned in [lowest, lowest + n), by default in [-n / 2, n / 2).
+    """
+    if lowest is None:
+        lowest = -(n // 2)
+    signals = np.roll(np.fft.irfft(spectra, n=n, axis=1), -lowest, axis=1)
+    rows = np.arange(len(signals))
+    peaks = np.argmax(signals, axis=1)
+    left = signals[rows, (peaks - 1) % n]
+    center = signals[rows, peaks]
+    right = signals[rows, (peaks + 1) % n]
+    curvature = left - 2 * center + right
+    offsets = np.zeros(len(peaks))
+    np.divide(left - right, 2 * curvature, out=offsets, where=curvature < 0)
+    return peaks + offsets + lowest
+
+
 def reslice_with_moving_window(
     stack: np.array,
     coef: float,
     intercept: float,
     window_offset: int = 80,
     window_size: int = 400,
+    backend: str = "numpy",
+    first_frame: int = 0,
+    compact: bool = False,
+    interpolation: str = None,
 ) -> (np.array, pd.DataFrame):
     """
     Spatio temporally reslices the data to fix
@@ -63,8 +267,9 @@ def reslice_with_moving_window(
 
     Parameters
     ----------
-    stack : np.ndarray
-        Full size original data.
+    stack : np.ndarray or dask.array.Array
+        Full size original data. For a dask array the resliced
+        stack is a lazy dask array with the same chunks along time.
     coef : float
         Coefficient determining the laser speed.
         Can be obtained from 'determine_laser_speed_and_position'.
@@ -75,19 +280,36 @@ def reslice_with_moving_window(
         How far the window starts from the laser postion.
     window_size : int
         Size of the moving window.
+    backend : str
+        "numpy", "numba" or "auto", see `resolve_backend`.
+    first_frame : int
+        Time frame of the first image in the stack. Used to reslice
+        the frames of an acquisition in parts, e.g. in live mode.
+    compact : bool
+        If True, only the frames where the window overlaps the image
+        are resliced and the frames outside are dropped instead of
+        being left empty. The positions table then has a
+        "Resliced frame" column with the index of every frame in the
+        resliced stack.
+    interpolation : str
+        If None, the laser position is rounded to whole pixels. With
+        "linear" or "cubic" every window is shifted by the fraction of
+        a pixel of its laser position, see `INTERPOLATIONS`. This
+        removes the jitter of one pixel between frames at slow speeds.
 
     Returns
     -------
     resliced : np.ndarray
         A resliced version of the data keeping the laser in place.
+        It has the same dtype as the stack, or `DEFAULT_DTYPE` if
+        the windows are interpolated.
     positions : pd.DataFrame
         A data frame containing the positions of the window and the laser
-        with respect to the full size original data.
+        with respect to the full size original data. With interpolation
+        the laser positions are not rounded and the window starts at
+        the integer part of the laser position.
     """
-    n_t = stack.shape[0]
     height = stack.shape[1]
-    width = stack.shape[2]
-
     if coef == 0:
         raise ValueError("Coef is 0. This means the laser is not moving.")
     if (coef > 0 and intercept >= height) or (coef < 0 and intercept <= 0):
@@ -95,57 +317,252 @@ def reslice_with_moving_window(
             f"For this combination of coef and intercept the line does not intercept the image. (coef={coef}, intercept={intercept})"
         )
 
-    resliced = np.zeros(
-        (n_t, height, window_size),
-        dtype=stack.dtype,
-    )
-    positions = pd.DataFrame(
-        columns=[
-            "Time frame",
-            "Laser position",
-            "Window start",
-            "Window stop",
-        ],
-        dtype=int,
+    time_frames = np.arange(first_frame, first_frame + stack.shape[0])
+    return reslice_with_laser_positions(
+        stack,
+        coef * time_frames + intercept,
+        window_offset=window_offset,
+        window_size=window_size,
+        backend=backend,
+        first_frame=first_frame,
+        compact=compact,
+        interpolation=interpolation,
     )
 
-    for t in range(n_t):
-        laser_pos = coef * t + intercept
-        laser_pos = round(laser_pos)
-        start = laser_pos - window_offset
-        stop = laser_pos - window_offset + window_size
-        current_positions = pd.DataFrame(
-            {
-                "Time frame": (t,),
-                "Laser position": (laser_pos,),
-            }
+
+def reslice_with_laser_positions(
+    stack: np.array,
+    laser_positions: np.array,
+    window_offset: int = 80,
+    window_size: int = 400,
+    backend: str = "numpy",
+    first_frame: int = 0,
+    compact: bool = False,
+    interpolation: str = None,
+) -> (np.array, pd.DataFrame):
+    """
+    Reslices the data with a window following the given laser position
+    of every frame, e.g. for a laser that accelerates or pauses. See
+    `laser_positions_from_points`. The windows are copied the same way
+    as by `reslice_with_moving_window`, so a variable speed costs as
+    much as a constant one.
+
+    Parameters
+    ----------
+    stack : np.ndarray or dask.array.Array
+        Full size original data.
+    laser_positions : np.ndarray
+        Horizontal position of the laser in every frame of the stack.
+        The positions are rounded to whole pixels.
+    window_offset : int
+        How far the window starts from the laser postion.
+    window_size : int
+        Size of the moving window.
+    backend : str
+        "numpy", "numba" or "auto", see `resolve_backend`.
+    first_frame : int
+        Time frame of the first image in the stack.
+    compact, interpolation : bool, str
+        See `reslice_with_moving_window`.
+
+    Returns
+    -------
+    resliced : np.ndarray
+        A resliced version of the data keeping the laser in place.
+    positions : pd.DataFrame
+        See `reslice_with_moving_window`.
+    """
+    n_t = stack.shape[0]
+    height = stack.shape[1]
+    width = stack.shape[2]
+
+    laser_positions = np.asarray(laser_positions)
+    if laser_positions.shape != (n_t,):
+        raise ValueError(
+            f"Expected one laser position per frame ({n_t}), got an "
+            f"array of shape {laser_positions.shape}."
         )
-        if (start < 0 and stop < 0) or (start >= width and stop >= width):
-            continue
-        elif start < 0 and stop > width:
-            raise ValueError("Window size too large for width of input stack.")
-        elif start < 0:
-            resliced[t, :, window_size - stop :] = stack[t, :, :stop]
-            current_positions["Window start"] = 0
-            current_positions["Window stop"] = stop
-        elif stop > width:
-            resliced[t, :, : width - start] = stack[t, :, start:]
-            current_positions["Window start"] = start
-            current_positions["Window stop"] = stack.shape[2] - 1
+    if interpolation is not None and interpolation not in INTERPOLATIONS:
+        raise ValueError(
+            f"Unknown interpolation {interpolation}. Use None or one of "
+            f"{', '.join(INTERPOLATIONS)}."
+        )
+    time_frames = np.arange(first_frame, first_frame + n_t)
+    fractions = None
+    if interpolation is None:
+        laser_pos = np.round(laser_positions).astype(int)
+    else:
+        laser_pos = np.floor(laser_positions).astype(int)
+        fractions = (laser_positions - laser_pos).astype(DEFAULT_DTYPE)
+    start = laser_pos - window_offset
+    stop = start + window_size
+    valid = ~(
+        ((start < 0) & (stop < 0)) | ((start >= width) & (stop >= width))
+    )
+    if np.any(valid & (start < 0) & (stop > width)):
+        raise ValueError("Window size too large for width of input stack.")
+
+    # Window start of every frame of `stack` and whether the window
+    # overlaps the image
+    frame_start, frame_valid, frame_fractions = start, valid, fractions
+    if compact:
+        frames = np.flatnonzero(valid)
+        if len(frames) == 0 or frames[-1] - frames[0] + 1 == len(frames):
+            # A slice does not copy the frames of NumPy arrays
+            first = frames[0] if len(frames) else 0
+            stack = stack[first : first + len(frames)]
         else:
-            resliced[t] = stack[t, :, start:stop]
-            current_positions["Window start"] = start
-            current_positions["Window stop"] = stop
-
-        positions = pd.concat(
-            (
-                positions,
-                current_positions,
-            )
+            stack = stack[frames.tolist()]
+        frame_start, frame_valid = start[frames], valid[frames]
+        if fractions is not None:
+            frame_fractions = fractions[frames]
+
+    if is_dask_array(stack):
+        stack = stack.rechunk({1: -1, 2: -1})
+        resliced = stack.map_blocks(
+            _reslice_frames,
+            start=frame_start,
+            valid=frame_valid,
+            window_size=window_size,
+            backend=backend,
+            fractions=frame_fractions,
+            interpolation=interpolation,
+            chunks=(stack.chunks[0], (height,), (window_size,)),
+            dtype=stack.dtype if interpolation is None else DEFAULT_DTYPE,
         )
+    else:
+        resliced = _reslice_frames(
+            stack,
+            frame_start,
+            frame_valid,
+            window_size,
+            backend,
+            fractions=frame_fractions,
+            interpolation=interpolation,
+        )
+
+    import pandas as pd
+
+    positions = pd.DataFrame(
+        {
+            "Time frame": time_frames[valid],
+            "Laser position": (
+                laser_pos if interpolation is None else laser_positions
+            )[valid],
+            "Window start": np.maximum(start[valid], 0),
+            "Window stop": np.where(
+                stop[valid] > width, width - 1, stop[valid]
+            ),
+        }
+    )
+    if compact:
+        positions["Resliced frame"] = np.arange(len(positions))
     return resliced, positions
 
 
+def _reslice_frames(
+    stack,
+    start,
+    valid,
+    window_size,
+    backend,
+    fractions=None,
+    interpolation=None,
+    block_info=None,
+):
+    """
+    Copies the window starting at `start[t]` of every valid frame `t`
+    into a new array. With an interpolation, the windows are shifted
+    by `fractions[t]` pixels, see `_interpolate_windows`. When called
+    by dask's `map_blocks`, `start`, `valid` and `fractions` are
+    restricted to the frames of the block.
+    """
+    if block_info is not None:
+        frames = _block_frames(block_info)
+        start = start[frames]
+        valid = valid[frames]
+        if fractions is not None:
+            fractions = fractions[frames]
+    if interpolation is not None:
+        return _interpolate_windows(
+            stack, start, valid, fractions, window_size, interpolation, backend
+        )
+    if resolve_backend(backend) == "numba":
+        from napari_melt_pool_tracker import _numba
+
+        return _numba.reslice(stack, start, valid, window_size)
+
+    width = stack.shape[2]
+    resliced = np.zeros(
+        (stack.shape[0], stack.shape[1], window_size),
+        dtype=stack.dtype,
+    )
+    for t in np.flatnonzero(valid):
+        lo = max(0, -start[t])
+        hi = min(window_size, width - start[t])
+        resliced[t, :, lo:hi] = stack[t, :, start[t] + lo : start[t] + hi]
+    return resliced
+
+
+def _interpolate_windows(
+    stack,
+    start,
+    valid,
+    fractions,
+    window_size,
+    interpolation,
+    backend,
+    frames_per_chunk=DEFAULT_FRAMES_PER_CHUNK,
+):
+    """
+    Windows of `_reslice_frames` shifted by a fraction of a pixel.
+
+    For every chunk of frames the windows are copied with the extra
+    columns needed by the taps of the interpolation, and the shifted
+    columns are weighted and summed for all frames of the chunk at
+    once. The result has the type `DEFAULT_DTYPE`.
+    """
+    first_tap, n_taps = INTERPOLATIONS[interpolation]
+    weights = _interpolation_weights(fractions, interpolation)
+    resliced = np.zeros(
+        (stack.shape[0], stack.shape[1], window_size), dtype=DEFAULT_DTYPE
+    )
+    for chunk_start in range(0, stack.shape[0], frames_per_chunk):
+        chunk = slice(chunk_start, chunk_start + frames_per_chunk)
+        windows = _reslice_frames(
+            stack[chunk],
+            start[chunk] + first_tap,
+            valid[chunk],
+            window_size + n_taps - 1,
+            backend,
+        )
+        for tap in range(n_taps):
+            resliced[chunk] += (
+                weights[chunk, tap, np.newaxis, np.newaxis]
+                * windows[:, :, tap : tap + window_size]
+            )
+    return resliced
+
+
+def _interpolation_weights(fractions, interpolation):
+    """
+    Weights of the taps of `INTERPOLATIONS` for every fraction, with
+    shape (frames, taps). The cubic interpolation uses the Catmull-Rom
+    spline.
+    """
+    f = np.asarray(fractions, dtype=DEFAULT_DTYPE)[:, np.newaxis]
+    if interpolation == "linear":
+        return np.hstack([1 - f, f])
+    return np.hstack(
+        [
+            (-(f**3) + 2 * f**2 - f) / 2,
+            (3 * f**3 - 5 * f**2 + 2) / 2,
+            (-3 * f**3 + 4 * f**2 + f) / 2,
+            (f**3 - f**2) / 2,
+        ]
+    )
+
+
 def determine_laser_speed_and_position_from_points(
     point1: (float, float), point2: (float, float)
 ) -> (float, float):
@@ -175,88 +592,943 @@ def determine_laser_speed_and_position_from_points(
     return coef, np.mean((intercept1, intercept2))
 
 
-def estimate_material_height(stack: np.array, x: int) -> int:
-    return np.sum(np.isclose(stack[:, :, x], 1), axis=1)
+def laser_positions_from_points(
+    points: np.array, n_frames: int, smoothing: float = None
+) -> np.array:
+    """
+    Laser position of every frame from points along the laser in the
+    projection, e.g. the vertices of a polyline.
+
+    Between the points the position is interpolated linearly, and
+    before the first and after the last point the first and last
+    segments are extended. Two points therefore give the same
+    positions as `determine_laser_speed_and_position_from_points`.
+    With `smoothing` a cubic smoothing spline is fitted to the points
+    instead.
+
+    Parameters
+    ----------
+    points : np.ndarray
+        Points with shape (n, 2). The first coordinate is x (width)
+        and the second one the time frame. Points of the same frame
+        are averaged.
+    n_frames : int
+        Number of frames of the stack.
+    smoothing : float
+        Smoothing factor of `scipy.interpolate.UnivariateSpline`.
+        0 interpolates the points. If None, the points are connected
+        by straight lines.
+
+    Returns
+    -------
+    laser_positions : np.ndarray
+        Horizontal laser position of every frame, which can be passed
+        to `reslice_with_laser_positions`.
+    """
+    points = np.asarray(points, dtype=float)
+    times, inverse = np.unique(points[:, 1], return_inverse=True)
+    if len(times) < 2:
+        raise ValueError("At least two points in different frames needed.")
+    xs = np.bincount(inverse, weights=points[:, 0]) / np.bincount(inverse)
+    frames = np.arange(n_frames)
+    if smoothing is not None:
+        import scipy.interpolate
+
+        spline = scipy.interpolate.UnivariateSpline(
+            times, xs, k=min(3, len(times) - 1), s=smoothing
+        )
+        return spline(frames)
+
+    laser_positions = np.interp(frames, times, xs)
+    before = frames < times[0]
+    after = frames > times[-1]
+    first_coef = (xs[1] - xs[0]) / (times[1] - times[0])
+    last_coef = (xs[-1] - xs[-2]) / (times[-1] - times[-2])
+    laser_positions[before] = xs[0] + first_coef * (frames[before] - times[0])
+    laser_positions[after] = xs[-1] + last_coef * (frames[after] - times[-1])
+    return laser_positions
+
+
+def estimate_material_surface(
+    stack: np.array, threshold: float = None, frames_per_chunk: int = None
+) -> np.array:
+    """
+    Estimates the height of the material surface for every
+    frame and column of the stack in one pass.
+
+    The background above the material is brighter than the
+    material itself. The surface height of a column is the
+    number of pixels in it that are at least as bright as
+    the threshold. This works on raw as well as on
+    normalized data.
+
+    Parameters
+    ----------
+    stack : np.ndarray or dask.array.Array
+        First dimension is time and the remaing two are space.
+        For a dask array the surface is a lazy dask array.
+    threshold : float
+        Gray value separating the background from the material.
+        If None, Otsu's threshold of the whole stack is used.
+        For dask arrays and in chunks it is estimated from a subset
+        of the frames.
+    frames_per_chunk : int
+        If given, the surface is estimated for this many frames at a
+        time to limit the memory used by the comparison.
+
+    Returns
+    -------
+    surface : np.ndarray
+        Integer height of the material surface with shape (time, width).
+    """
+    if threshold is None:
+        sample = stack
+        if is_dask_array(stack) or frames_per_chunk is not None:
+            sample = np.asarray(stack[:: max(1, stack.shape[0] // 32)])
+        import skimage.filters
+
+        threshold = skimage.filters.threshold_otsu(sample)
+    if frames_per_chunk is None or is_dask_array(stack):
+        return np.sum(stack >= threshold, axis=1)
+    surface = np.empty((stack.shape[0], stack.shape[2]), dtype=np.intp)
+    for start in range(0, stack.shape[0], frames_per_chunk):
+        frames = slice(start, start + frames_per_chunk)
+        surface[frames] = np.sum(stack[frames] >= threshold, axis=1)
+    return surface
 
 
 def apply_2D_function_to_stack(
-    stack: np.array, func: collections.abc.Callable
+    stack: np.array, func: collections.abc.Callable, dtype=None
 ) -> np.array:
     """
     Helper function that allows runing 2D functions on each stack.
+    If `dtype` is given, each image is converted to it before `func`
+    is applied, so only one image at a time is converted.
     """
-    results = []
-    for img in stack:
-        results.append(func(img))
-    stack = np.stack(tuple(results), axis=0)
-    return stack
+    import skimage.util
+
+    results = None
+    for i, img in enumerate(stack):
+        if dtype is not None:
+            img = skimage.util.img_as_float(img).astype(dtype, copy=False)
+        result = func(img)
+        if results is None:
+            results = np.empty((len(stack),) + result.shape, result.dtype)
+        results[i] = result
+    return results
+
+
+GRADIENT_FILTERS = {
+    "sobel": ("sobel_v", "sobel_h"),
+    "prewitt": ("prewitt_v", "prewitt_h"),
+    "scharr": ("scharr_v", "scharr_h"),
+    "farid": ("farid_v", "farid_h"),
+}
+
+
+def _correlation_weights(func: collections.abc.Callable) -> np.array:
+    """
+    Recovers the correlation kernel of a linear 2D filter from
+    its response to a delta image.
+    """
+    delta = np.zeros((9, 9))
+    delta[4, 4] = 1
+    response = func(delta)
+    rows, cols = np.nonzero(np.abs(response) > 1e-12)
+    radius = max(np.max(np.abs(rows - 4)), np.max(np.abs(cols - 4)))
+    window = response[4 - radius : 5 + radius, 4 - radius : 5 + radius]
+    return window[::-1, ::-1].copy()
 
 
 def radial_gradient(
-    stack: np.array, center: (float, float), method: str = "sobel"
+    stack: np.array,
+    center: (float, float),
+    method: str = "sobel",
+    backend: str = "numpy",
+    dtype=DEFAULT_DTYPE,
+    roi: (int, int, int, int) = None,
 ) -> (np.array, np.array):
     """
     Calculates the gradient in the raidal direction from a center.
 
     Parameters
     ----------
-    stack : np.ndarray
+    stack : np.ndarray or dask.array.Array
         First dimension is time and the remaing two are space.
+        For a dask array the results are lazy dask arrays that are
+        computed block by block along time with whole frames.
+    center : np.ndarray
+        Center for each time point with shape (time, 2). The first
+        component is y (height) and the second component is x (width).
     method : str
         Filter to be used
+    backend : str
+        "numpy", "numba" or "auto", see `resolve_backend`.
+    dtype : np.dtype
+        Floating point type of the results. Integer images are
+        rescaled to [0, 1] like in skimage.
+    roi : (int, int, int, int)
+        Region of interest (y start, y stop, x start, x stop). If
+        given, the gradients are only calculated inside the region
+        and the results are zero outside of it. None calculates them
+        for the full frames.
 
     Returns
     -------
     rad_grad : np.ndarray
-        Radial gradient images.
+        Radial gradient images of type `dtype`.
     angles : np.ndarray
-        The direction of the gradient for each point.
-    """
-    if method == "sobel":
-        x_grad = apply_2D_function_to_stack(stack, skimage.filters.sobel_v)
-        y_grad = apply_2D_function_to_stack(stack, skimage.filters.sobel_h)
-    elif method == "prewitt":
-        x_grad = apply_2D_function_to_stack(stack, skimage.filters.prewitt_v)
-        y_grad = apply_2D_function_to_stack(stack, skimage.filters.prewitt_h)
-    elif method == "scharr":
-        x_grad = apply_2D_function_to_stack(stack, skimage.filters.scharr_v)
-        y_grad = apply_2D_function_to_stack(stack, skimage.filters.scharr_h)
-    elif method == "farid":
-        x_grad = apply_2D_function_to_stack(stack, skimage.filters.farid_v)
-        y_grad = apply_2D_function_to_stack(stack, skimage.filters.farid_h)
-    else:
+        The direction of the gradient for each point of type `dtype`.
+    """
+    if method not in GRADIENT_FILTERS:
         raise ValueError(
             f"`method` can only be 'sobel', 'prewitt', 'scharr', or 'farid', not {method}."
         )
+    if roi is not None:
+        return _roi_radial_gradient(stack, center, method, backend, dtype, roi)
+
+    if is_dask_array(stack):
+        stack = stack.rechunk({1: -1, 2: -1})
+        results = stack.map_blocks(
+            functools.partial(
+                _stacked_radial_gradient,
+                center=np.asarray(center),
+                method=method,
+                backend=backend,
+                dtype=dtype,
+            ),
+            new_axis=0,
+            chunks=((2,), *stack.chunks),
+            dtype=dtype,
+        )
+        return results[0], results[1]
 
-    # Calculate radial vectors
-    xx, yy = np.meshgrid(np.arange(stack.shape[2]), np.arange(stack.shape[1]))
-    xx = np.tile(xx, (stack.shape[0], 1, 1))
-    yy = np.tile(yy, (stack.shape[0], 1, 1))
+    import skimage.filters
+    import skimage.util
+
+    x_filter, y_filter = (
+        getattr(skimage.filters, name) for name in GRADIENT_FILTERS[method]
+    )
+
+    if resolve_backend(backend) == "numba":
+        from napari_melt_pool_tracker import _numba
+
+        # Match the rescaling of integer images done by skimage
+        scale = 1.0
+        if stack.dtype.kind == "u":
+            scale = 1 / np.iinfo(stack.dtype).max
+        elif stack.dtype.kind != "f":
+            stack = skimage.util.img_as_float(stack)
+        rad_grad = np.empty(stack.shape, dtype=dtype)
+        angles = np.empty(stack.shape, dtype=dtype)
+        _numba.radial_gradient(
+            stack,
+            np.asarray(center, dtype=float),
+            _correlation_weights(x_filter),
+            _correlation_weights(y_filter),
+            scale,
+            rad_grad,
+            angles,
+        )
+        return rad_grad, angles
+
+    x_grad = apply_2D_function_to_stack(stack, x_filter, dtype=dtype)
+    y_grad = apply_2D_function_to_stack(stack, y_filter, dtype=dtype)
+
+    # Calculate radial vectors, broadcasting instead of tiling the grid
+    center = np.asarray(center, dtype=dtype)
+    xx = np.arange(stack.shape[2], dtype=dtype)[np.newaxis, np.newaxis, :]
+    yy = np.arange(stack.shape[1], dtype=dtype)[np.newaxis, :, np.newaxis]
     xx = xx - center[:, 1, np.newaxis, np.newaxis]
     yy = yy - center[:, 0, np.newaxis, np.newaxis]
 
-    # Normalize directional vectors
+    # Normalize directional vectors and remove sign to avoid different
+    # signs infront and behind the laser. The buffers are reused to
+    # keep the number of full size temporaries low.
     v_length = np.sqrt(xx**2 + yy**2)
-    xx = xx / v_length
-    yy = yy / v_length
-
-    # Remove sign to avoid different signs infront and behind the laser
-    xx = np.abs(xx)
-    yy = np.abs(yy)
+    direction = np.abs(xx / v_length)
 
     # Project gradient in radial direction
-    rad_grad = x_grad * xx + y_grad * yy
+    rad_grad = x_grad * direction
+    np.divide(yy, v_length, out=direction)
+    np.abs(direction, out=direction)
+    direction *= y_grad
+    rad_grad += direction
+    del v_length, direction
 
     return rad_grad, np.arctan2(x_grad, y_grad)
 
 
-def calculate_radial_gradient(stack, xpos=115):
-    material_height = estimate_material_height(stack, xpos)
+def _roi_radial_gradient(stack, center, method, backend, dtype, roi):
+    """
+    Radial gradient inside `roi` only. The frames are cropped to the
+    region of interest plus a halo of the filter radius, so the values
+    inside the region are the same as for the full frames.
+    """
+    height, width = stack.shape[1:]
+    y_start, y_stop = max(roi[0], 0), min(roi[1], height)
+    x_start, x_stop = max(roi[2], 0), min(roi[3], width)
+    if y_stop <= y_start or x_stop <= x_start:
+        raise ValueError(f"The region of interest {roi} is empty.")
+    import skimage.filters
+
+    x_filter = getattr(skimage.filters, GRADIENT_FILTERS[method][0])
+    radius = _correlation_weights(x_filter).shape[0] // 2
+    halo_y = max(y_start - radius, 0)
+    halo_x = max(x_start - radius, 0)
+    crop = stack[
+        :,
+        halo_y : min(y_stop + radius, height),
+        halo_x : min(x_stop + radius, width),
+    ]
+    center = np.asarray(center, dtype=float) - [halo_y, halo_x]
+    inner = (
+        slice(None),
+        slice(y_start - halo_y, y_stop - halo_y),
+        slice(x_start - halo_x, x_stop - halo_x),
+    )
+    results = []
+    for result in radial_gradient(crop, center, method, backend, dtype):
+        if is_dask_array(result):
+            import dask.array as da
+
+            padding = (
+                (0, 0),
+                (y_start, height - y_stop),
+                (x_start, width - x_stop),
+            )
+            results.append(da.pad(result[inner], padding))
+            continue
+        # Pages of the zeros that are never written are not allocated
+        full = np.zeros(stack.shape, dtype=dtype)
+        full[:, y_start:y_stop, x_start:x_stop] = result[inner]
+        results.append(full)
+    return tuple(results)
+
+
+def _stacked_radial_gradient(
+    stack, center, method, backend, dtype, block_info=None
+):
+    """
+    Radial gradient and angles of the frames of a dask block
+    stacked along a new first axis.
+    """
+    center = center[_block_frames(block_info)]
+    return np.stack(radial_gradient(stack, center, method, backend, dtype))
+
+
+def median_filter(
+    stack: np.array,
+    kernel_size: (int, int, int),
+    backend: str = "numpy",
+    frames_per_chunk: int = None,
+) -> np.array:
+    """
+    Applies a 3D median filter to the stack.
+
+    Parameters
+    ----------
+    stack : np.ndarray or dask.array.Array
+        First dimension is time and the remaing two are space.
+        For a dask array the result is a lazy dask array. The blocks
+        overlap by half the kernel size so that the result matches
+        the one of a numpy array.
+    kernel_size : (int, int, int)
+        Size of the filter along t, y and x.
+    backend : str
+        "numpy", "numba" or "auto", see `resolve_backend`.
+        The numpy backend uses `scipy.ndimage.median_filter`.
+    frames_per_chunk : int
+        If given, the stack is filtered this many frames at a time with
+        `StreamingMedianFilter` and only the result is allocated for
+        the full stack. The result is the same. Ignored for dask arrays.
+
+    Returns
+    -------
+    filtered : np.ndarray
+        The filtered stack. It has the same dtype as the stack.
+    """
+    if is_dask_array(stack):
+        return stack.rechunk({1: -1, 2: -1}).map_overlap(
+            median_filter,
+            depth=tuple(k // 2 for k in kernel_size),
+            boundary="reflect",
+            kernel_size=kernel_size,
+            backend=backend,
+            dtype=stack.dtype,
+        )
+    if frames_per_chunk is not None:
+        return _chunked_median_filter(
+            stack, kernel_size, backend, frames_per_chunk
+        )
+    if resolve_backend(backend) == "numba":
+        from napari_melt_pool_tracker import _numba
+
+        return _numba.median_filter(stack, *kernel_size)
+    import scipy.ndimage
+
+    return scipy.ndimage.median_filter(stack, kernel_size)
+
+
+def _chunked_median_filter(stack, kernel_size, backend, frames_per_chunk):
+    """
+    `median_filter` of the full stack computed by streaming chunks of
+    frames through a `StreamingMedianFilter` into the result.
+    """
+    filtered = np.empty(stack.shape, dtype=stack.dtype)
+    streaming = StreamingMedianFilter(kernel_size, backend)
+    n_done = 0
+    for start in range(0, stack.shape[0], frames_per_chunk):
+        chunk = streaming.push(
+            np.asarray(stack[start : start + frames_per_chunk])
+        )
+        filtered[n_done : n_done + len(chunk)] = chunk
+        n_done += len(chunk)
+    chunk = streaming.flush()
+    if chunk is not None:
+        filtered[n_done:] = chunk
+    return filtered
+
+
+class StreamingMedianFilter:
+    """
+    Applies `median_filter` to a stack that arrives in chunks of frames.
+
+    Every chunk is filtered together with the frames of the temporal
+    halo kept from the previous chunks. A frame is returned as soon as
+    all frames of its temporal neighbourhood have arrived, and the last
+    frames are returned by `flush`. The concatenated output equals the
+    result of `median_filter` on the full stack, while the work per
+    chunk does not depend on the number of frames received before.
+
+    Parameters
+    ----------
+    kernel_size : (int, int, int)
+        Size of the filter along t, y and x.
+    backend : str
+        "numpy", "numba" or "auto", see `resolve_backend`.
+    """
+
+    def __init__(self, kernel_size, backend="numpy"):
+        self.kernel_size = tuple(kernel_size)
+        self.backend = backend
+        # Frames needed after a frame to filter it
+        self.future = self.kernel_size[0] - 1 - self.kernel_size[0] // 2
+        # Raw frames with their index and the index of the next output
+        self.buffer = None
+        self.buffer_start = 0
+        self.n_received = 0
+        self.n_returned = 0
+
+    def push(self, frames):
+        """
+        Adds frames to the stream and returns the filtered frames that
+        are complete. The result can have zero frames.
+        """
+        if self.buffer is None:
+            self.buffer = frames
+        else:
+            self.buffer = np.concatenate((self.buffer, frames))
+        self.n_received += len(frames)
+        return self._filter(self.n_received - self.future)
+
+    def flush(self):
+        """
+        Returns the remaining frames assuming the stream has ended.
+        Returns None if no frames were pushed.
+        """
+        if self.buffer is None:
+            return None
+        return self._filter(self.n_received)
+
+    def _filter(self, stop):
+        start = self.n_returned
+        if stop <= start:
+            return self.buffer[:0]
+        filtered = median_filter(self.buffer, self.kernel_size, self.backend)
+        filtered = filtered[
+            start - self.buffer_start : stop - self.buffer_start
+        ]
+        self.n_returned = stop
+        # Keep the frames that are needed as past halo of the next frames
+        keep_from = max(self.buffer_start, stop - (self.kernel_size[0] - 1))
+        self.buffer = self.buffer[keep_from - self.buffer_start :]
+        self.buffer_start = keep_from
+        return filtered
+
+
+def subtract_rolling_background(
+    stack: np.array,
+    window: int,
+    statistic: str = "mean",
+    backend: str = "numpy",
+    frames_per_chunk: int = DEFAULT_FRAMES_PER_CHUNK,
+    dtype: np.dtype = DEFAULT_DTYPE,
+) -> np.array:
+    """
+    Subtracts a rolling temporal background from every frame, see
+    `RollingBackground`.
+
+    Parameters
+    ----------
+    stack : array like
+        First dimension is time and the remaing two are space, e.g.
+        the resliced stack. Other arrays than NumPy arrays, e.g. dask
+        arrays or h5py datasets, are read chunk by chunk.
+    window, statistic, backend, dtype
+        See `RollingBackground`.
+    frames_per_chunk : int
+        Number of frames read at a time.
+
+    Returns
+    -------
+    subtracted : np.ndarray
+        The stack minus its background.
+    """
+    subtracted = np.empty(stack.shape, dtype=dtype)
+    rolling = RollingBackground(window, statistic, backend, dtype)
+    for start in range(0, stack.shape[0], frames_per_chunk):
+        stop = start + frames_per_chunk
+        subtracted[start:stop] = rolling.push(np.asarray(stack[start:stop]))
+    return subtracted
+
+
+class RollingBackground:
+    """
+    Subtracts a rolling temporal background from a stack that arrives
+    in chunks of frames.
+
+    The background of a frame is the mean or median of the `window`
+    frames before it, or of all frames before it at the start of the
+    stack. The first frame has no background and becomes zero. The
+    statistics are updated incrementally for every frame: a running
+    sum for the mean, and the values of the window kept sorted for
+    every pixel for the median, in which the value of the oldest frame
+    is replaced by the one of the new frame. The work per frame
+    therefore hardly depends on the window length. Frames are returned
+    as soon as they are pushed.
+
+    Parameters
+    ----------
+    window : int
+        Number of previous frames of the background.
+    statistic : str
+        "mean" or "median".
+    backend : str
+        "numpy", "numba" or "auto", see `resolve_backend`. The numba
+        backend updates the sorted windows of the median with binary
+        search instead of comparing all values.
+    dtype : np.dtype
+        Floating point type of the result.
+    """
+
+    def __init__(
+        self, window, statistic="mean", backend="numpy", dtype=DEFAULT_DTYPE
+    ):
+        if window < 1:
+            raise ValueError(f"The window has to be positive, not {window}.")
+        if statistic not in ROLLING_STATISTICS:
+            raise ValueError(
+                f"`statistic` has to be in {ROLLING_STATISTICS}. You specified {statistic}."
+            )
+        self.window = window
+        self.statistic = statistic
+        self.backend = resolve_backend(backend)
+        self.dtype = dtype
+        # Last `window` frames in a ring buffer
+        self.history = None
+        # Sum of the frames of the mean or sorted values of every pixel
+        # with shape (pixels, window) of the median
+        self.sum = None
+        self.sorted = None
+        self.n_received = 0
+
+    def push(self, frames):
+        """
+        Adds frames to the stream and returns them minus their
+        background.
+        """
+        frames = np.asarray(frames)
+        subtracted = np.empty(frames.shape, dtype=self.dtype)
+        for i, frame in enumerate(frames):
+            if self.history is None:
+                self.history = np.empty(
+                    (self.window, *frame.shape), dtype=frame.dtype
+                )
+                self.sum = np.zeros(frame.shape)
+                self.sorted = np.empty(
+                    (frame.size, self.window), dtype=frame.dtype
+                )
+            count = min(self.n_received, self.window)
+            if count == 0:
+                subtracted[i] = 0
+            else:
+                np.subtract(
+                    frame,
+                    self._background(count),
+                    out=subtracted[i],
+                    casting="unsafe",
+                )
+            self._add(frame, count)
+        return subtracted
+
+    def _background(self, count):
+        if self.statistic == "mean":
+            return self.sum / count
+        middle = self.sorted[:, (count - 1) // 2 : count // 2 + 1]
+        return np.mean(middle, axis=1).reshape(self.history.shape[1:])
+
+    def _add(self, frame, count):
+        slot = self.n_received % self.window
+        remove = count == self.window
+        old = self.history[slot]
+        if self.statistic == "mean":
+            self.sum += frame
+            if remove:
+                self.sum -= old
+        elif self.backend == "numba":
+            from napari_melt_pool_tracker import _numba
+
+            _numba.sorted_window_update(
+                self.sorted, count, old.ravel(), frame.ravel(), remove
+            )
+        else:
+            _sorted_window_update(
+                self.sorted, count, old.ravel(), frame.ravel(), remove
+            )
+        self.history[slot] = frame
+        self.n_received += 1
+
+
+def _sorted_window_update(window, count, old, new, remove):
+    """
+    Inserts `new[p]` into the sorted values `window[p, :count]` of every
+    pixel `p`, replacing `old[p]` if `remove`. The values between the
+    position of the old and the new value move by one, which is done
+    for all pixels at once.
+    """
+    values = window[:, :count] if remove else window[:, : count + 1]
+    below_new = np.sum(window[:, :count] < new[:, np.newaxis], axis=1)
+    if remove:
+        i = np.sum(values < old[:, np.newaxis], axis=1)
+        j = below_new - (old < new)
+    else:
+        i = np.full(len(values), count)
+        j = below_new
+    rows = np.arange(values.shape[1])
+    up = (rows >= i[:, np.newaxis]) & (rows < j[:, np.newaxis])
+    down = (rows > j[:, np.newaxis]) & (rows <= i[:, np.newaxis])
+    updated = np.where(up, np.roll(values, -1, axis=1), values)
+    updated = np.where(down, np.roll(values, 1, axis=1), updated)
+    updated[np.arange(len(values)), j] = new
+    values[...] = updated
+
+
+def iter_frames(stack, frames_per_chunk=DEFAULT_FRAMES_PER_CHUNK):
+    """
+    Splits a stack into chunks of frames for the streaming functions.
+
+    Parameters
+    ----------
+    stack : array like
+        Stack with time as first axis, e.g. a NumPy array, an h5py
+        dataset or a dask array. Only one chunk at a time is read
+        into memory.
+    frames_per_chunk : int
+        Number of frames per chunk. The last chunk can be shorter.
+
+    Yields
+    ------
+    first_frame : int
+        Time frame of the first frame of the chunk.
+    frames : np.ndarray
+        The frames of the chunk.
+    positions : None
+        Raw frames have no positions table.
+    """
+    for start in range(0, stack.shape[0], frames_per_chunk):
+        yield start, np.asarray(stack[start : start + frames_per_chunk]), None
+
+
+def _as_chunks(chunks):
+    """
+    Chunks of a streaming function or of a stack.
+    """
+    if hasattr(chunks, "shape"):
+        return iter_frames(chunks)
+    return chunks
+
+
+def iter_reslice(
+    chunks,
+    coef,
+    intercept,
+    window_offset=80,
+    window_size=400,
+    backend="numpy",
+):
+    """
+    Streaming version of `reslice_with_moving_window`.
+
+    Parameters
+    ----------
+    chunks : iterable or array like
+        Chunks of `iter_frames` or a stack, which is split with the
+        default chunk size.
+    coef, intercept, window_offset, window_size, backend
+        See `reslice_with_moving_window`.
+
+    Yields
+    ------
+    first_frame : int
+        Time frame of the first frame of the chunk.
+    resliced : np.ndarray
+        The resliced frames of the chunk.
+    positions : pd.DataFrame
+        The rows of the positions table of the frames of the chunk.
+    """
+    for first_frame, frames, _ in _as_chunks(chunks):
+        resliced, positions = reslice_with_moving_window(
+            frames,
+            coef,
+            intercept,
+            window_offset=window_offset,
+            window_size=window_size,
+            backend=backend,
+            first_frame=first_frame,
+        )
+        yield first_frame, resliced, positions
+
+
+def iter_filter(chunks, kernel_size, backend="numpy"):
+    """
+    Streaming version of `median_filter` using a
+    `StreamingMedianFilter`.
+
+    The filtered frames are delayed by the temporal halo of the kernel,
+    so the chunks do not have the frames of the input chunks. The rows
+    of the positions table move with their frames. Chunks without
+    frames are not yielded. The chunks have to be consecutive, but the
+    stream can start at any time frame, e.g. at the first frame of a
+    pass.
+
+    Parameters
+    ----------
+    chunks : iterable or array like
+        Chunks of another streaming function or a stack.
+    kernel_size, backend
+        See `median_filter`.
+
+    Yields
+    ------
+    first_frame, filtered, positions
+        See `iter_reslice`. `positions` is None for raw frames.
+    """
+    streaming = StreamingMedianFilter(kernel_size, backend)
+    pending = None
+    # Time frame of the first frame of the stream
+    offset = None
+    for first_frame, frames, positions in _as_chunks(chunks):
+        if offset is None:
+            offset = first_frame
+        if first_frame != offset + streaming.n_received:
+            raise ValueError(
+                f"Expected a chunk starting at frame {offset + streaming.n_received}, not at {first_frame}."
+            )
+        if positions is not None:
+            pending = _append_positions(pending, positions)
+        filtered = streaming.push(frames)
+        if len(filtered) > 0:
+            stop = offset + streaming.n_returned
+            rows, pending = _split_positions(pending, stop)
+            yield stop - len(filtered), filtered, rows
+    filtered = streaming.flush()
+    if filtered is not None and len(filtered) > 0:
+        stop = offset + streaming.n_returned
+        yield stop - len(filtered), filtered, pending
+
+
+def iter_subtract_background(
+    chunks, window, statistic="mean", backend="numpy"
+):
+    """
+    Streaming version of `subtract_rolling_background` using a
+    `RollingBackground`.
+
+    The background only depends on previous frames, so every chunk is
+    yielded right away with its frames and positions. The chunks have
+    to be consecutive.
+
+    Parameters
+    ----------
+    chunks : iterable or array like
+        Chunks of another streaming function or a stack.
+    window, statistic, backend
+        See `RollingBackground`.
+
+    Yields
+    ------
+    first_frame, subtracted, positions
+        See `iter_reslice`. `positions` is None for raw frames.
+    """
+    rolling = RollingBackground(window, statistic, backend)
+    # Time frame of the first frame of the stream
+    offset = None
+    for first_frame, frames, positions in _as_chunks(chunks):
+        if offset is None:
+            offset = first_frame
+        if first_frame != offset + rolling.n_received:
+            raise ValueError(
+                f"Expected a chunk starting at frame {offset + rolling.n_received}, not at {first_frame}."
+            )
+        yield first_frame, rolling.push(frames), positions
+
+
+def _append_positions(pending, positions):
+    if pending is None:
+        return positions
+    import pandas as pd
+
+    return pd.concat([pending, positions], ignore_index=True)
+
+
+def _split_positions(positions, stop):
+    """
+    Splits the positions table into the rows of the time frames
+    before `stop` and the remaining rows.
+    """
+    if positions is None:
+        return None, None
+    before = positions["Time frame"].to_numpy() < stop
+    return (
+        positions[before].reset_index(drop=True),
+        positions[~before].reset_index(drop=True),
+    )
+
+
+def iter_radial_gradient(
+    chunks,
+    xpos=115,
+    threshold=None,
+    backend="numpy",
+    dtype=DEFAULT_DTYPE,
+    roi_radius=None,
+):
+    """
+    Streaming version of `calculate_radial_gradient`.
+
+    The material surface of every chunk is estimated with the same
+    threshold. If it is not given, Otsu's threshold of the first chunk
+    is used for all chunks.
+
+    Parameters
+    ----------
+    chunks : iterable or array like
+        Chunks of another streaming function or a stack.
+    xpos, backend, dtype, roi_radius
+        See `calculate_radial_gradient`. The region of interest is
+        determined for every chunk.
+    threshold : float
+        See `estimate_material_surface`.
+
+    Yields
+    ------
+    first_frame, radial_gradient, positions
+        See `iter_reslice`. `positions` is None for raw frames.
+    """
+    for first_frame, frames, positions in _as_chunks(chunks):
+        if threshold is None:
+            import skimage.filters
+
+            threshold = skimage.filters.threshold_otsu(frames)
+        yield first_frame, calculate_radial_gradient(
+            frames,
+            xpos=xpos,
+            material_surface=estimate_material_surface(frames, threshold),
+            backend=backend,
+            dtype=dtype,
+            roi_radius=roi_radius,
+        ), positions
+
+
+def concatenate_chunks(chunks):
+    """
+    Collects the chunks of a streaming function.
+
+    Returns
+    -------
+    stack : np.ndarray
+        The frames of all chunks.
+    positions : pd.DataFrame
+        The rows of the positions table of all chunks or None for
+        raw frames.
+    """
+    frames = []
+    positions = None
+    for _, chunk, chunk_positions in chunks:
+        frames.append(chunk)
+        if chunk_positions is not None:
+            positions = _append_positions(positions, chunk_positions)
+    return np.concatenate(frames), positions
+
+
+def calculate_radial_gradient(
+    stack,
+    xpos=115,
+    material_surface=None,
+    backend="numpy",
+    dtype=DEFAULT_DTYPE,
+    roi_radius=None,
+    frames_per_chunk=None,
+):
+    """
+    Calculates the radial gradient with respect to a point on the
+    material surface at horizontal position `xpos`.
+
+    `material_surface` can be passed to reuse the result of
+    `estimate_material_surface` instead of recomputing it.
+    If `roi_radius` is given, the gradient is only calculated in
+    the bounding box of the points closer than `roi_radius` to the
+    laser position in any frame and is zero elsewhere.
+    If `frames_per_chunk` is given, the gradient is calculated for
+    this many frames at a time, so the temporary volumes only exist
+    for one chunk. It is ignored for dask arrays.
+    """
+    if material_surface is None:
+        material_surface = estimate_material_surface(
+            stack, frames_per_chunk=frames_per_chunk
+        )
+    material_height = np.asarray(material_surface[:, xpos])
     laser_positions = np.stack(
         (material_height, np.ones(stack.shape[0]) * xpos), axis=-1
     )
-    radial_gradient_stack, gradient_directions = radial_gradient(
-        stack, laser_positions, method="sobel"
-    )
+    roi = None
+    if roi_radius is not None:
+        roi = (
+            int(np.min(material_height)) - roi_radius,
+            int(np.max(material_height)) + roi_radius + 1,
+            xpos - roi_radius,
+            xpos + roi_radius + 1,
+        )
+    if frames_per_chunk is None or is_dask_array(stack):
+        radial_gradient_stack, gradient_directions = radial_gradient(
+            stack,
+            laser_positions,
+            method="sobel",
+            backend=backend,
+            dtype=dtype,
+            roi=roi,
+        )
+        return radial_gradient_stack
+    radial_gradient_stack = np.empty(stack.shape, dtype=dtype)
+    for start in range(0, stack.shape[0], frames_per_chunk):
+        frames = slice(start, start + frames_per_chunk)
+        radial_gradient_stack[frames], _ = radial_gradient(
+            np.asarray(stack[frames]),
+            laser_positions[frames],
+            method="sobel",
+            backend=backend,
+            dtype=dtype,
+            roi=roi,
+        )
     return radial_gradient_stack
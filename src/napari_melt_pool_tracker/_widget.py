@@ -11,13 +11,13 @@ import magicgui
 import napari
 import napari_cursor_tracker
 import numpy as np
-import scipy
-from qtpy.QtCore import Qt
+from qtpy.QtCore import Qt, QTimer
 from qtpy.QtWidgets import (
     QCheckBox,
     QGridLayout,
     QGroupBox,
     QLabel,
+    QProgressBar,
     QPushButton,
     QScrollArea,
     QSlider,
@@ -25,7 +25,74 @@ from qtpy.QtWidgets import (
     QWidget,
 )
 
-from napari_melt_pool_tracker import _utils
+from napari_melt_pool_tracker import (
+    _cache,
+    _jobs,
+    _live,
+    _memory,
+    _passes,
+    _reader,
+    _stats,
+    _utils,
+    _worker,
+)
+
+# Use the numba kernels if numba is installed
+BACKEND = "auto"
+
+# Polling interval in ms and maximum number of frames processed
+# per poll in live mode
+LIVE_INTERVAL = 500
+LIVE_MAX_FRAMES = 50
+
+# Steps that can be run on several layers, with the name of the input
+# of the first step and the steps of `_batch.STEPS`
+MULTI_STEPS = {
+    "1-4. Whole pipeline": (
+        "stack",
+        ["laser", "reslice", "filter", "radial_gradient"],
+    ),
+    "3. Filter image": ("resliced.npy", ["filter"]),
+    "4. Calculate radial gradient": ("filtered.npy", ["radial_gradient"]),
+}
+# Outputs of the steps added as image layers with the name of the
+# input layer and the suffix
+MULTI_LAYERS = {
+    "resliced.npy": "resliced",
+    "filtered.npy": "filtered",
+    "radial_gradient.npy": "radial_gradient",
+}
+# Polling interval of the progress of the jobs in ms
+JOBS_INTERVAL = 200
+
+
+def _with_summary(name, stack):
+    """
+    Results of a step with the contrast limits and histogram of its
+    output, which are cached together with the output.
+    """
+    return {name: stack, **_stats.image_stats(stack).summary()}
+
+
+def _subset_read_kwargs(options):
+    """
+    Keyword arguments of `_reader.read_stack` for the options of the
+    "Open subset" widgets.
+    """
+    # A stop of 0 selects everything up to the end
+    infinity = np.iinfo(np.int64).max
+    return {
+        "time_range": (options["t_start"], options["t_stop"] or infinity),
+        "stride": options["stride"],
+        "roi": (
+            options["y_start"],
+            options["y_stop"] or infinity,
+            options["x_start"],
+            options["x_stop"] or infinity,
+        ),
+        "binning": options["binning"],
+        "flat_field": options["flat_field"],
+    }
 
 
 class StepWidget(QGroupBox):
@@ -36,12 +103,16 @@ class StepWidget(QGroupBox):
         include_auto_run_and_overwrite=False,
         comboboxes=(("Input", napari.layers.Image),),
         sliders=None,
+        include_memory_estimate=False,
     ):
         """
         Implements the widget unit used for a step in the pipeline.
 
         Sliders should be a dict where the key is the name of the slider and
         the value is tuple (min, max, initial_value) for the slider.
+        If `include_memory_estimate` is True, a label below the button
+        shows the estimated peak memory of the step and the strategy
+        used to run it.
         """
         if sliders is None:
             sliders = {}
@@ -91,6 +162,10 @@ class StepWidget(QGroupBox):
             row += 1
         self.btn = QPushButton("Run")
         self.layout.addWidget(self.btn, row, 1, 1, 2)
+        row += 1
+        if include_memory_estimate:
+            self.memory_label = QLabel()
+            self.layout.addWidget(self.memory_label, row, 1, 1, 2)
 
 
 class MeltPoolTrackerQWidget(QWidget):
@@ -98,20 +173,112 @@ class MeltPoolTrackerQWidget(QWidget):
         super().__init__()
         self.viewer = napari_viewer
 
+        #####################
+        # Settings
+        #####################
+        self.settings_groupbox = QGroupBox("Settings")
+        settings_layout = QVBoxLayout()
+        self.settings_groupbox.setLayout(settings_layout)
+        self.cache = _cache.StepCache()
+        self.cache_cb = QCheckBox("Cache step results on disk")
+        self.cache_cb.setChecked(True)
+        self.cache_cb.setToolTip(
+            "Results of layers read from h5 files are stored in "
+            f"{self.cache.directory} and loaded when the same step "
+            "is run again with the same parameters."
+        )
+        settings_layout.addWidget(self.cache_cb)
+        self.memory_budget = magicgui.widgets.SpinBox(
+            label="Memory budget (MB)",
+            value=_memory.default_budget() // 2**20,
+            min=1,
+            max=10**8,
+            step=256,
+        )
+        self.memory_budget.native.setToolTip(
+            "Steps 3 and 4 run in chunks of frames if their estimated "
+            "peak memory exceeds the budget."
+        )
+        settings_layout.addWidget(
+            magicgui.widgets.Container(widgets=[self.memory_budget]).native
+        )
+
+        #####################
+        # Open subset
+        #####################
+        self.open_groupbox = QGroupBox("0. Open h5 file (optional)")
+        open_layout = QVBoxLayout()
+        self.open_groupbox.setLayout(open_layout)
+        self.open_widgets = magicgui.widgets.Container(
+            widgets=[
+                magicgui.widgets.FileEdit(
+                    name="path", label="File", filter="*.h5"
+                ),
+                magicgui.widgets.SpinBox(
+                    name="t_start", label="First frame", max=10**7
+                ),
+                magicgui.widgets.SpinBox(
+                    name="t_stop", label="Stop frame (0 = all)", max=10**7
+                ),
+                magicgui.widgets.SpinBox(
+                    name="stride", label="Stride", value=1, min=1, max=1000
+                ),
+                magicgui.widgets.SpinBox(
+                    name="y_start", label="ROI y start", max=10**5
+                ),
+                magicgui.widgets.SpinBox(
+                    name="y_stop", label="ROI y stop (0 = all)", max=10**5
+                ),
+                magicgui.widgets.SpinBox(
+                    name="x_start", label="ROI x start", max=10**5
+                ),
+                magicgui.widgets.SpinBox(
+                    name="x_stop", label="ROI x stop (0 = all)", max=10**5
+                ),
+                magicgui.widgets.SpinBox(
+                    name="binning", label="Binning", value=1, min=1, max=64
+                ),
+                magicgui.widgets.CheckBox(
+                    name="flat_field", label="Flat-field correction"
+                ),
+            ]
+        )
+        open_layout.addWidget(self.open_widgets.native)
+        self.open_btn = QPushButton("Open")
+        open_layout.addWidget(self.open_btn)
+        self.open_btn.clicked.connect(self._open_subset)
+
         #####################
         # Laser position
         #####################
         self.speed_pos_groupbox = StepWidget(
             viewer=self.viewer,
             name="1. Determine laser speed and position",
-            comboboxes=[("Input", napari.layers.Image), ("Mode", str)],
+            comboboxes=[
+                ("Input", napari.layers.Image),
+                ("Mode", str),
+                ("Dtype", str),
+            ],
         )
         self.speed_pos_groupbox.comboboxes["Mode"].set_choice("Default")
         self.speed_pos_groupbox.comboboxes["Mode"].set_choice("Pre mean")
         self.speed_pos_groupbox.comboboxes["Mode"].set_choice("Post median")
+        self.speed_pos_groupbox.comboboxes["Mode"].set_choice(
+            "Phase correlation"
+        )
+        self._add_dtype_choices(self.speed_pos_groupbox)
         self.speed_pos_groupbox.btn.clicked.connect(
             self._determine_laser_speed_and_position
         )
+        self.detect_passes_btn = QPushButton("Detect passes")
+        self.speed_pos_groupbox.layout.addWidget(
+            self.detect_passes_btn,
+            self.speed_pos_groupbox.layout.rowCount(),
+            1,
+            1,
+            2,
+        )
+        self.detect_passes_btn.clicked.connect(self._detect_passes)
 
         #####################
         # Reslice
@@ -123,12 +290,22 @@ class MeltPoolTrackerQWidget(QWidget):
             comboboxes=[
                 ("Stack", napari.layers.Image),
                 ("Line", napari.layers.Shapes),
+                ("Sub-pixel", None),
             ],
             sliders={
                 "Left margin": (10, 350, 30),
                 "Right margin": (10, 350, 100),
             },
         )
+        self.window_groupbox.comboboxes["Sub-pixel"].set_choice("None")
+        self.window_groupbox.comboboxes["Sub-pixel"].set_choice("linear")
+        self.window_groupbox.comboboxes["Sub-pixel"].set_choice("cubic")
+        self.window_groupbox.comboboxes["Sub-pixel"].native.setToolTip(
+            "Shift every window by the fraction of a pixel of the laser "
+            "position instead of rounding it, which removes the jitter "
+            "of the melt pool at slow speeds. The resliced stack is "
+            "float32."
+        )
         self.window_groupbox.auto_run_cb.stateChanged.connect(
             self._reslice_auto_run
         )
@@ -137,6 +314,54 @@ class MeltPoolTrackerQWidget(QWidget):
         self.window_groupbox.btn.clicked.connect(
             self._reslice_with_moving_window
         )
+        self.compact_cb = QCheckBox("Drop frames outside the window")
+        self.compact_cb.setToolTip(
+            "Only keep the frames where the window overlaps the image. "
+            'The "Resliced frame" column of the positions maps them to '
+            "the time frames."
+        )
+        self.window_groupbox.layout.addWidget(
+            self.compact_cb, self.window_groupbox.layout.rowCount(), 1, 1, 2
+        )
+        self.spline_cb = QCheckBox("Fit spline to the line vertices")
+        self.spline_cb.setToolTip(
+            "Lines with more than two vertices, or several lines, give "
+            "the laser position of every frame. By default the vertices "
+            "are connected by straight lines, with this option a "
+            "smoothing spline is fitted to them."
+        )
+        self.window_groupbox.layout.addWidget(
+            self.spline_cb, self.window_groupbox.layout.rowCount(), 1, 1, 2
+        )
+        self.process_passes_btn = QPushButton(
+            "Process all passes (one line per pass)"
+        )
+        self.window_groupbox.layout.addWidget(
+            self.process_passes_btn,
+            self.window_groupbox.layout.rowCount(),
+            1,
+            1,
+            2,
+        )
+        self.process_passes_btn.clicked.connect(self._process_passes)
+
+        #####################
+        # Rolling background
+        #####################
+        self.background_groupbox = StepWidget(
+            viewer=self.viewer,
+            name="Subtract rolling background (optional)",
+            comboboxes=[("Input", napari.layers.Image), ("Statistic", str)],
+            sliders={"Frames": (1, 200, 20)},
+        )
+        for statistic in _utils.ROLLING_STATISTICS:
+            self.background_groupbox.comboboxes["Statistic"].set_choice(
+                statistic
+            )
+        self.background_groupbox.sliders["Frames"].setToolTip(
+            "Number of previous frames of the background of a frame."
+        )
+        self.background_groupbox.btn.clicked.connect(self._subtract_background)
 
         #####################
         # Denoise image
@@ -150,6 +375,7 @@ class MeltPoolTrackerQWidget(QWidget):
                 "Kernel y": (1, 15, 3),
                 "Kernel x": (1, 15, 3),
             },
+            include_memory_estimate=True,
         )
         self.filter_groupbox.auto_run_cb.stateChanged.connect(
             self._filter_auto_run
@@ -164,12 +390,108 @@ class MeltPoolTrackerQWidget(QWidget):
         self.radial_groupbox = StepWidget(
             viewer=self.viewer,
             name="4. Calculate radial gradient",
-            sliders={"Position": (0, 100, 50)},
+            comboboxes=[("Input", napari.layers.Image), ("Dtype", str)],
+            sliders={
+                "Position": (0, 100, 50),
+                "ROI radius (0 = all)": (0, 300, 0),
+            },
+            include_memory_estimate=True,
         )
+        self._add_dtype_choices(self.radial_groupbox)
         self.radial_groupbox.btn.clicked.connect(
             self._calculate_radial_gradient
         )
 
+        # Show the memory estimates before the steps are run
+        for widget in (
+            self.filter_groupbox.comboboxes["Input"],
+            self.radial_groupbox.comboboxes["Input"],
+            self.radial_groupbox.comboboxes["Dtype"],
+            self.memory_budget,
+        ):
+            widget.changed.connect(self._update_memory_estimates)
+
+        #####################
+        # Several layers
+        #####################
+        self.multi_groupbox = QGroupBox("Run on several layers")
+        multi_layout = QVBoxLayout()
+        self.multi_groupbox.setLayout(multi_layout)
+        self.multi_widgets = magicgui.widgets.Container(
+            widgets=[
+                magicgui.widgets.Select(
+                    name="layers",
+                    label="Layers",
+                    choices=self._get_image_layer_choices,
+                ),
+                magicgui.widgets.ComboBox(
+                    name="steps", label="Steps", choices=list(MULTI_STEPS)
+                ),
+                magicgui.widgets.SpinBox(
+                    name="max_workers",
+                    label="Parallel jobs",
+                    value=_jobs.DEFAULT_MAX_WORKERS,
+                    min=1,
+                    max=64,
+                ),
+            ]
+        )
+        self.viewer.layers.events.inserted.connect(
+            self.multi_widgets.reset_choices
+        )
+        self.viewer.layers.events.removed.connect(
+            self.multi_widgets.reset_choices
+        )
+        multi_layout.addWidget(
+            QLabel(
+                "Uses the parameters of steps 1-4. The whole pipeline\n"
+                "determines the laser line of every layer itself."
+            )
+        )
+        multi_layout.addWidget(self.multi_widgets.native)
+        self.worker_cb = QCheckBox("Use a running local worker")
+        self.worker_cb.setToolTip(
+            "The whole pipeline runs in the worker started with "
+            "melt-pool-tracker-worker for layers read from h5 files. It "
+            "keeps the stacks and results in memory, so runs with the "
+            "same parameters, also from other sessions, return at once."
+        )
+        multi_layout.addWidget(self.worker_cb)
+        self.multi_btn = QPushButton("Run on selected layers")
+        self.multi_btn.clicked.connect(self._run_on_layers)
+        multi_layout.addWidget(self.multi_btn)
+        self.multi_progress = QProgressBar()
+        multi_layout.addWidget(self.multi_progress)
+        self.job_pool = _jobs.JobPool()
+        self.jobs = []
+        self.jobs_timer = QTimer(self)
+        self.jobs_timer.setInterval(JOBS_INTERVAL)
+        self.jobs_timer.timeout.connect(self._poll_jobs)
+
+        #####################
+        # Live acquisition
+        #####################
+        self.live_groupbox = QGroupBox("Live acquisition")
+        live_layout = QVBoxLayout()
+        self.live_groupbox.setLayout(live_layout)
+        live_layout.addWidget(
+            QLabel(
+                "Follows the file selected in 0. while it is written,\n"
+                "using the line of step 2 and the parameters of steps 2-4."
+            )
+        )
+        self.live_btn = QPushButton("Start live mode")
+        self.live_btn.setCheckable(True)
+        self.live_btn.toggled.connect(self._toggle_live)
+        live_layout.addWidget(self.live_btn)
+        self.live_timer = QTimer(self)
+        self.live_timer.setInterval(LIVE_INTERVAL)
+        self.live_timer.timeout.connect(self._poll_live)
+        self.live_follower = None
+        self.live_processor = None
+        self.live_stacks = {}
+        self.live_stats = {}
+
         #####################
         # Annotation
         #####################
@@ -193,16 +515,52 @@ class MeltPoolTrackerQWidget(QWidget):
         self.scroll_content.setLayout(self.scroll_layout)
 
         # Add individual widges to plugin
+        self.scroll_layout.addWidget(self.settings_groupbox)
+        self.scroll_layout.addWidget(self.open_groupbox)
         self.scroll_layout.addWidget(self.speed_pos_groupbox)
         self.scroll_layout.addWidget(self.window_groupbox)
+        self.scroll_layout.addWidget(self.background_groupbox)
         self.scroll_layout.addWidget(self.filter_groupbox)
         self.scroll_layout.addWidget(self.radial_groupbox)
+        self.scroll_layout.addWidget(self.multi_groupbox)
+        self.scroll_layout.addWidget(self.live_groupbox)
         self.scroll_layout.addWidget(annotate_groupbox)
 
         self.scroll.setWidget(self.scroll_content)
 
         self.parameters = {}
 
+    def _open_subset(self):
+        options = {
+            name: self.open_widgets[name].value
+            for name in (
+                "t_start",
+                "t_stop",
+                "stride",
+                "y_start",
+                "y_stop",
+                "x_start",
+                "x_stop",
+                "binning",
+                "flat_field",
+            )
+        }
+        path = str(self.open_widgets["path"].value)
+        read_kwargs = _subset_read_kwargs(options)
+        stack = _reader.read_stack(path, **read_kwargs)
+        name = self.open_widgets["path"].value.stem
+        self._add_image(
+            stack,
+            name,
+            metadata={
+                "path": path,
+                "subset": options,
+                "read_kwargs": read_kwargs,
+                "cache_key": _cache.source_key(path, **options),
+            },
+        )
+        self._hide_old_layers([name])
+
     def _determine_laser_speed_and_position(self):
         input_layer = self.speed_pos_groupbox.comboboxes["Input"].value
         name = input_layer.name
@@ -215,19 +573,20 @@ class MeltPoolTrackerQWidget(QWidget):
             if layer_name in self.viewer.layers:
                 self.viewer.layers.remove(layer_name)
 
-        stack = input_layer.data
-
-        (
-            proj_resliced,
-            coef,
-            intercept,
-        ) = _utils.determine_laser_speed_and_position(stack, mode)
+        proj_resliced, coef, intercept, key, summary = self._project(
+            input_layer, mode
+        )
 
         x0, x1 = 0, proj_resliced.shape[1]
         y0 = coef * x0 + intercept
         y1 = coef * x1 + intercept
 
-        self.viewer.add_image(proj_resliced, name=f"{name}_{mode}")
+        self._add_image(
+            proj_resliced,
+            f"{name}_{mode}",
+            metadata={"cache_key": key},
+            summary=summary,
+        )
         self.viewer.add_shapes(
             data=[[y0, x0], [y1, x1]],
             shape_type="line",
@@ -238,6 +597,108 @@ class MeltPoolTrackerQWidget(QWidget):
         )
         self._hide_old_layers(layer_names)
 
+    def _detect_passes(self):
+        input_layer = self.speed_pos_groupbox.comboboxes["Input"].value
+        name = input_layer.name
+        mode = self.speed_pos_groupbox.comboboxes["Mode"].native.currentText()
+        layer_names = [
+            f"{name}_{mode}",
+            f"{name}_line",
+        ]
+        for layer_name in layer_names:
+            if layer_name in self.viewer.layers:
+                self.viewer.layers.remove(layer_name)
+
+        proj_resliced, _, _, key, summary = self._project(input_layer, mode)
+        passes = _passes.detect_passes(proj_resliced)
+        if len(passes) == 0:
+            raise ValueError("No laser pass was detected.")
+
+        lines = [
+            [
+                [coef * first + intercept, first],
+                [coef * last + intercept, last],
+            ]
+            for first, last, coef, intercept in zip(
+                passes["First frame"],
+                passes["Last frame"],
+                passes["Coef"],
+                passes["Intercept"],
+            )
+        ]
+        self._add_image(
+            proj_resliced,
+            f"{name}_{mode}",
+            metadata={"cache_key": key},
+            summary=summary,
+        )
+        self.viewer.add_shapes(
+            data=lines,
+            shape_type="line",
+            edge_color="red",
+            edge_width=10,
+            opacity=0.5,
+            name=f"{name}_line",
+        )
+        self._hide_old_layers(layer_names)
+
+    def _project(self, input_layer, mode):
+        dtype = self._get_dtype(self.speed_pos_groupbox)
+
+        def compute():
+            (
+                proj_resliced,
+                coef,
+                intercept,
+            ) = _utils.determine_laser_speed_and_position(
+                input_layer.data, mode, dtype=dtype
+            )
+            return {
+                "projection": proj_resliced,
+                "coef": coef,
+                "intercept": intercept,
+                **_stats.image_stats(proj_resliced).summary(),
+            }
+
+        results, key = self._cached(
+            input_layer, "projection", {"mode": mode, "dtype": dtype}, compute
+        )
+        return (
+            results["projection"],
+            results["coef"],
+            results["intercept"],
+            key,
+            results,
+        )
+
+    def _cached(self, input_layer, step, parameters, compute, use_cache=True):
+        """
+        Runs `compute` or loads its results from the cache.
+
+        Only layers with a "cache_key" in their metadata, i.e. layers
+        read from h5 files and the results of steps run on them, use
+        the cache. The key of the results is returned, so it can be
+        stored in the metadata of the new layer for the next step.
+        `use_cache=False` skips the cache, e.g. for lazy results that
+        should not be computed and loaded at once.
+
+        Returns
+        -------
+        results : dict
+            The results of `compute`.
+        key : str
+            The cache key of the results or None.
+        """
+        input_key = input_layer.metadata.get("cache_key")
+        if input_key is None or not self.cache_cb.isChecked() or not use_cache:
+            return compute(), None
+        key = _cache.make_key(input_key, step, parameters)
+        results = self.cache.get(key)
+        if results is None:
+            results = compute()
+            self.cache.put(key, results)
+        return results, key
+
     def _reslice_auto_run(self):
         if self.window_groupbox.auto_run_cb.isChecked():
             self.window_groupbox.sliders["Left margin"].valueChanged.connect(
@@ -261,31 +722,55 @@ class MeltPoolTrackerQWidget(QWidget):
 
         stack = self.viewer.layers[f"{name}"].data
 
-        shapes = line_layer.data
-        if len(shapes) > 1:
-            raise ValueError("Shapes layer should only containe one shape.")
-        if len(shapes) == 0:
-            raise ValueError("Shapes layers containes no shapes.")
-        points = shapes[0]
-        (
-            coef,
-            intercept,
-        ) = _utils.determine_laser_speed_and_position_from_points(
-            points[0], points[1]
-        )
+        laser_path = self._get_laser_path(line_layer)
+        window_offset, window_size = self._get_window(stack.shape[2])
+        compact = self.compact_cb.isChecked()
+        interpolation = self._get_interpolation()
 
-        left_margin = self.window_groupbox.sliders["Left margin"].value()
-        right_margin = self.window_groupbox.sliders["Right margin"].value()
-        window_offset = left_margin
-        window_size = left_margin + right_margin
-        window_size = min(window_size, stack.shape[2] - window_offset)
-        resliced, position_df = _utils.reslice_with_moving_window(
-            stack=stack,
-            coef=coef,
-            intercept=intercept,
-            window_offset=window_offset,
-            window_size=window_size,
+        def compute():
+            kwargs = {
+                "window_offset": window_offset,
+                "window_size": window_size,
+                "backend": BACKEND,
+                "compact": compact,
+                "interpolation": interpolation,
+            }
+            if "coef" in laser_path:
+                resliced, position_df = _utils.reslice_with_moving_window(
+                    stack,
+                    laser_path["coef"],
+                    laser_path["intercept"],
+                    **kwargs,
+                )
+            else:
+                laser_positions = _utils.laser_positions_from_points(
+                    laser_path["points"],
+                    stack.shape[0],
+                    smoothing=laser_path["smoothing"],
+                )
+                resliced, position_df = _utils.reslice_with_laser_positions(
+                    stack, laser_positions, **kwargs
+                )
+            return {
+                "resliced": resliced,
+                "positions": position_df,
+                **_stats.image_stats(resliced).summary(),
+            }
+
+        results, key = self._cached(
+            stack_layer,
+            "reslice",
+            {
+                **laser_path,
+                "window_offset": window_offset,
+                "window_size": window_size,
+                "compact": compact,
+                "interpolation": interpolation,
+            },
+            compute,
         )
+        resliced = results["resliced"]
+        position_df = results["positions"]
 
         resliced_laser_coords = np.stack(
             [
@@ -324,7 +809,12 @@ class MeltPoolTrackerQWidget(QWidget):
             opacity=0.5,
             name=window_name,
         )
-        self.viewer.add_image(resliced, name=resliced_name)
+        self._add_image(
+            resliced,
+            resliced_name,
+            metadata={"cache_key": key, "positions": position_df},
+            summary=results,
+        )
         self.viewer.add_shapes(
             data=resliced_laser_coords,
             shape_type="line",
@@ -335,26 +825,176 @@ class MeltPoolTrackerQWidget(QWidget):
         )
         self._hide_old_layers([resliced_name, pos_name])
 
+    def _process_passes(self):
+        stack_layer = self.window_groupbox.comboboxes["Stack"].value
+        line_layer = self.window_groupbox.comboboxes["Line"].value
+        name = stack_layer.name
+        stack = stack_layer.data
+
+        passes = _passes.passes_from_lines(line_layer.data)
+        window_offset, window_size = self._get_window(stack.shape[2])
+        results = _passes.process_passes(
+            stack,
+            passes,
+            window_offset,
+            window_size,
+            self._get_kernel_size(),
+            backend=BACKEND,
+            dtype=self._get_dtype(self.radial_groupbox),
+        )
+
+        new_layer_names = []
+        for i, result in enumerate(results):
+            for step in ("resliced", "filtered", "radial_gradient"):
+                layer_name = f"{name}_pass{i}_{step}"
+                if layer_name in self.viewer.layers:
+                    self.viewer.layers.remove(layer_name)
+                self._add_image(
+                    result[step],
+                    layer_name,
+                    metadata={"positions": result["positions"]},
+                )
+            new_layer_names.append(layer_name)
+        self._hide_old_layers(new_layer_names)
+
+    @staticmethod
+    def _get_coef_and_intercept(line_layer):
+        shapes = line_layer.data
+        if len(shapes) > 1:
+            raise ValueError("Shapes layer should only containe one shape.")
+        if len(shapes) == 0:
+            raise ValueError("Shapes layers containes no shapes.")
+        points = shapes[0]
+        if len(points) != 2:
+            raise ValueError("The line should have exactly two points.")
+        return _utils.determine_laser_speed_and_position_from_points(
+            points[0], points[1]
+        )
+
+    def _get_laser_path(self, line_layer):
+        """
+        Parameters of the laser path drawn in the line layer. A single
+        line with two points gives the coef and intercept of a constant
+        speed. Otherwise the vertices of all shapes, and the smoothing
+        of the spline fitted to them, are returned for
+        `_utils.laser_positions_from_points`.
+        """
+        shapes = line_layer.data
+        if len(shapes) == 0:
+            raise ValueError("Shapes layers containes no shapes.")
+        points = np.concatenate(shapes)[:, -2:]
+        spline = self.spline_cb.isChecked()
+        if len(shapes) == 1 and len(points) == 2 and not spline:
+            coef, intercept = self._get_coef_and_intercept(line_layer)
+            return {"coef": coef, "intercept": intercept}
+        return {
+            "points": points.tolist(),
+            # SciPy's default smoothing for errors of about one pixel
+            "smoothing": float(len(points)) if spline else None,
+        }
+
+    def _get_interpolation(self):
+        """
+        Sub pixel interpolation of the reslicing, None if the laser
+        positions are rounded.
+        """
+        interpolation = self.window_groupbox.comboboxes["Sub-pixel"].value
+        return None if interpolation == "None" else interpolation
+
+    def _get_window(self, width):
+        """
+        Window offset and size of the reslicing for images of
+        the given width.
+        """
+        left_margin = self.window_groupbox.sliders["Left margin"].value()
+        right_margin = self.window_groupbox.sliders["Right margin"].value()
+        window_offset = left_margin
+        window_size = left_margin + right_margin
+        window_size = min(window_size, width - window_offset)
+        return window_offset, window_size
+
+    def _subtract_background(self):
+        input_layer = self.background_groupbox.comboboxes["Input"].value
+        name = input_layer.name
+        stack = input_layer.data
+        window = self.background_groupbox.sliders["Frames"].value()
+        statistic = self.background_groupbox.comboboxes["Statistic"].value
+        results, key = self._cached(
+            input_layer,
+            "background",
+            {"window": window, "statistic": statistic},
+            lambda: _with_summary(
+                "subtracted",
+                _utils.subtract_rolling_background(
+                    stack, window, statistic, backend=BACKEND
+                ),
+            ),
+        )
+        subtracted_name = f"{name}_background_subtracted"
+        if subtracted_name in self.viewer.layers:
+            self.viewer.layers.remove(subtracted_name)
+        self._add_image(
+            results["subtracted"],
+            subtracted_name,
+            metadata={"cache_key": key},
+            summary=results,
+        )
+        self._hide_old_layers([subtracted_name])
+
     def _filter(self):
         input_layer = self.filter_groupbox.comboboxes["Input"].value
         name = input_layer.name
         stack = input_layer.data
-        kernel_t = self.filter_groupbox.sliders["Kernel t"].value()
-        kernel_y = self.filter_groupbox.sliders["Kernel y"].value()
-        kernel_x = self.filter_groupbox.sliders["Kernel x"].value()
         name_filtered = f"{name}_filtered"
-        filtered = scipy.ndimage.median_filter(
-            stack, (kernel_t, kernel_y, kernel_x)
+        kernel_size = self._get_kernel_size()
+        strategy, frames_per_chunk = self._plan(
+            self.filter_groupbox, self._filter_memory(stack), stack
+        )
+        if strategy == _memory.OUT_OF_CORE:
+            stack = _memory.as_dask(stack, frames_per_chunk)
+        elif strategy == _memory.IN_MEMORY:
+            frames_per_chunk = None
+        results, key = self._cached(
+            input_layer,
+            "filter",
+            {"kernel_size": kernel_size},
+            lambda: _with_summary(
+                "filtered",
+                _utils.median_filter(
+                    stack,
+                    kernel_size,
+                    backend=BACKEND,
+                    frames_per_chunk=frames_per_chunk,
+                ),
+            ),
+            use_cache=strategy != _memory.OUT_OF_CORE,
         )
+        filtered = results["filtered"]
         filtered_name = name_filtered
         if (
             self.filter_groupbox.overwrite_cb.isChecked()
             and filtered_name in self.viewer.layers
         ):
             self.viewer.layers.remove(filtered_name)
-        self.viewer.add_image(filtered, name=filtered_name)
+        self._add_image(
+            filtered,
+            filtered_name,
+            metadata={"cache_key": key},
+            summary=results,
+        )
         self._hide_old_layers([name_filtered])
 
+    def _filter_memory(self, stack):
+        return _memory.median_filter_memory(
+            stack.shape, stack.dtype, self._get_kernel_size()
+        )
+
+    def _get_kernel_size(self):
+        return tuple(
+            self.filter_groupbox.sliders[name].value()
+            for name in ("Kernel t", "Kernel y", "Kernel x")
+        )
+
     def _filter_auto_run(self):
         if self.filter_groupbox.auto_run_cb.isChecked():
             self.filter_groupbox.sliders["Kernel t"].valueChanged.connect(
@@ -381,16 +1021,356 @@ class MeltPoolTrackerQWidget(QWidget):
             * stack.shape[2]
         )
         xpos = round(xpos)
-        radial_gradient_stack = _utils.calculate_radial_gradient(
-            stack, xpos=xpos
+        dtype = self._get_dtype(self.radial_groupbox)
+        roi_radius = self._get_roi_radius()
+        strategy, frames_per_chunk = self._plan(
+            self.radial_groupbox,
+            self._radial_gradient_memory(input_layer),
+            stack,
+        )
+        if strategy == _memory.OUT_OF_CORE:
+            stack = _memory.as_dask(stack, frames_per_chunk)
+        elif strategy == _memory.IN_MEMORY:
+            frames_per_chunk = None
+        results, key = self._cached(
+            input_layer,
+            "radial_gradient",
+            {"xpos": xpos, "dtype": dtype, "roi_radius": roi_radius},
+            lambda: _with_summary(
+                "radial_gradient",
+                _utils.calculate_radial_gradient(
+                    stack,
+                    xpos=xpos,
+                    material_surface=self._get_material_surface(
+                        input_layer, stack, frames_per_chunk
+                    ),
+                    backend=BACKEND,
+                    dtype=dtype,
+                    roi_radius=roi_radius,
+                    frames_per_chunk=frames_per_chunk,
+                ),
+            ),
+            use_cache=strategy != _memory.OUT_OF_CORE,
         )
         name_radial_gradient = f"{name}_radial_gradient"
-        layer = self.viewer.add_image(
-            radial_gradient_stack,
-            name=name_radial_gradient,
+        layer = self._add_image(
+            results["radial_gradient"],
+            name_radial_gradient,
+            metadata={"cache_key": key},
+            summary=results,
         )
         self._hide_old_layers([layer.name])
 
+    def _get_roi_radius(self):
+        # A radius of 0 calculates the gradient for the full frames
+        return (
+            self.radial_groupbox.sliders["ROI radius (0 = all)"].value()
+            or None
+        )
+
+    def _radial_gradient_memory(self, input_layer):
+        stack = input_layer.data
+        roi_shape = None
+        roi_radius = self._get_roi_radius()
+        if roi_radius is not None:
+            roi_shape = tuple(
+                min(2 * roi_radius + 1, size) for size in stack.shape[1:]
+            )
+        return _memory.radial_gradient_memory(
+            stack.shape,
+            stack.dtype,
+            result_dtype=self._get_dtype(self.radial_groupbox),
+            backend=BACKEND,
+            roi_shape=roi_shape,
+            with_surface="material_surface" not in input_layer.metadata,
+        )
+
+    def _plan(self, step_widget, memory, stack):
+        """
+        Chooses how to run a step within the memory budget and shows
+        the estimate and the strategy in the step's widget. Dask
+        arrays are always processed lazily.
+
+        Returns
+        -------
+        strategy : str
+            See `_memory.MemoryEstimate.plan`.
+        frames_per_chunk : int
+            Number of frames per chunk or None.
+        """
+        budget = self.memory_budget.value * 2**20
+        strategy, frames_per_chunk, estimate = memory.plan(budget)
+        text = _memory.describe(strategy, frames_per_chunk, estimate, budget)
+        if _utils.is_dask_array(stack):
+            strategy, frames_per_chunk = _memory.OUT_OF_CORE, None
+            text = "Lazy dask input: computed chunk by chunk"
+        step_widget.memory_label.setText(text)
+        return strategy, frames_per_chunk
+
+    def _update_memory_estimates(self):
+        filter_layer = self.filter_groupbox.comboboxes["Input"].value
+        if filter_layer is not None:
+            self._plan(
+                self.filter_groupbox,
+                self._filter_memory(filter_layer.data),
+                filter_layer.data,
+            )
+        radial_layer = self.radial_groupbox.comboboxes["Input"].value
+        if radial_layer is not None:
+            self._plan(
+                self.radial_groupbox,
+                self._radial_gradient_memory(radial_layer),
+                radial_layer.data,
+            )
+
+    @staticmethod
+    def _add_dtype_choices(step_widget):
+        """
+        Floating point types offered for the results of steps that
+        cannot preserve the dtype of their input.
+        """
+        step_widget.comboboxes["Dtype"].set_choice("float32")
+        step_widget.comboboxes["Dtype"].set_choice("float64")
+
+    @staticmethod
+    def _get_dtype(step_widget):
+        return np.dtype(step_widget.comboboxes["Dtype"].native.currentText())
+
+    def _get_material_surface(self, layer, stack=None, frames_per_chunk=None):
+        """
+        Returns the material surface of the layer's stack. It is
+        computed once and cached in the layer's metadata. `stack` can
+        replace the layer's data, e.g. by a lazy dask array of it.
+        """
+        if stack is None:
+            stack = layer.data
+        surface = layer.metadata.get("material_surface")
+        if surface is None or surface.shape != (
+            stack.shape[0],
+            stack.shape[2],
+        ):
+            surface = _utils.estimate_material_surface(
+                stack, frames_per_chunk=frames_per_chunk
+            )
+            layer.metadata["material_surface"] = surface
+        return surface
+
+    def _toggle_live(self, checked):
+        if checked:
+            self.live_follower = _live.H5Follower(
+                str(self.open_widgets["path"].value)
+            )
+            self.live_processor = None
+            self.live_stacks = {}
+            self.live_stats = {}
+            self.live_btn.setText("Stop live mode")
+            self.live_timer.start()
+        else:
+            self.live_timer.stop()
+            self._poll_live()
+            if self.live_processor is not None:
+                self._show_live_results(self.live_processor.finish())
+            self.live_btn.setText("Start live mode")
+
+    def _poll_live(self):
+        frames = self.live_follower.read_new_frames(LIVE_MAX_FRAMES)
+        if len(frames) == 0:
+            return
+        if self.live_processor is None:
+            line_layer = self.window_groupbox.comboboxes["Line"].value
+            coef, intercept = self._get_coef_and_intercept(line_layer)
+            window_offset, window_size = self._get_window(frames.shape[2])
+            xpos = round(
+                self.radial_groupbox.sliders["Position"].value()
+                / 100
+                * window_size
+            )
+            self.live_processor = _live.LiveProcessor(
+                coef,
+                intercept,
+                window_offset,
+                window_size,
+                kernel_size=self._get_kernel_size(),
+                xpos=min(xpos, window_size - 1),
+                backend=BACKEND,
+                dtype=self._get_dtype(self.radial_groupbox),
+            )
+        self._show_live_results(self.live_processor.process(frames))
+
+    def _show_live_results(self, results):
+        """
+        Appends the new frames to the live layers.
+        """
+        name = self.open_widgets["path"].value.stem
+        for step in ("resliced", "filtered", "radial_gradient"):
+            if step not in results or len(results[step]) == 0:
+                continue
+            stack = self.live_stacks.setdefault(step, _live.GrowingStack())
+            stack.append(results[step])
+            stats = self.live_stats.setdefault(step, _stats.RunningStats())
+            stats.update(results[step])
+            layer_name = f"{name}_live_{step}"
+            if layer_name in self.viewer.layers:
+                layer = self.viewer.layers[layer_name]
+                layer.data = stack.data
+                layer.contrast_limits = stats.contrast_limits
+                layer.metadata.update(
+                    _stats.layer_kwargs(stats.summary())["metadata"]
+                )
+            else:
+                self._add_image(
+                    stack.data, layer_name, summary=stats.summary()
+                )
+
+    def _get_image_layer_choices(self, widget=None):
+        return [
+            (layer.name, layer)
+            for layer in self.viewer.layers
+            if isinstance(layer, napari.layers.Image)
+        ]
+
+    def _get_job_parameters(self, width, steps):
+        """
+        Parameters of `_batch.STEPS` taken from the widgets of the steps
+        for a stack of the given width.
+        """
+        window_offset, window_size = self._get_window(width)
+        # The position of the radial gradient is relative to the width
+        # of its input, which is the window for the whole pipeline
+        if "reslice" in steps:
+            width = window_size
+        xpos = round(
+            self.radial_groupbox.sliders["Position"].value() / 100 * width
+        )
+        return {
+            "mode": self.speed_pos_groupbox.comboboxes[
+                "Mode"
+            ].native.currentText(),
+            "window_offset": window_offset,
+            "window_size": window_size,
+            "compact": self.compact_cb.isChecked(),
+            "interpolation": self._get_interpolation(),
+            "kernel_size": list(self._get_kernel_size()),
+            "xpos": min(xpos, width - 1),
+            "dtype": self._get_dtype(self.radial_groupbox).name,
+            "backend": BACKEND,
+        }
+
+    def _run_on_layers(self):
+        input_name, steps = MULTI_STEPS[self.multi_widgets["steps"].value]
+        self.job_pool.max_workers = self.multi_widgets["max_workers"].value
+        layers = self.multi_widgets["layers"].value
+        client = None
+        if self.worker_cb.isChecked() and input_name == "stack":
+            client = _worker.get_executor()
+            # Without a running worker, the layers in memory are used
+            if not isinstance(client, _worker.WorkerClient):
+                client = None
+        futures = self.job_pool.submit_all(
+            [
+                (
+                    {input_name: layer.data},
+                    self._get_job_parameters(layer.data.shape[2], steps),
+                    steps,
+                    list(MULTI_LAYERS),
+                    self._get_job_source(client, layer),
+                )
+                for layer in layers
+            ]
+        )
+        self.jobs.extend(
+            (layer.name, input_name, future)
+            for layer, future in zip(layers, futures)
+        )
+        self.jobs_timer.start()
+
+    @staticmethod
+    def _get_job_source(client, layer):
+        """
+        Source of a job run by the worker, see `_jobs.JobPool.submit`,
+        or None if the layer was not read from an h5 file.
+        """
+        if client is None or "read_kwargs" not in layer.metadata:
+            return None
+        return client, layer.metadata["path"], layer.metadata["read_kwargs"]
+
+    def _poll_jobs(self):
+        done, total = self.job_pool.progress
+        self.multi_progress.setMaximum(max(total, 1))
+        self.multi_progress.setValue(done)
+        if self.job_pool.busy:
+            return
+        self.jobs_timer.stop()
+        jobs, self.jobs = self.jobs, []
+        new_layer_names = []
+        error = None
+        for name, input_name, future in jobs:
+            if future.exception() is not None:
+                error = error or future.exception()
+                continue
+            new_layer_names.extend(
+                self._add_job_results(name, input_name, future.result())
+            )
+        self._hide_old_layers(new_layer_names)
+        # Report the first failed job after showing the other results
+        if error is not None:
+            raise error
+
+    def _add_job_results(self, name, input_name, outputs):
+        """
+        Adds the outputs of a job as layers and returns their names.
+        """
+        layer_names = []
+        if "laser.json" in outputs:
+            laser = outputs["laser.json"]
+            n_frames = len(outputs["stack"])
+            line_name = f"{name}_line"
+            if line_name in self.viewer.layers:
+                self.viewer.layers.remove(line_name)
+            self.viewer.add_shapes(
+                data=[
+                    [laser["intercept"], 0],
+                    [laser["coef"] * n_frames + laser["intercept"], n_frames],
+                ],
+                shape_type="line",
+                edge_color="red",
+                edge_width=10,
+                opacity=0.5,
+                name=line_name,
+            )
+        for output_name, suffix in MULTI_LAYERS.items():
+            if output_name not in outputs or output_name == input_name:
+                continue
+            layer_name = f"{name}_{suffix}"
+            if layer_name in self.viewer.layers:
+                self.viewer.layers.remove(layer_name)
+            metadata = {}
+            if output_name == "resliced.npy":
+                metadata["positions"] = outputs["positions.csv"]
+            self._add_image(
+                outputs[output_name],
+                layer_name,
+                metadata=metadata,
+                summary=outputs.get(f"{output_name}_stats"),
+            )
+            layer_names.append(layer_name)
+        return layer_names
+
+    def _add_image(self, data, name, metadata=None, summary=None):
+        """
+        Adds an image layer with precomputed contrast limits, so napari
+        does not scan the data, and its histogram in the metadata.
+
+        `summary` is a `_stats.RunningStats.summary`, e.g. stored with
+        the results of a step. Without it, the statistics are collected
+        from the data, which samples frames of lazy data.
+        """
+        if summary is None or "contrast_limits" not in summary:
+            summary = _stats.image_stats(data).summary()
+        return self.viewer.add_image(
+            data, name=name, **_stats.layer_kwargs(summary, metadata)
+        )
+
     def _hide_old_layers(self, new_layer_names):
         for layer in self.viewer.layers:
             if layer.name not in new_layer_names:
@@ -0,0 +1,435 @@
+"""
+Persistent local worker keeping data warm between sessions.
+
+`serve` runs a worker process, e.g. with the `melt-pool-tracker-worker`
+command, that listens on a local socket for jobs. A job runs steps of
+`_batch.STEPS` on an h5 file like `_jobs.run_steps`. The worker keeps
+the stacks it read and the outputs of the steps it ran in shared
+memory, identified by `_cache.source_key` and the parameters of the
+steps, so a job sent again, e.g. by a new napari session or a script,
+is answered without reading or computing anything. Arrays are returned
+as the names of their shared memory blocks, which `WorkerClient` maps
+into read-only NumPy arrays without copying them.
+
+`get_executor` returns a `WorkerClient` if a worker is running and a
+`LocalExecutor` otherwise, which reads and computes everything in the
+calling process. Both have the methods `read_stack` and `run_steps`.
+"""
+
+import argparse
+import collections
+import contextlib
+import json
+import os
+import pathlib
+import secrets
+import weakref
+from multiprocessing import connection, shared_memory
+
+import numpy as np
+
+from napari_melt_pool_tracker import _batch, _cache, _jobs, _reader, _stats
+
+# File in the cache directory with the address of the running worker
+ADDRESS_NAME = "worker.json"
+# Memory of the stacks and outputs kept by the worker
+DEFAULT_MAX_BYTES = 8 * 2**30
+
+# Description of an array in a shared memory block sent to the clients
+SharedArray = collections.namedtuple("SharedArray", "name shape dtype")
+
+
+def default_address_file():
+    """
+    Path of the file with the address of the worker, in the directory
+    of the step cache.
+    """
+    return _cache.default_directory() / ADDRESS_NAME
+
+
+def get_executor(address_file=None):
+    """
+    Client of the running worker, or a `LocalExecutor` if no worker
+    answers at the address in the address file.
+    """
+    address_file = pathlib.Path(address_file or default_address_file())
+    try:
+        address = json.loads(address_file.read_text())
+        client = WorkerClient(
+            (address["host"], address["port"]),
+            bytes.fromhex(address["authkey"]),
+        )
+        client.ping()
+    except (
+        OSError,
+        EOFError,
+        ValueError,
+        KeyError,
+        connection.AuthenticationError,
+    ):
+        return LocalExecutor()
+    return client
+
+
+class LocalExecutor:
+    """
+    Runs the jobs in the calling process, without keeping any data.
+    """
+
+    def read_stack(self, path, **read_kwargs):
+        """
+        Reads the stack of an h5 file with `_reader.read_stack`.
+        """
+        return _reader.read_stack(path, **read_kwargs)
+
+    def run_steps(
+        self, path, read_kwargs=None, parameters=None, steps=None, stats=()
+    ):
+        """
+        Runs steps of `_batch.STEPS` on the stack of an h5 file.
+
+        Parameters
+        ----------
+        path : str
+            Path to the h5 file.
+        read_kwargs : dict
+            Keyword arguments of `_reader.read_stack`, e.g. the subset.
+        parameters, steps, stats
+            See `_jobs.run_steps`.
+
+        Returns
+        -------
+        outputs : dict
+            The stack as "stack" and the outputs of all steps by name.
+        """
+        stack = self.read_stack(path, **(read_kwargs or {}))
+        return _jobs.run_steps(
+            {"stack": stack}, parameters, steps, stats=stats
+        )
+
+
+class WorkerClient:
+    """
+    Sends jobs to the worker. Every request uses a new connection, so
+    several clients, e.g. napari and a script, can use the worker.
+
+    The arrays of the results are read-only views of the shared memory
+    of the worker. They stay valid while they are used, even if the
+    worker frees the memory in the meantime.
+
+    Parameters
+    ----------
+    address : (str, int)
+        Host and port of the worker.
+    authkey : bytes
+        Key authenticating the clients of the worker.
+    """
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+
+    def _request(self, *request):
+        with connection.Client(self.address, authkey=self.authkey) as conn:
+            conn.send(request)
+            status, value = conn.recv()
+        if status == "error":
+            raise value
+        return value
+
+    @staticmethod
+    def _view(value):
+        if not isinstance(value, SharedArray):
+            return value
+        block = _attach(value.name)
+        array = np.ndarray(
+            value.shape, dtype=np.dtype(value.dtype), buffer=block.buf
+        )
+        array.flags.writeable = False
+        # The block unmaps the memory when it is garbage collected, so
+        # it is kept until the array and its views are
+        weakref.finalize(array, block.close)
+        return array
+
+    def ping(self):
+        """
+        Returns the process id of the worker and the number of bytes
+        it keeps.
+        """
+        return self._request("ping")
+
+    def read_stack(self, path, **read_kwargs):
+        """
+        The stack of an h5 file, see `LocalExecutor.read_stack`.
+        """
+        return self._view(self._request("read", str(path), read_kwargs))
+
+    def run_steps(
+        self, path, read_kwargs=None, parameters=None, steps=None, stats=()
+    ):
+        """
+        See `LocalExecutor.run_steps`.
+        """
+        request = (
+            "run",
+            str(path),
+            read_kwargs or {},
+            parameters or {},
+            steps,
+            list(stats),
+        )
+        outputs = self._request(*request)
+        try:
+            return {name: self._view(value) for name, value in outputs.items()}
+        except FileNotFoundError:
+            # Freed by the worker for the request of another client
+            # before they were mapped, so they are computed again
+            outputs = self._request(*request)
+            return {name: self._view(value) for name, value in outputs.items()}
+
+    def clear(self):
+        """
+        Frees all data kept by the worker.
+        """
+        self._request("clear")
+
+    def shutdown(self):
+        """
+        Stops the worker.
+        """
+        self._request("shutdown")
+
+
+def _attach(name):
+    """
+    Maps an existing shared memory block without taking ownership.
+    """
+    try:
+        # Python >= 3.13
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        block = shared_memory.SharedMemory(name=name)
+    if os.name == "posix":
+        from multiprocessing import resource_tracker
+
+        # Otherwise the block of the worker is removed when this
+        # process exits
+        resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+
+class Worker:
+    """
+    Stacks and step outputs kept in shared memory by the worker. When
+    they exceed `max_bytes`, the least recently used ones are freed
+    before the next request, so a job can temporarily use more memory.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        # Outputs by key with their shared memory blocks and statistics
+        self.entries = collections.OrderedDict()
+
+    @property
+    def nbytes(self):
+        return sum(entry["nbytes"] for entry in self.entries.values())
+
+    def handle(self, command, *arguments):
+        """
+        Runs a request of `WorkerClient` and returns the reply.
+        """
+        self._evict()
+        if command == "ping":
+            return os.getpid(), self.nbytes
+        if command == "read":
+            key = self._stack(*arguments)
+            return self.entries[key]["described"]["stack"]
+        if command == "run":
+            return self._run(*arguments)
+        if command == "clear":
+            self.clear()
+            return None
+        raise ValueError(f"Unknown command {command}.")
+
+    def _stack(self, path, read_kwargs):
+        key = _cache.source_key(path, **read_kwargs)
+        if key not in self.entries:
+            self._put(key, {"stack": _reader.read_stack(path, **read_kwargs)})
+        self.entries.move_to_end(key)
+        return key
+
+    def _run(self, path, read_kwargs, parameters, steps, stats):
+        parameters = {**_batch.DEFAULT_PARAMETERS, **parameters}
+        if steps is None:
+            steps = list(_batch.STEPS)
+        key = self._stack(path, read_kwargs)
+        outputs = dict(self.entries[key]["results"])
+        described = dict(self.entries[key]["described"])
+        for step in steps:
+            step_parameters = {
+                name: parameters[name] for name in _batch.STEP_PARAMETERS[step]
+            }
+            key = _cache.make_key(key, step, step_parameters)
+            if key not in self.entries:
+                self._put(key, _batch.STEPS[step](outputs, parameters))
+            self.entries.move_to_end(key)
+            entry = self.entries[key]
+            outputs.update(entry["results"])
+            described.update(entry["described"])
+            for name in set(stats) & set(entry["results"]):
+                if name not in entry["stats"]:
+                    entry["stats"][name] = _stats.image_stats(
+                        entry["results"][name]
+                    ).summary()
+                described[f"{name}_stats"] = entry["stats"][name]
+        return described
+
+    def _put(self, key, results):
+        """
+        Copies the arrays of the results into shared memory. The other
+        results, e.g. the positions table, are kept as they are.
+        """
+        entry = {"results": {}, "described": {}, "blocks": [], "stats": {}}
+        for name, value in results.items():
+            described = value
+            if isinstance(value, np.ndarray):
+                block = shared_memory.SharedMemory(
+                    create=True, size=max(value.nbytes, 1)
+                )
+                array = np.ndarray(value.shape, value.dtype, buffer=block.buf)
+                array[...] = value
+                entry["blocks"].append(block)
+                value = array
+                described = SharedArray(
+                    block.name, value.shape, value.dtype.str
+                )
+            entry["results"][name] = value
+            entry["described"][name] = described
+        entry["nbytes"] = sum(block.size for block in entry["blocks"])
+        self.entries[key] = entry
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes:
+            self._free(self.entries.popitem(last=False)[1])
+
+    @staticmethod
+    def _free(entry):
+        entry["results"].clear()
+        for block in entry["blocks"]:
+            # Blocks still used by a job are freed with the process
+            with contextlib.suppress(BufferError):
+                block.close()
+            block.unlink()
+
+    def clear(self):
+        while self.entries:
+            self._free(self.entries.popitem()[1])
+
+
+def serve(address_file=None, max_bytes=DEFAULT_MAX_BYTES, ready=None):
+    """
+    Runs the worker until a client sends "shutdown".
+
+    The worker listens on a free port of the local host. The port and
+    a random key authenticating the clients are written to the address
+    file, which only the user can read, and removed when the worker
+    stops. The requests are handled one after the other in the calling
+    thread, as the numba kernels require.
+
+    Parameters
+    ----------
+    address_file : str or pathlib.Path
+        Defaults to `default_address_file`.
+    max_bytes : int
+        Memory of the stacks and outputs kept by the worker.
+    ready : callable
+        Called with the address once the worker accepts requests.
+    """
+    address_file = pathlib.Path(address_file or default_address_file())
+    address_file.parent.mkdir(parents=True, exist_ok=True)
+    authkey = secrets.token_bytes(32)
+    worker = Worker(max_bytes)
+    with connection.Listener(("127.0.0.1", 0), authkey=authkey) as listener:
+        host, port = listener.address
+        content = json.dumps(
+            {
+                "host": host,
+                "port": port,
+                "authkey": authkey.hex(),
+                "pid": os.getpid(),
+            }
+        )
+        fd = os.open(
+            address_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600
+        )
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        if ready is not None:
+            ready(listener.address)
+        try:
+            running = True
+            while running:
+                try:
+                    conn = listener.accept()
+                except connection.AuthenticationError:
+                    continue
+                with conn:
+                    try:
+                        request = conn.recv()
+                    except EOFError:
+                        continue
+                    running = request[0] != "shutdown"
+                    try:
+                        reply = (
+                            "ok",
+                            worker.handle(*request) if running else None,
+                        )
+                    except Exception as error:  # noqa: BLE001
+                        reply = ("error", error)
+                    try:
+                        conn.send(reply)
+                    except (OSError, EOFError):
+                        # The client is gone
+                        pass
+                    except Exception as error:  # noqa: BLE001
+                        # Results or errors that cannot be pickled
+                        conn.send(("error", RuntimeError(repr(error))))
+        finally:
+            worker.clear()
+            # Another worker may have been started in the meantime
+            if address_file.exists() and address_file.read_text() == content:
+                address_file.unlink()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Local worker keeping stacks and step results in shared memory."
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=int,
+        default=DEFAULT_MAX_BYTES // 2**20,
+        help="Memory of the data kept by the worker in MB.",
+    )
+    parser.add_argument(
+        "--address-file",
+        help=f"File for the address of the worker, {default_address_file()} by default.",
+    )
+    args = parser.parse_args(argv)
+    address_file = args.address_file or default_address_file()
+    with contextlib.suppress(KeyboardInterrupt):
+        serve(
+            address_file,
+            args.max_memory * 2**20,
+            ready=lambda address: print(
+                f"Worker listening on {address[0]}:{address[1]}, address in {address_file}."
+            ),
+        )
+
+
+if __name__ == "__main__":
+    # The replies must refer to the classes of the package module, not
+    # to the ones of __main__, to be unpickled by the clients
+    from napari_melt_pool_tracker import _worker
+
+    _worker.main()